@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+"""
+backends.py
+-----------
+Model backends used by llm_client.configure_model.
+
+- "gemini" (default): google.generativeai.GenerativeModel.
+- "mock": MockGenerativeModel, a deterministic local stand-in that needs no API
+  key. It simulates latency, output length, truncation at max_output_tokens,
+  streaming and quota errors, and answers JSON-only judge prompts with JSON,
+  so every stage can run end to end offline (see benchmark.py).
+
+Select with DAPO_BACKEND=mock. Mock behaviour is configured with
+DAPO_MOCK_LATENCY, DAPO_MOCK_OUTPUT_TOKENS, DAPO_MOCK_ERROR_RATE and DAPO_MOCK_SEED.
+"""
+
+import os
+import re
+import json
+import time
+import random
+import hashlib
+import threading
+
+BACKENDS = ["gemini", "mock"]
+DEFAULT_BACKEND = os.getenv("DAPO_BACKEND", "gemini")
+
+# Section headings the mock puts into its Requirements Analysis responses
+MOCK_SECTIONS = [
+    "Introduction",
+    "Data Sources",
+    "Functional Requirements",
+    "Non-Functional Requirements",
+    "Key Processing Components",
+    "User Interactions",
+    "Recommendation Logic",
+]
+
+
+class MockQuotaError(Exception):
+    """Simulated 429 quota error (retryable by llm_client)."""
+
+    # Same attribute as google.api_core.exceptions.ResourceExhausted
+    code = 429
+
+    def __init__(self):
+        super().__init__("429 Resource has been exhausted (mock backend)")
+
+
+class _FinishReason:
+    def __init__(self, name):
+        self.name = name
+
+
+class _Candidate:
+    def __init__(self, finish_reason):
+        self.finish_reason = _FinishReason(finish_reason)
+
+
+class _UsageMetadata:
+    def __init__(self, prompt_token_count, candidates_token_count):
+        self.prompt_token_count = prompt_token_count
+        self.candidates_token_count = candidates_token_count
+        self.total_token_count = prompt_token_count + candidates_token_count
+
+
+class MockResponse:
+    """
+    Mimics the parts of GenerateContentResponse the stages use.
+    """
+
+    def __init__(self, text, prompt_tokens, output_tokens, finish_reason="STOP"):
+        self.text = text
+        self.parts = [text] if text else []
+        self.candidates = [_Candidate(finish_reason)]
+        self.usage_metadata = _UsageMetadata(prompt_tokens, output_tokens)
+
+
+class MockStreamResponse:
+    """
+    Iterable of MockResponse chunks; usage_metadata is available after iteration.
+    """
+
+    def __init__(self, response, chunk_tokens, seconds_per_token):
+        self._response = response
+        self._chunk_tokens = chunk_tokens
+        self._seconds_per_token = seconds_per_token
+        self.candidates = response.candidates
+        self.usage_metadata = response.usage_metadata
+
+    def __iter__(self):
+        words = self._response.text.split(" ")
+        step = max(1, self._chunk_tokens)
+        for start in range(0, len(words), step):
+            piece = " ".join(words[start:start + step]) + (" " if start + step < len(words) else "")
+            time.sleep(self._seconds_per_token * step)
+            yield MockResponse(piece, 0, 0)
+
+
+class _CountTokensResponse:
+    def __init__(self, total_tokens):
+        self.total_tokens = total_tokens
+
+
+class MockGenerativeModel:
+    """
+    Deterministic stand-in for genai.GenerativeModel. The response text depends
+    only on the prompt and generation_config; errors are drawn from a seeded RNG.
+    """
+
+    def __init__(self, model_name, latency_seconds=None, output_tokens=None, error_rate=None, seed=None,
+                 seconds_per_token=0.0):
+        self.model_name = f"models/{model_name}"
+        self.latency_seconds = float(os.getenv("DAPO_MOCK_LATENCY", "0.05")) if latency_seconds is None else latency_seconds
+        self.output_tokens = int(os.getenv("DAPO_MOCK_OUTPUT_TOKENS", "600")) if output_tokens is None else output_tokens
+        self.error_rate = float(os.getenv("DAPO_MOCK_ERROR_RATE", "0.0")) if error_rate is None else error_rate
+        self.seconds_per_token = seconds_per_token
+        self._rng = random.Random(int(os.getenv("DAPO_MOCK_SEED", "0")) if seed is None else seed)
+        self._lock = threading.Lock()
+        self.calls = 0
+
+    def count_tokens(self, contents):
+        return _CountTokensResponse(_estimate_tokens(_as_text(contents)))
+
+    def generate_content(self, contents, generation_config=None, stream=False, **kwargs):
+        prompt_text = _as_text(contents)
+        generation_config = dict(generation_config or {})
+        with self._lock:
+            self.calls += 1
+            failed = self._rng.random() < self.error_rate
+        if failed:
+            time.sleep(self.latency_seconds / 2)
+            raise MockQuotaError()
+
+        response = self._respond(prompt_text, generation_config)
+        if stream:
+            time.sleep(self.latency_seconds / 2)
+            return MockStreamResponse(response, chunk_tokens=20, seconds_per_token=self.seconds_per_token)
+        time.sleep(self.latency_seconds + self.seconds_per_token * response.usage_metadata.candidates_token_count)
+        return response
+
+    def _respond(self, prompt_text, generation_config):
+        digest = hashlib.sha256(
+            (prompt_text + json.dumps(generation_config, sort_keys=True)).encode("utf-8")
+        ).digest()
+        prompt_tokens = _estimate_tokens(prompt_text)
+
+        json_reply = _json_reply(prompt_text, digest)
+        if json_reply is not None:
+            return MockResponse(json_reply, prompt_tokens, _estimate_tokens(json_reply))
+
+        # Vary the length per prompt/config between 50% and 150% of the configured size
+        wanted = int(self.output_tokens * (0.5 + digest[0] / 255))
+        limit = generation_config.get("max_output_tokens", 8192)
+        text = _requirements_text(digest, wanted)
+        finish_reason = "STOP"
+        if wanted > limit:
+            text = " ".join(text.split(" ")[:limit])
+            finish_reason = "MAX_TOKENS"
+        return MockResponse(text, prompt_tokens, min(wanted, limit), finish_reason)
+
+
+def _as_text(contents):
+    if isinstance(contents, str):
+        return contents
+    if isinstance(contents, (list, tuple)):
+        return "\n".join(_as_text(item) for item in contents)
+    return str(contents)
+
+
+def _estimate_tokens(text):
+    return max(1, len(text) // 4)
+
+
+def _json_reply(prompt_text, digest):
+    """
+    Answers prompts that ask for "ONLY a JSON object with ... keys" using the
+    key names quoted in that instruction. Keys that look numeric get integers;
+    a pairwise "winner" is 1 or 2 depending on the prompt.
+    """
+    match = re.search(r"ONLY a JSON object[^\n]*", prompt_text)
+    if not match:
+        return None
+    keys = re.findall(r'"([a-z_]+)"', match.group())
+    reply = {}
+    for key in keys:
+        if key == "winner":
+            reply[key] = 1 + digest[2] % 2
+        elif key.endswith(("row", "index", "_id")):
+            reply[key] = 0
+        elif key.startswith("score") or key.endswith("score"):
+            reply[key] = 5 + digest[1] % 5
+        else:
+            reply[key] = f"Mock {key.replace('_', ' ')}: structured, complete and clear Requirements Analysis."
+    return json.dumps(reply)
+
+
+def _requirements_text(digest, tokens):
+    """
+    Builds a Markdown Requirements Analysis of roughly `tokens` words. The set of
+    sections covered depends on the digest so responses differ between cells.
+    """
+    sections = [name for i, name in enumerate(MOCK_SECTIONS) if digest[2 + i] % 4 or i < 2]
+    words_per_section = max(5, tokens // max(1, len(sections)))
+    filler = ("The system shall ingest SEC 10-K filings compute financial ratios score MD&A sentiment and "
+              "recommend Buy Hold or Sell with an explanation for every recommendation").split(" ")
+    lines = ["## Requirement Analysis: Stock Recommendation System"]
+    for number, name in enumerate(sections, start=1):
+        body = " ".join(filler[(number + i) % len(filler)] for i in range(words_per_section))
+        lines.append(f"**{number}. {name}**\n* {body}.")
+    return "\n\n".join(lines)
+
+
+def create_model(model_name, backend=None):
+    """
+    Returns a model object for the selected backend.
+    """
+    backend = backend or DEFAULT_BACKEND
+    if backend == "mock":
+        return MockGenerativeModel(model_name)
+    if backend == "gemini":
+        import google.generativeai as genai
+
+        api_key = os.getenv("GEMINI_API_KEY")
+        if not api_key:
+            raise ValueError("❌ ERROR: GEMINI_API_KEY not set.")
+        genai.configure(api_key=api_key)
+        return genai.GenerativeModel(model_name)
+    raise ValueError(f"❌ ERROR: Unknown backend '{backend}'. Choose from {', '.join(BACKENDS)}.")
@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+"""
+batch_prediction.py
+-------------------
+Runs generator.py sweeps as one batch prediction job instead of online calls
+(generator.py --batch-prediction vertex|local).
+
+The grid is written as JSONL in the Vertex AI Gemini batch format, one line per
+draw:
+    {"request": {"contents": [...], "generationConfig": {...}}}
+The job is submitted, polled until it ends, and every output line
+({"request": ..., "response": {...}, "status": ...}) is matched back to its
+draw by the request it echoes.
+
+- "vertex": vertexai.batch_prediction.BatchPredictionJob with the input
+  uploaded to a Cloud Storage prefix (--batch-gcs-uri / DAPO_BATCH_GCS_URI).
+- "local":  a file-based stand-in under artifacts/batch_jobs/<job_id>/ that
+  answers the requests with the configured model (e.g. DAPO_BACKEND=mock) in
+  a background thread and writes predictions.jsonl in the same format.
+
+Batch jobs trade latency for throughput and price (BATCH_COST_FACTOR).
+"""
+
+import os
+import json
+import time
+import uuid
+import threading
+
+BATCH_BACKENDS = ["off", "vertex", "local"]
+DEFAULT_GCS_URI = os.getenv("DAPO_BATCH_GCS_URI", "")
+DEFAULT_LOCAL_ROOT = os.path.join("artifacts", "batch_jobs")
+DEFAULT_POLL_SECONDS = 30.0
+
+# Vertex batch jobs are expected to finish within a day; stop polling a job stuck for longer
+DEFAULT_TIMEOUT_SECONDS = 24 * 60 * 60.0
+
+# The local stand-in finishes as fast as the model answers, so it is polled almost immediately
+LOCAL_POLL_SECONDS = 0.05
+
+# Batch predictions are billed at half the online price
+BATCH_COST_FACTOR = 0.5
+
+STATE_RUNNING = "RUNNING"
+STATE_SUCCEEDED = "SUCCEEDED"
+STATE_FAILED = "FAILED"
+
+
+class BatchJobError(RuntimeError):
+    """A batch prediction job failed or did not finish in time."""
+
+
+def build_request(prompt_text, temperature, max_tokens):
+    return {
+        "contents": [{"role": "user", "parts": [{"text": prompt_text}]}],
+        "generationConfig": {"temperature": temperature, "maxOutputTokens": max_tokens},
+    }
+
+
+def request_key(request):
+    return json.dumps(request, sort_keys=True, ensure_ascii=False)
+
+
+def write_requests(path, requests):
+    with open(path, "w", encoding="utf-8") as f:
+        for request in requests:
+            f.write(json.dumps({"request": request}, ensure_ascii=False) + "\n")
+
+
+def parse_prediction(line):
+    """
+    Returns (request, text, input_tokens, output_tokens, finish_reason, error)
+    for one output line.
+    """
+    response = line.get("response") or {}
+    candidates = response.get("candidates") or []
+    parts = (candidates[0].get("content") or {}).get("parts", []) if candidates else []
+    usage = response.get("usageMetadata") or {}
+    error = line.get("status") or ("no candidates" if not candidates else "")
+    return (
+        line.get("request"),
+        "".join(part.get("text", "") for part in parts).strip(),
+        usage.get("promptTokenCount", 0),
+        usage.get("candidatesTokenCount", 0),
+        candidates[0].get("finishReason", "") if candidates else "",
+        error,
+    )
+
+
+class LocalBatchClient:
+    """
+    File-based stand-in for the batch prediction service. submit() copies the
+    input into a job directory and answers it in a background thread with
+    `model.generate_content`; state and output are read from that directory.
+    """
+
+    poll_seconds = LOCAL_POLL_SECONDS
+
+    def __init__(self, model, root=DEFAULT_LOCAL_ROOT):
+        self.model = model
+        self.root = root
+
+    def submit(self, input_path):
+        job_id = f"local-{uuid.uuid4().hex[:12]}"
+        job_dir = os.path.join(self.root, job_id)
+        os.makedirs(job_dir)
+        with open(input_path, "r", encoding="utf-8") as src, \
+                open(os.path.join(job_dir, "input.jsonl"), "w", encoding="utf-8") as dst:
+            dst.write(src.read())
+        self._write_state(job_dir, STATE_RUNNING)
+        threading.Thread(target=self._run, args=(job_dir,), daemon=True).start()
+        return job_id
+
+    def state(self, job_id):
+        with open(os.path.join(self.root, job_id, "state.json"), "r") as f:
+            return json.load(f)["state"]
+
+    def output_lines(self, job_id):
+        with open(os.path.join(self.root, job_id, "predictions.jsonl"), "r", encoding="utf-8") as f:
+            return [json.loads(line) for line in f if line.strip()]
+
+    def _write_state(self, job_dir, state, error=""):
+        with open(os.path.join(job_dir, "state.json"), "w") as f:
+            json.dump({"state": state, "error": error, "updated": time.time()}, f)
+
+    def _run(self, job_dir):
+        from metrics import usage_from_response
+
+        try:
+            with open(os.path.join(job_dir, "input.jsonl"), "r", encoding="utf-8") as src, \
+                    open(os.path.join(job_dir, "predictions.jsonl"), "w", encoding="utf-8") as dst:
+                for line in src:
+                    if not line.strip():
+                        continue
+                    request = json.loads(line)["request"]
+                    dst.write(json.dumps(self._predict(request, usage_from_response), ensure_ascii=False) + "\n")
+            self._write_state(job_dir, STATE_SUCCEEDED)
+        except Exception as e:
+            self._write_state(job_dir, STATE_FAILED, str(e))
+
+    def _predict(self, request, usage_from_response):
+        config = request["generationConfig"]
+        prompt_text = "".join(part["text"] for part in request["contents"][0]["parts"])
+        try:
+            response = self.model.generate_content(prompt_text, generation_config={
+                "temperature": config["temperature"], "max_output_tokens": config["maxOutputTokens"]})
+        except Exception as e:
+            return {"request": request, "response": None, "status": str(e)}
+        input_tokens, output_tokens, finish_reason = usage_from_response(response)
+        return {
+            "request": request,
+            "response": {
+                "candidates": [{"content": {"role": "model", "parts": [{"text": response.text}]},
+                                "finishReason": finish_reason}],
+                "usageMetadata": {"promptTokenCount": input_tokens, "candidatesTokenCount": output_tokens},
+            },
+            "status": "",
+        }
+
+
+class VertexBatchClient:
+    """
+    Vertex AI batch prediction for Gemini models. Input and output live under
+    the Cloud Storage prefix `gcs_uri` (gs://bucket/path).
+    """
+
+    poll_seconds = DEFAULT_POLL_SECONDS
+
+    def __init__(self, model_name, gcs_uri=DEFAULT_GCS_URI):
+        if not gcs_uri.startswith("gs://"):
+            raise ValueError("❌ ERROR: Vertex batch prediction needs --batch-gcs-uri (or DAPO_BATCH_GCS_URI) "
+                             "set to a gs:// prefix.")
+        self.model_name = model_name.split("/")[-1]
+        self.gcs_uri = gcs_uri.rstrip("/")
+        self._jobs = {}
+
+    def submit(self, input_path):
+        import vertexai
+        from vertexai.batch_prediction import BatchPredictionJob
+
+        vertexai.init(project=os.getenv("GOOGLE_CLOUD_PROJECT"), location=os.getenv("GOOGLE_CLOUD_LOCATION", "us-central1"))
+        run_prefix = f"{self.gcs_uri}/dapo-{uuid.uuid4().hex[:12]}"
+        input_uri = f"{run_prefix}/input.jsonl"
+        self._upload(input_path, input_uri)
+        job = BatchPredictionJob.submit(source_model=self.model_name, input_dataset=input_uri,
+                                        output_uri_prefix=f"{run_prefix}/output")
+        self._jobs[job.resource_name] = job
+        return job.resource_name
+
+    def state(self, job_id):
+        job = self._jobs[job_id]
+        job.refresh()
+        if not job.has_ended:
+            return STATE_RUNNING
+        return STATE_SUCCEEDED if job.has_succeeded else STATE_FAILED
+
+    def output_lines(self, job_id):
+        from google.cloud import storage
+
+        bucket_name, _, prefix = self._jobs[job_id].output_location[len("gs://"):].partition("/")
+        lines = []
+        for blob in storage.Client().list_blobs(bucket_name, prefix=prefix):
+            if blob.name.endswith(".jsonl"):
+                lines.extend(json.loads(line) for line in blob.download_as_text().splitlines() if line.strip())
+        return lines
+
+    def _upload(self, path, uri):
+        from google.cloud import storage
+
+        bucket_name, _, blob_name = uri[len("gs://"):].partition("/")
+        storage.Client().bucket(bucket_name).blob(blob_name).upload_from_filename(path)
+
+
+def make_client(kind, model, model_name, gcs_uri=DEFAULT_GCS_URI):
+    if kind == "local":
+        return LocalBatchClient(model)
+    if kind == "vertex":
+        return VertexBatchClient(model_name, gcs_uri)
+    raise ValueError(f"❌ ERROR: Unknown batch backend '{kind}'. Choose from vertex, local.")
+
+
+def run_batch_job(client, jobs, work_dir, poll_seconds=None, timeout_seconds=DEFAULT_TIMEOUT_SECONDS):
+    """
+    Submits generator jobs (prompt_type, prompt_text, temp, max_tok, sample) as
+    one batch, waits for it and returns (job, prediction) pairs in job order,
+    where prediction is the parse_prediction() tuple or None if the job had no
+    output for that draw. The job state is checked every `poll_seconds`
+    (default: the client's own interval); BatchJobError is raised when the job
+    is still running after `timeout_seconds`.
+    """
+    poll_seconds = client.poll_seconds if poll_seconds is None else poll_seconds
+    requests = [build_request(job[1], job[2], job[3]) for job in jobs]
+    os.makedirs(work_dir, exist_ok=True)
+    input_path = os.path.join(work_dir, "batch_input.jsonl")
+    write_requests(input_path, requests)
+
+    job_id = client.submit(input_path)
+    print(f"📤 Submitted batch prediction job {job_id} with {len(requests)} requests")
+    start = time.monotonic()
+    while True:
+        state = client.state(job_id)
+        if state != STATE_RUNNING:
+            break
+        if timeout_seconds is not None and time.monotonic() - start > timeout_seconds:
+            raise BatchJobError(f"❌ ERROR: Batch job {job_id} did not finish within {timeout_seconds}s.")
+        time.sleep(poll_seconds)
+    if state == STATE_FAILED:
+        raise BatchJobError(f"❌ ERROR: Batch job {job_id} failed.")
+    print(f"📥 Batch job {job_id} finished after {time.monotonic() - start:.1f}s")
+
+    # Identical requests (several samples of one cell) are matched in order
+    predictions = {}
+    for line in client.output_lines(job_id):
+        prediction = parse_prediction(line)
+        predictions.setdefault(request_key(prediction[0]), []).append(prediction)
+    return [(job, (predictions.get(request_key(request)) or [None]).pop(0)) for job, request in zip(jobs, requests)]
@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""
+benchmark.py
+------------
+Offline throughput benchmark for the DAPO pipeline.
+
+Runs generator.py -> judge.py -> executioner.py -> jury.py end to end against
+the mock backend (backends.MockGenerativeModel) for several grid sizes and
+reports wall time per stage, LLM calls/sec and peak memory. Each run happens in
+a scratch directory, with the response cache and Firestore disabled, so the
+numbers measure the pipeline's own overhead (CSV/Parquet I/O, JSON
+serialization, prompt building, subprocess startup) plus the simulated latency.
+
+Usage:
+  python benchmark.py                          # 36, 360 and 3600 cells, in-process
+  python benchmark.py --sizes 36 --mode subprocess --latency 0.2
+"""
+
+import os
+import sys
+import time
+import math
+import shutil
+import argparse
+import tempfile
+import resource
+import subprocess
+import tracemalloc
+import importlib
+import contextlib
+import pandas as pd
+
+STAGE_SCRIPTS = ["generator.py", "judge.py", "executioner.py", "jury.py"]
+DEFAULT_SIZES = [36, 360, 3600]
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def grid_axes(cells, prompt_count):
+    """
+    Splits a target cell count into temperature and max_tokens values so that
+    prompt_count × temperatures × max_tokens == cells.
+    """
+    per_prompt = cells // prompt_count
+    if per_prompt * prompt_count != cells:
+        raise ValueError(f"❌ ERROR: Grid size {cells} is not a multiple of {prompt_count} prompt types.")
+    temperature_count = max(d for d in range(1, int(math.isqrt(per_prompt)) + 1) if per_prompt % d == 0)
+    max_token_count = per_prompt // temperature_count
+    temperatures = [round(0.1 + 0.8 * i / max(1, temperature_count - 1), 4) for i in range(temperature_count)]
+    max_tokens = [512 + 16 * i for i in range(max_token_count)]
+    return temperatures, max_tokens
+
+
+def stage_argv(script, temperatures, max_tokens, concurrency):
+    if script == "generator.py":
+        return ["--temperatures", *map(str, temperatures), "--max-tokens", *map(str, max_tokens),
+                "--firestore", "none", "--no-cache", "--concurrency", str(concurrency)]
+    if script == "judge.py":
+        return ["--concurrency", str(concurrency)]
+    return []
+
+
+def run_inprocess(argv_by_stage, rpm, tpm):
+    """
+    Runs every stage's main() in this process with one shared mock model.
+    Returns per-stage seconds and the tracemalloc peak in MB.
+    """
+    import llm_client
+    import metrics
+    import response_cache
+
+    response_cache.configure(enabled=False)
+    llm_client._rate_limiter = llm_client.RateLimiter(rpm, tpm)
+    model = llm_client.configure_model()
+
+    timings = {}
+    df = None
+    tracemalloc.start()
+    for script, argv in argv_by_stage:
+        module = importlib.import_module(os.path.splitext(script)[0])
+        start = time.perf_counter()
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            df = module.main(argv, model=model, df=df)
+        timings[script] = time.perf_counter() - start
+    peak_mb = tracemalloc.get_traced_memory()[1] / 1024 / 1024
+    tracemalloc.stop()
+    return timings, peak_mb, len(metrics.read_log())
+
+
+def run_subprocesses(argv_by_stage, rpm, tpm):
+    """
+    Runs every stage as a fresh Python process (like pipeline.py --mode subprocess).
+    Returns per-stage seconds and the largest child RSS in MB.
+    """
+    import metrics
+
+    env = dict(os.environ, DAPO_BACKEND="mock", DAPO_CACHE="0", GEMINI_RPM=str(rpm), GEMINI_TPM=str(tpm),
+               PYTHONPATH=os.pathsep.join(filter(None, [REPO_DIR, os.environ.get("PYTHONPATH")])))
+    timings = {}
+    for script, argv in argv_by_stage:
+        start = time.perf_counter()
+        result = subprocess.run([sys.executable, os.path.join(REPO_DIR, script), *argv],
+                                env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+        timings[script] = time.perf_counter() - start
+        if result.returncode != 0:
+            raise RuntimeError(f"❌ ERROR: {script} failed:\n{result.stderr[-2000:]}")
+    # ru_maxrss is reported in KB on Linux
+    peak_mb = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+    return timings, peak_mb, len(metrics.read_log())
+
+
+def run_benchmark(cells, args):
+    import generator
+    import metrics
+
+    temperatures, max_tokens = grid_axes(cells, len(generator.prompt_types))
+    argv_by_stage = [(script, stage_argv(script, temperatures, max_tokens, args.concurrency))
+                     for script in STAGE_SCRIPTS]
+
+    workdir = tempfile.mkdtemp(prefix=f"dapo-bench-{cells}-")
+    previous_dir = os.getcwd()
+    os.chdir(workdir)
+    os.makedirs("artifacts")
+    metrics.reset_log()
+    try:
+        start = time.perf_counter()
+        if args.mode == "inprocess":
+            timings, peak_mb, calls = run_inprocess(argv_by_stage, args.rpm, args.tpm)
+        else:
+            timings, peak_mb, calls = run_subprocesses(argv_by_stage, args.rpm, args.tpm)
+        wall = time.perf_counter() - start
+    finally:
+        os.chdir(previous_dir)
+        if not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    row = {"Cells": cells, "Mode": args.mode, "Wall (s)": round(wall, 3), "LLM Calls": calls,
+           "Calls/sec": round(calls / wall, 2) if wall else 0.0, "Peak Memory (MB)": round(peak_mb, 1)}
+    for script, seconds in timings.items():
+        row[f"{script} (s)"] = round(seconds, 3)
+    return row
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the DAPO pipeline against the local mock backend.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES,
+                        help="Grid sizes (cells) to benchmark (default: %(default)s).")
+    parser.add_argument("--mode", choices=["inprocess", "subprocess"], default="inprocess",
+                        help="Run stages in this process or as fresh processes (default: %(default)s).")
+    parser.add_argument("--latency", type=float, default=0.01,
+                        help="Simulated seconds per mock call (default: %(default)s).")
+    parser.add_argument("--output-tokens", type=int, default=600,
+                        help="Mean simulated output tokens per response (default: %(default)s).")
+    parser.add_argument("--error-rate", type=float, default=0.0,
+                        help="Probability that a mock call fails with a 429 (default: %(default)s).")
+    parser.add_argument("--concurrency", type=int, default=16,
+                        help="Concurrency passed to generator.py and judge.py (default: %(default)s).")
+    parser.add_argument("--rpm", type=int, default=10 ** 7, help="Rate limiter requests per minute.")
+    parser.add_argument("--tpm", type=int, default=10 ** 12, help="Rate limiter tokens per minute.")
+    parser.add_argument("--output", default=os.path.join("artifacts", "benchmark_results.csv"),
+                        help="CSV file the results table is written to (default: %(default)s).")
+    parser.add_argument("--keep", action="store_true", help="Keep the scratch directories.")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    os.environ.update({
+        "DAPO_BACKEND": "mock",
+        "DAPO_MOCK_LATENCY": str(args.latency),
+        "DAPO_MOCK_OUTPUT_TOKENS": str(args.output_tokens),
+        "DAPO_MOCK_ERROR_RATE": str(args.error_rate),
+        "DAPO_CACHE": "0",
+    })
+    if REPO_DIR not in sys.path:
+        sys.path.insert(0, REPO_DIR)
+    import backends
+    backends.DEFAULT_BACKEND = "mock"
+    output_path = os.path.abspath(args.output)
+
+    rows = []
+    for cells in args.sizes:
+        print(f"🏁 Benchmarking {cells} cells ({args.mode}, mock latency {args.latency}s)...")
+        rows.append(run_benchmark(cells, args))
+        print(f"✅ {cells} cells: {rows[-1]['Wall (s)']:.2f}s, {rows[-1]['Calls/sec']:.1f} calls/sec, "
+              f"peak {rows[-1]['Peak Memory (MB)']:.1f} MB")
+
+    df = pd.DataFrame(rows)
+    print("\n📊 Benchmark results:")
+    print(df.to_string(index=False))
+    df.to_csv(output_path, index=False)
+    print(f"\n✅ Results written to {output_path}")
+    return df
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+"""
+context_cache.py
+----------------
+Explicit context caching of the candidate dataset sent by judge.py.
+
+prefix_model(model, prefix) returns a model bound to `prefix`: calling
+generate_content(suffix) on it behaves like generate_content(prefix + suffix),
+but the prefix is uploaded once and then referenced. judge.py caches every
+candidate once, so the map-step batches, the final selection and the
+refinement (and reruns within the TTL) only send their instructions and the
+"Row" numbers they judge. The prefix and the instructions together still count
+against the caller's prompt budget.
+
+- "gemini": google.generativeai caching.CachedContent (with a TTL) and
+  GenerativeModel.from_cached_content. An unexpired cache with the same
+  content is found again by its display name, also from another process.
+  Gemini only caches prefixes of at least MIN_CACHE_TOKENS tokens; smaller
+  datasets are sent inline, and so is everything when the prompt budget is
+  below that minimum.
+- "local":  stand-in used with the mock backend. It sends prefix + suffix to
+  the wrapped model, reports the prefix as cached_content_token_count, and
+  keeps cache entries with their expiry in artifacts/.cache/context_cache.json,
+  so hits, misses and expiry can be exercised offline.
+
+Select with DAPO_CONTEXT_CACHE (auto, gemini, local, off); the TTL defaults to
+DAPO_CONTEXT_CACHE_TTL seconds.
+"""
+
+import os
+import json
+import time
+import hashlib
+import threading
+from llm_client import estimate_tokens
+
+CACHE_KINDS = ["auto", "gemini", "local", "off"]
+DEFAULT_KIND = os.getenv("DAPO_CONTEXT_CACHE", "auto")
+DEFAULT_TTL_SECONDS = int(os.getenv("DAPO_CONTEXT_CACHE_TTL", "900"))
+
+# Smallest prefix Gemini 1.5 accepts for explicit caching
+MIN_CACHE_TOKENS = 32768
+
+# Explicit caching needs a versioned model name
+CACHE_MODEL_VERSIONS = {
+    "gemini-1.5-pro": "gemini-1.5-pro-002",
+    "gemini-1.5-flash": "gemini-1.5-flash-002",
+}
+
+LOCAL_REGISTRY_PATH = os.path.join("artifacts", ".cache", "context_cache.json")
+
+stats = {"created": 0, "reused": 0, "expired": 0, "calls": 0, "cached_tokens": 0}
+_lock = threading.Lock()
+_models = {}
+
+
+def prefix_digest(model_name, prefix):
+    return hashlib.sha256(f"{model_name}\n{prefix}".encode("utf-8")).hexdigest()
+
+
+class LocalCachedModel:
+    """
+    Local stand-in for a model created from cached content.
+    """
+
+    def __init__(self, model, prefix, digest, expires_at):
+        self.model_name = model.model_name
+        self.prefix_digest = digest
+        self.expires_at = expires_at
+        self._model = model
+        self._prefix = prefix
+        self._prefix_tokens = estimate_tokens(prefix)
+
+    def generate_content(self, contents, generation_config=None, **kwargs):
+        response = self._model.generate_content(f"{self._prefix}\n\n{contents}", generation_config=generation_config,
+                                                **kwargs)
+        usage = getattr(response, "usage_metadata", None)
+        if usage is not None:
+            usage.cached_content_token_count = self._prefix_tokens
+        _count_call(self._prefix_tokens)
+        return response
+
+    def count_tokens(self, contents):
+        return self._model.count_tokens(f"{self._prefix}\n\n{contents}")
+
+
+class GeminiCachedModel:
+    """
+    Model created from a Gemini CachedContent holding the prefix.
+    """
+
+    def __init__(self, cached_content, digest):
+        import google.generativeai as genai
+
+        self.model_name = cached_content.model
+        self.prefix_digest = digest
+        self.expires_at = cached_content.expire_time.timestamp()
+        self._cached_tokens = getattr(cached_content.usage_metadata, "total_token_count", 0)
+        self._model = genai.GenerativeModel.from_cached_content(cached_content=cached_content)
+
+    def generate_content(self, contents, **kwargs):
+        _count_call(self._cached_tokens)
+        return self._model.generate_content(contents, **kwargs)
+
+    def count_tokens(self, contents):
+        return self._model.count_tokens(contents)
+
+
+def _count_call(cached_tokens):
+    with _lock:
+        stats["calls"] += 1
+        stats["cached_tokens"] += cached_tokens
+
+
+def resolve_kind(model, kind=None):
+    kind = kind or DEFAULT_KIND
+    if kind == "auto":
+        from backends import MockGenerativeModel
+        return "local" if isinstance(model, MockGenerativeModel) else "gemini"
+    return kind
+
+
+def prefix_model(model, prefix, kind=None, ttl_seconds=DEFAULT_TTL_SECONDS, prompt_budget=None):
+    """
+    Returns a model bound to the cached `prefix`, or None when caching is off or
+    not possible (the caller then sends the prefix inline). `prompt_budget` is
+    the caller's limit for prefix and prompt together.
+    """
+    kind = resolve_kind(model, kind)
+    if kind == "off":
+        return None
+    if kind == "gemini" and prompt_budget is not None and prompt_budget < MIN_CACHE_TOKENS:
+        print(f"💾 Context cache: Gemini needs at least {MIN_CACHE_TOKENS} cached tokens, more than the prompt "
+              f"budget of {prompt_budget}; sending the dataset inline (raise --prompt-budget to cache it)")
+        return None
+    if kind == "gemini" and estimate_tokens(prefix) < MIN_CACHE_TOKENS:
+        print(f"💾 Context cache: dataset below {MIN_CACHE_TOKENS} tokens, sending it inline")
+        return None
+
+    name = getattr(model, "model_name", "").split("/")[-1]
+    digest = prefix_digest(name, prefix)
+    with _lock:
+        cached = _models.get(digest)
+        if cached is not None and cached.expires_at > time.time() + 1:
+            stats["reused"] += 1
+            return cached
+    try:
+        if kind == "local":
+            cached = _local_model(model, prefix, digest, ttl_seconds)
+        else:
+            cached = _gemini_model(name, prefix, digest, ttl_seconds)
+    except Exception as e:
+        print(f"⚠️ WARNING: Context cache unavailable ({e}); sending the dataset inline.")
+        return None
+    with _lock:
+        _models[digest] = cached
+    return cached
+
+
+def _local_model(model, prefix, digest, ttl_seconds, registry_path=LOCAL_REGISTRY_PATH):
+    with _lock:
+        registry = {}
+        if os.path.isfile(registry_path):
+            with open(registry_path, "r") as f:
+                registry = json.load(f)
+        now = time.time()
+        expires_at = registry.get(digest, 0)
+        if expires_at > now:
+            stats["reused"] += 1
+        else:
+            if expires_at:
+                stats["expired"] += 1
+            stats["created"] += 1
+            expires_at = now + ttl_seconds
+            registry = {key: value for key, value in registry.items() if value > now}
+            registry[digest] = expires_at
+            os.makedirs(os.path.dirname(registry_path), exist_ok=True)
+            with open(registry_path, "w") as f:
+                json.dump(registry, f)
+    return LocalCachedModel(model, prefix, digest, expires_at)
+
+
+def _gemini_model(name, prefix, digest, ttl_seconds):
+    import datetime
+    from google.generativeai import caching
+
+    display_name = f"dapo-{digest[:24]}"
+    now = datetime.datetime.now(datetime.timezone.utc)
+    for cached_content in caching.CachedContent.list():
+        if cached_content.display_name == display_name and cached_content.expire_time > now:
+            with _lock:
+                stats["reused"] += 1
+            return GeminiCachedModel(cached_content, digest)
+
+    cached_content = caching.CachedContent.create(
+        model=f"models/{CACHE_MODEL_VERSIONS.get(name, name)}",
+        display_name=display_name,
+        contents=[prefix],
+        ttl=datetime.timedelta(seconds=ttl_seconds),
+    )
+    with _lock:
+        stats["created"] += 1
+    return GeminiCachedModel(cached_content, digest)
+
+
+def print_stats(label="context cache"):
+    if not (stats["created"] or stats["reused"]):
+        return
+    print(f"💾 {label}: {stats['created']} created ({stats['expired']} after expiry), {stats['reused']} reused | "
+          f"{stats['calls']} calls read {stats['cached_tokens']:,} cached input tokens")
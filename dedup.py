@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+dedup.py
+--------
+Local near-duplicate clustering of Response Text (MinHash over word shingles).
+
+Low-temperature cells often return almost the same document. assign_clusters()
+groups responses whose estimated Jaccard similarity of word 5-grams is at least
+`threshold` and adds two columns to the results table:
+  - Cluster:      cluster id (0, 1, ... in order of first appearance)
+  - Cluster Size: number of rows in that cluster
+
+generator.py records the membership with the results; judge.py and jury.py
+send one representative per cluster together with its Cluster Size.
+
+Candidate pairs come from LSH banding of the MinHash signatures, so clustering
+stays close to linear in the number of rows. numpy is imported on first use.
+"""
+
+import re
+import zlib
+import functools
+
+DEFAULT_THRESHOLD = 0.8
+SHINGLE_WORDS = 5
+NUM_PERMUTATIONS = 128
+BANDS = 32
+
+CLUSTER_COLUMNS = ["Cluster", "Cluster Size"]
+
+
+@functools.lru_cache(maxsize=None)
+def _hash_params():
+    """
+    Returns (prime, a, b, empty signature) of the MinHash permutations.
+    """
+    import numpy as np
+
+    # Prime just above 2**32 so (a * h + b) stays within uint64
+    prime = np.uint64(4294967311)
+    rng = np.random.default_rng(0)
+    a = rng.integers(1, 2 ** 32, size=NUM_PERMUTATIONS, dtype=np.uint64)
+    b = rng.integers(0, 2 ** 32, size=NUM_PERMUTATIONS, dtype=np.uint64)
+    empty = np.full(NUM_PERMUTATIONS, np.iinfo(np.uint64).max, dtype=np.uint64)
+    return prime, a, b, empty
+
+
+def shingles(text, size=SHINGLE_WORDS):
+    """
+    Returns the hashed word `size`-grams of `text` as a uint64 array.
+    """
+    import numpy as np
+
+    words = re.findall(r"\w+", str(text).lower())
+    if not words:
+        return np.empty(0, dtype=np.uint64)
+    grams = {" ".join(words[i:i + size]) for i in range(max(1, len(words) - size + 1))}
+    return np.fromiter((zlib.crc32(gram.encode("utf-8")) for gram in grams), dtype=np.uint64, count=len(grams))
+
+
+def minhash(hashes):
+    """
+    MinHash signature (NUM_PERMUTATIONS values) of a shingle hash array.
+    """
+    prime, a, b, empty = _hash_params()
+    if hashes.size == 0:
+        return empty
+    return ((a[:, None] * hashes[None, :] + b[:, None]) % prime).min(axis=1)
+
+
+def _find(parent, i):
+    while parent[i] != i:
+        parent[i] = parent[parent[i]]
+        i = parent[i]
+    return i
+
+
+def cluster_labels(texts, threshold=DEFAULT_THRESHOLD):
+    """
+    Returns one cluster id per text. Empty texts are never merged.
+    """
+    import numpy as np
+
+    texts = list(texts)
+    signatures = np.array([minhash(shingles(text)) for text in texts]).reshape(len(texts), NUM_PERMUTATIONS)
+    empty = (signatures == _hash_params()[3]).all(axis=1)
+    parent = list(range(len(texts)))
+
+    rows_per_band = NUM_PERMUTATIONS // BANDS
+    for band in range(BANDS):
+        buckets = {}
+        chunk = signatures[:, band * rows_per_band:(band + 1) * rows_per_band]
+        for i in np.flatnonzero(~empty):
+            buckets.setdefault(chunk[i].tobytes(), []).append(i)
+        for members in buckets.values():
+            for j in members[1:]:
+                a, b = _find(parent, members[0]), _find(parent, j)
+                if a != b and (signatures[members[0]] == signatures[j]).mean() >= threshold:
+                    parent[b] = a
+
+    roots = [_find(parent, i) for i in range(len(texts))]
+    ids = {}
+    return [ids.setdefault(root, len(ids)) for root in roots]
+
+
+def assign_clusters(df, threshold=DEFAULT_THRESHOLD):
+    """
+    Returns a copy of `df` with Cluster and Cluster Size columns.
+    """
+    clustered = df.copy()
+    clustered["Cluster"] = cluster_labels(clustered["Response Text"].fillna(""), threshold)
+    clustered["Cluster Size"] = clustered.groupby("Cluster")["Cluster"].transform("size")
+    clusters = clustered["Cluster"].nunique()
+    print(f"🧬 Clustering: {len(clustered)} responses in {clusters} near-duplicate clusters "
+          f"(similarity >= {threshold})")
+    return clustered
+
+
+def representatives(df, keep_prompt_types=()):
+    """
+    Keeps the first row of every cluster, plus every row whose Prompt Type is
+    in `keep_prompt_types`.
+    """
+    return df[~df["Cluster"].duplicated(keep="first") | df["Prompt Type"].isin(keep_prompt_types)]
@@ -0,0 +1,300 @@
+#!/usr/bin/env python3
+"""
+events.py
+---------
+Structured event stream shared by every stage.
+
+Stages append one JSON object per line to artifacts/events.jsonl
+(DAPO_EVENTS_PATH), with a timestamp, the stage name and the process id:
+  - stage_start / stage_end   pipeline.py, around every stage (ok, seconds)
+  - call_start / call_end     llm_client, around every Gemini call (ok, cached,
+                              latency, tokens, time spent waiting for the
+                              rate limiter)
+  - call_retry                llm_client, before a retry (attempt, delay, error)
+  - progress                  units done out of a known total (generator draws,
+                              executioner batch projects)
+
+pipeline.py tails the file while the stages run (ProgressMonitor) to show the
+calls in flight, throughput, error rate and ETA, whether the stages run
+in-process or as subprocesses. The file is kept after the run;
+`python events.py` prints where the wall time of each stage went.
+
+DAPO_EVENTS=0 disables the stream.
+"""
+
+import os
+import json
+import time
+import uuid
+import argparse
+import threading
+from collections import deque
+from metrics import current_stage
+
+EVENTS_LOG_PATH = os.getenv("DAPO_EVENTS_PATH", os.path.join("artifacts", "events.jsonl"))
+
+# Seconds of call_end events used for the current throughput
+THROUGHPUT_WINDOW_SECONDS = 30.0
+DEFAULT_PROGRESS_INTERVAL = 2.0
+
+settings = {"enabled": os.getenv("DAPO_EVENTS", "1") != "0"}
+_lock = threading.Lock()
+
+
+def emit(event, path=None, **fields):
+    """
+    Appends one event. Every line is written with a single append, so stages
+    running as separate processes can share the file.
+    """
+    if not settings["enabled"]:
+        return
+    path = path or EVENTS_LOG_PATH
+    record = {"ts": round(time.time(), 4), "stage": fields.pop("stage", None) or current_stage(),
+              "pid": os.getpid(), "event": event, **fields}
+    line = json.dumps(record) + "\n"
+    with _lock:
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(line)
+
+
+def call_started(model_name):
+    """
+    Emits call_start and returns the id that pairs it with its call_end.
+    """
+    call_id = uuid.uuid4().hex[:12]
+    emit("call_start", call_id=call_id, model=model_name)
+    return call_id
+
+
+def call_ended(call_id, record, wait_seconds=0.0):
+    """
+    Emits call_end for a metrics call record.
+    """
+    emit("call_end", call_id=call_id, ok=record["ok"], cached=record["cached"],
+         latency_seconds=record["latency_seconds"], wait_seconds=round(wait_seconds, 4),
+         input_tokens=record["input_tokens"], output_tokens=record["output_tokens"],
+         retries=record["retries"], finish_reason=record["finish_reason"])
+
+
+def progress(done, total, unit="items"):
+    emit("progress", done=done, total=total, unit=unit)
+
+
+def reset_log(path=None):
+    """
+    Starts a fresh event log (called by pipeline.py at the start of a run).
+    """
+    path = path or EVENTS_LOG_PATH
+    if os.path.isfile(path):
+        os.remove(path)
+
+
+def read_log(path=None):
+    path = path or EVENTS_LOG_PATH
+    if not os.path.isfile(path):
+        return []
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+class StageProgress:
+    """
+    Running totals of one stage, folded from its events.
+    """
+
+    def __init__(self):
+        self.started = None
+        self.ended = None
+        self.in_flight = set()
+        self.calls = 0
+        self.cached = 0
+        self.errors = 0
+        self.retries = 0
+        self.done = None
+        self.total = None
+        self.unit = "items"
+        self.first_progress = None
+        self.recent_ends = deque()
+
+    def update(self, event):
+        kind, ts = event["event"], event["ts"]
+        if self.started is None:
+            self.started = ts
+        if kind == "stage_start":
+            self.started, self.ended = ts, None
+        elif kind == "stage_end":
+            self.ended = ts
+        elif kind == "call_start":
+            self.in_flight.add(event["call_id"])
+        elif kind == "call_end":
+            self.in_flight.discard(event["call_id"])
+            self.calls += 1
+            self.cached += bool(event.get("cached"))
+            self.errors += not event.get("ok", True)
+            self.recent_ends.append(ts)
+        elif kind == "call_retry":
+            self.retries += 1
+        elif kind == "progress":
+            if self.first_progress is None or event["done"] == 0:
+                self.first_progress = (ts, event["done"])
+            self.done, self.total, self.unit = event["done"], event["total"], event.get("unit", "items")
+
+    def throughput(self, now):
+        while self.recent_ends and self.recent_ends[0] < now - THROUGHPUT_WINDOW_SECONDS:
+            self.recent_ends.popleft()
+        window = min(THROUGHPUT_WINDOW_SECONDS, max(now - (self.started or now), 1e-6))
+        return len(self.recent_ends) / window
+
+    def eta(self, now):
+        """
+        Seconds left at the progress rate seen so far, or None when unknown.
+        """
+        if self.total is None or self.first_progress is None:
+            return None
+        start, done_at_start = self.first_progress
+        rate = (self.done - done_at_start) / max(now - start, 1e-6)
+        remaining = self.total - self.done
+        return 0.0 if remaining <= 0 else (remaining / rate if rate > 0 else None)
+
+    def render(self, stage, now):
+        parts = []
+        if self.total is not None:
+            parts.append(f"{self.done}/{self.total} {self.unit}")
+        parts.append(f"{len(self.in_flight)} in flight")
+        parts.append(f"{self.calls} calls ({self.cached} cached), {self.throughput(now):.1f} calls/s")
+        error_rate = self.errors / self.calls * 100 if self.calls else 0.0
+        parts.append(f"errors {error_rate:.1f}%")
+        if self.retries:
+            parts.append(f"retries {self.retries}")
+        eta = self.eta(now)
+        if eta is not None:
+            parts.append(f"ETA {eta:.0f}s")
+        return f"📈 {stage}: " + " | ".join(parts)
+
+
+class ProgressMonitor:
+    """
+    Tails the event log in a background thread and prints one progress line per
+    active stage every `interval` seconds. Use as a context manager.
+    """
+
+    def __init__(self, path=None, interval=DEFAULT_PROGRESS_INTERVAL, printer=print):
+        self.path = path or EVENTS_LOG_PATH
+        self.interval = interval
+        self.printer = printer
+        self.stages = {}
+        self._offset = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="progress-monitor", daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+    def poll(self):
+        """
+        Folds the events appended since the last poll. Returns the stages that changed.
+        """
+        if not os.path.isfile(self.path):
+            return set()
+        changed = set()
+        with open(self.path, "r", encoding="utf-8") as f:
+            f.seek(self._offset)
+            while True:
+                line = f.readline()
+                if not line.endswith("\n"):
+                    break  # incomplete line; read it again next time
+                self._offset = f.tell()
+                if not line.strip():
+                    continue
+                event = json.loads(line)
+                self.stages.setdefault(event["stage"], StageProgress()).update(event)
+                changed.add(event["stage"])
+        return changed
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            changed = self.poll()
+            now = time.time()
+            for stage, state in self.stages.items():
+                if stage in changed or (state.ended is None and state.in_flight):
+                    self.printer(state.render(stage, now))
+
+
+def profile(events):
+    """
+    Where each stage's wall time went: {stage: {...}} with wall seconds, time
+    inside calls, rate-limiter and retry waits, average calls in flight,
+    throughput and error rate.
+    """
+    stages = {}
+    for event in events:
+        s = stages.setdefault(event["stage"], {"first": event["ts"], "last": event["ts"], "wall": None, "calls": 0,
+                                               "cached": 0, "errors": 0, "retries": 0, "call_seconds": 0.0,
+                                               "wait_seconds": 0.0, "retry_seconds": 0.0})
+        s["first"] = min(s["first"], event["ts"])
+        s["last"] = max(s["last"], event["ts"])
+        if event["event"] == "stage_end":
+            s["wall"] = event.get("seconds")
+        elif event["event"] == "call_end":
+            s["calls"] += 1
+            s["cached"] += bool(event.get("cached"))
+            s["errors"] += not event.get("ok", True)
+            s["call_seconds"] += event.get("latency_seconds") or 0.0
+            s["wait_seconds"] += event.get("wait_seconds") or 0.0
+        elif event["event"] == "call_retry":
+            s["retries"] += 1
+            s["retry_seconds"] += event.get("delay_seconds") or 0.0
+
+    summary = {}
+    for stage, s in stages.items():
+        wall = s["wall"] if s["wall"] is not None else s["last"] - s["first"]
+        summary[stage] = {
+            "wall_seconds": wall,
+            "calls": s["calls"],
+            "cached": s["cached"],
+            "call_seconds": s["call_seconds"],
+            "wait_seconds": s["wait_seconds"],
+            "retry_seconds": s["retry_seconds"],
+            "mean_in_flight": s["call_seconds"] / wall if wall > 0 else 0.0,
+            "calls_per_second": s["calls"] / wall if wall > 0 else 0.0,
+            "error_rate": s["errors"] / s["calls"] if s["calls"] else 0.0,
+            "retries": s["retries"],
+        }
+    return summary
+
+
+def print_profile(path=None):
+    summary = profile(read_log(path))
+    if not summary:
+        print("⏱️ No events recorded.")
+        return summary
+    print("⏱️ Where the wall time went (from the event log):")
+    for stage, s in summary.items():
+        print(f"   - {stage}: {s['wall_seconds']:.2f}s wall | {s['calls']} calls ({s['cached']} cached), "
+              f"{s['calls_per_second']:.1f} calls/s, {s['mean_in_flight']:.1f} in flight on average "
+              f"| {s['call_seconds']:.2f}s in calls, {s['wait_seconds']:.2f}s rate-limited, "
+              f"{s['retry_seconds']:.2f}s retry backoff | errors {s['error_rate'] * 100:.1f}%")
+    return summary
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Summarize the pipeline event log.")
+    parser.add_argument("path", nargs="?", default=EVENTS_LOG_PATH,
+                        help="Event log (default: %(default)s).")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    print_profile(parse_args(argv).path)
+
+
+if __name__ == "__main__":
+    main()
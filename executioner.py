@@ -5,17 +5,57 @@ executioner.py
 1) Reads artifacts/best_prompt.json to load the 'ultimate_prompt'.
 2) Submits that prompt to Gemini 1.5 Pro to produce a final Requirements Analysis.
 3) Saves the generated RA to artifacts/Requirements_Analysis.md.
-4) Appends the new output (prompt_type="ultimate") to artifacts/experiment_results.csv.
+4) Appends the new output (prompt_type="ultimate") to the results store and
+   artifacts/experiment_results.csv.
+
+--batch applies the prompt to many projects instead (see the README).
 """
 
 import os
+import re
 import time
-import pandas as pd
 import json
+import hashlib
 import traceback
-import google.generativeai as genai
+import argparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from llm_client import generate_detailed, generate_stream, configure_model, estimate_tokens, LLMCallError, print_stats
+from metrics import set_stage, result_columns
+from results_store import ResultsStore, import_legacy_csv, append_csv
+from results_sink import JsonlResultsSink, read_rows, completed_keys
+from experiment_history import RUN_ID_COLUMN, current_run_id, record
+import events
+
+# Title of the single-run Requirements Analysis document
+DEFAULT_TITLE = "ProfitScout Application"
+
+BATCH_DIR = os.path.join("artifacts", "batch")
+DEFAULT_BATCH_CONCURRENCY = 4
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Execute the ultimate prompt from best_prompt.json.")
+    parser.add_argument("--stream", action=argparse.BooleanOptionalAction, default=True,
+                        help="Stream the response into the Markdown file as it is generated (default: on).")
+    parser.add_argument("--batch", metavar="JSONL",
+                        help="Run the ultimate prompt for every project in this JSONL file.")
+    parser.add_argument("--output-dir", default=BATCH_DIR,
+                        help="Where batch Markdown files and results go (default: %(default)s).")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_BATCH_CONCURRENCY,
+                        help="Batch projects in flight (default: %(default)s).")
+    parser.add_argument("--resume", action="store_true",
+                        help="Skip batch projects already in batch_results.jsonl.")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="Render the prompt(s) and exit without calling the model.")
+    return parser.parse_args(argv)
 
-def main():
+def main(argv=None, model=None, df=None):
+    """
+    Executes the ultimate prompt and returns the results table with the new
+    'ultimate' row. In-process callers pass the shared `model` and the
+    in-memory results `df` instead of having them rebuilt from disk.
+    """
+    args = parse_args(argv)
+    set_stage("executioner")
     # Ensure artifacts directory exists
     artifacts_dir = "artifacts"
     if not os.path.exists(artifacts_dir):
@@ -38,43 +78,74 @@ def main():
     
     if not ultimate_prompt:
         raise ValueError("❌ ERROR: 'ultimate_prompt' is missing or empty in best_prompt.json.")
+    run_id = current_run_id()
+    if run_id and best_prompt_data.get("run_id") not in (None, run_id):
+        raise ValueError(f"❌ ERROR: best_prompt.json was selected in run {best_prompt_data['run_id']}, not in the "
+                         f"current run {run_id}. Run judge.py first.")
+
+    if args.dry_run:
+        dry_run(ultimate_prompt, args.batch)
+        return df
 
     # 2) Configure Gemini 1.5 Pro
-    api_key = os.getenv("GEMINI_API_KEY")
-    if not api_key:
-        raise ValueError("❌ ERROR: GEMINI_API_KEY not set.")
-    genai.configure(api_key=api_key)
-    model = genai.GenerativeModel("gemini-1.5-pro")
+    model = model or configure_model()
+
+    if args.batch:
+        run_batch(model, ultimate_prompt, args.batch, args.output_dir, args.concurrency, args.resume, args.stream)
+        print_stats("executioner.py")
+        return df
 
     # 3) Define LLM generation parameters
     final_temperature = 0.3
     final_max_tokens = 2048  # Increased token limit for full analysis
 
     print(f"🚀 Executing the ultimate prompt with temp={final_temperature}, max_tokens={final_max_tokens}...\n")
-    response_text = call_llm(
-        model=model,
-        prompt_text=ultimate_prompt,
-        temperature=final_temperature,
-        max_tokens=final_max_tokens
-    )
-
-    # 4) Save the Requirements Analysis as Markdown
-    save_markdown(markdown_file_path, response_text)
-
-    # 5) Append a new row to experiment_results.csv with 'prompt_type="ultimate"'
-    df = load_or_create_csv(csv_file_path)
+    call_record = {}
+    if args.stream:
+        # 4) Stream the Requirements Analysis into the Markdown file
+        response_text, call_record = call_llm_streaming(
+            model=model,
+            prompt_text=ultimate_prompt,
+            temperature=final_temperature,
+            max_tokens=final_max_tokens,
+            markdown_path=markdown_file_path
+        )
+    else:
+        response_text, call_record = call_llm(
+            model=model,
+            prompt_text=ultimate_prompt,
+            temperature=final_temperature,
+            max_tokens=final_max_tokens
+        )
+
+        # 4) Save the Requirements Analysis as Markdown
+        save_markdown(markdown_file_path, response_text)
+
+    # 5) Append a new row with 'prompt_type="ultimate"' to the store and the CSV export
+    import pandas as pd
+
+    store = ResultsStore()
+    import_legacy_csv(store, csv_file_path)
     new_row = pd.DataFrame([{
         "Prompt Type": "ultimate",
         "Actual Prompt": ultimate_prompt,
         "Temperature": final_temperature,
         "Max Tokens": final_max_tokens,
-        "Response Text": response_text
+        "Response Text": response_text,
+        **metrics_columns(call_record),
+        **({RUN_ID_COLUMN: run_id} if run_id else {})
     }])
 
-    df = pd.concat([df, new_row], ignore_index=True)
-    df.to_csv(csv_file_path, index=False)
+    store.append(new_row)
+    append_csv(csv_file_path, new_row)
+    if run_id:
+        record(lambda history: history.record_event(run_id, "execution", input_text=ultimate_prompt,
+                                                    output_text=response_text))
+    if df is not None:
+        df = pd.concat([df, new_row], ignore_index=True)
 
-    print(f"\n✅ executioner.py: Added 'ultimate' result to {csv_file_path}.\n")
+    print_stats("executioner.py")
+    print(f"\n✅ executioner.py: Added 'ultimate' result to {store.root} and {csv_file_path}.\n")
     print(f"📄 Requirements Analysis saved to: {markdown_file_path}\n")
     print(f"Final Requirements Analysis (first 500 chars):\n{response_text[:500]}...\n")
 
@@ -84,6 +155,19 @@ def main():
     else:
         print(f"❌ ERROR: CSV file missing after writing. Check executioner.py.")
 
+    return df
+
+def dry_run(ultimate_prompt, batch_path=None):
+    """
+    Renders the prompt for the single run or for every batch project and prints
+    their size, so a batch file can be checked before any call is made.
+    """
+    prompts = ([render_prompt(ultimate_prompt, project) for project in read_projects(batch_path)]
+               if batch_path else [ultimate_prompt])
+    tokens = [estimate_tokens(prompt) for prompt in prompts]
+    print(f"🧪 Dry run: {len(prompts)} prompt(s) rendered, ~{sum(tokens):,} input tokens "
+          f"(largest ~{max(tokens):,}); no model calls made.")
+
 def read_best_prompt(filepath):
     """
     Loads best_prompt.json and ensures it contains valid JSON.
@@ -101,23 +185,14 @@ def read_best_prompt(filepath):
     except json.JSONDecodeError:
         raise ValueError("❌ ERROR: Could not parse JSON from best_prompt.json.")
 
-def load_or_create_csv(csv_file_path):
-    """
-    Loads experiment_results.csv if it exists, otherwise creates a new empty DataFrame.
-    """
-    if os.path.isfile(csv_file_path):
-        return pd.read_csv(csv_file_path)
-    else:
-        print(f"⚠️ WARNING: No existing CSV found. Creating a new file at {csv_file_path}.")
-        columns = ["Prompt Type", "Actual Prompt", "Temperature", "Max Tokens", "Response Text"]
-        return pd.DataFrame(columns=columns)
-
 def call_llm(model, prompt_text, temperature, max_tokens):
     """
-    Calls Gemini 1.5 Pro with the final 'ultimate' prompt and returns the RA text.
+    Calls Gemini 1.5 Pro with the final 'ultimate' prompt and returns the RA text
+    together with the call record.
     """
     try:
-        response = model.generate_content(
+        response_text, call_record = generate_detailed(
+            model,
             prompt_text,
             generation_config={
                 "temperature": temperature,
@@ -126,30 +201,204 @@ def call_llm(model, prompt_text, temperature, max_tokens):
         )
 
         # Debugging: Print a sample of the response
-        if response.text:
-            print(f"✅ LLM Response (First 200 chars): {response.text.strip()[:200]}...")
+        if response_text:
+            print(f"✅ LLM Response (First 200 chars): {response_text[:200]}...")
 
-        return response.text.strip() if response.text else "No Response"
+        return response_text or "No Response", call_record
 
-    except Exception as e:
+    except LLMCallError as e:
         print(f"❌ ERROR: LLM call failed: {e}")
         print(traceback.format_exc())  # Print full stack trace
-        return f"Error: {e}"
+        raise
 
-def save_markdown(filepath, content):
+def call_llm_streaming(model, prompt_text, temperature, max_tokens, markdown_path, title=DEFAULT_TITLE, echo=True):
     """
-    Saves the final Requirements Analysis as a Markdown file.
+    Streams the ultimate prompt's response into the Markdown file chunk by chunk
+    (and to stdout when `echo` is set).
+    Returns the full RA text and the call record (latency, TTFT, tokens/sec).
+    """
+    with open(markdown_path, "w") as f:
+        f.write(MARKDOWN_HEADER.format(title=title))
+
+        def write_chunk(text):
+            f.write(text)
+            f.flush()
+            if echo:
+                print(text, end="", flush=True)
+
+        try:
+            response_text, call_record = generate_stream(
+                model,
+                prompt_text,
+                generation_config={
+                    "temperature": temperature,
+                    "max_output_tokens": max_tokens
+                },
+                on_chunk=write_chunk
+            )
+        except LLMCallError as e:
+            print(f"\n❌ ERROR: LLM call failed: {e}")
+            print(traceback.format_exc())  # Print full stack trace
+            raise
+
+        if not response_text:
+            response_text = "No Response"
+            f.write(response_text)
+        f.write(MARKDOWN_FOOTER)
+
+    if not echo:
+        return response_text, call_record
+    print(f"\n⏱️ TTFT: {call_record['ttft_seconds']:.2f}s | total: {call_record['latency_seconds']:.2f}s "
+          f"| {call_record['output_tokens']} tokens at {call_record['tokens_per_second']:.1f} tokens/sec"
+          f"{' (cached)' if call_record['cached'] else ''}")
+    return response_text, call_record
+
+def metrics_columns(call_record):
     """
-    markdown_content = f"""# Requirements Analysis Document: ProfitScout Application
+    Maps a call record onto results columns.
+    """
+    if not call_record:
+        return {}
+    columns = {"Latency (s)": call_record["latency_seconds"]}
+    if call_record.get("ttft_seconds") is not None:
+        columns["TTFT (s)"] = call_record["ttft_seconds"]
+        columns["Tokens/sec"] = call_record["tokens_per_second"]
+    columns.update(result_columns(call_record))
+    return columns
+
+MARKDOWN_HEADER = """# Requirements Analysis Document: {title}
+
+"""
 
-{content}
+MARKDOWN_FOOTER = """
 
 ---
 *Generated automatically using Gemini 1.5 Pro*
 """
 
+def save_markdown(filepath, content, title=DEFAULT_TITLE):
+    """
+    Saves the final Requirements Analysis as a Markdown file.
+    """
     with open(filepath, "w") as f:
-        f.write(markdown_content)
+        f.write(MARKDOWN_HEADER.format(title=title) + content + MARKDOWN_FOOTER)
+
+def read_projects(filepath):
+    """
+    Loads the batch JSONL and normalizes every line to a dict with
+    project_id, title and description (other fields are kept).
+    """
+    if not os.path.isfile(filepath):
+        raise FileNotFoundError(f"❌ ERROR: File not found: {filepath}")
+    projects = []
+    for number, row in enumerate(read_rows(filepath), start=1):
+        project = dict(row)
+        project["project_id"] = str(row.get("project_id") or row.get("request_id") or row.get("id") or f"project-{number:04d}")
+        project["title"] = row.get("title") or row.get("name") or project["project_id"]
+        project["description"] = row.get("description") or row.get("body") or ""
+        projects.append(project)
+    ids = [project["project_id"] for project in projects]
+    if len(set(ids)) != len(ids):
+        raise ValueError(f"❌ ERROR: Duplicate project ids in {filepath}.")
+    return projects
+
+PLACEHOLDER_PATTERN = re.compile(r"{(\w+)}")
+
+def render_prompt(ultimate_prompt, project):
+    """
+    Fills {field} placeholders of the ultimate prompt from the project. Only
+    {name} placeholders naming a project field are replaced; any other braces
+    (JSON examples, "{}", "{0}") are kept as they are. A prompt without
+    title/description/project_id placeholders gets the project appended instead.
+    """
+    if re.search(r"{(title|description|project_id)}", ultimate_prompt):
+        return PLACEHOLDER_PATTERN.sub(
+            lambda match: str(project[match.group(1)]) if match.group(1) in project else match.group(0),
+            ultimate_prompt)
+    return f"{ultimate_prompt}\n\nPROJECT: {project['title']}\n{project['description']}".rstrip()
+
+def project_filename(project_id):
+    """
+    File name for a project: its id with unsafe characters replaced, plus a
+    short hash of the raw id, so ids like "a/b" and "a_b" do not collide.
+    """
+    safe = re.sub(r"[^A-Za-z0-9._-]+", "_", project_id).strip("._") or "project"
+    return f"{safe}-{hashlib.sha256(project_id.encode('utf-8')).hexdigest()[:8]}"
+
+def run_project(model, ultimate_prompt, project, output_dir, stream, temperature=0.3, max_tokens=2048):
+    """
+    Executes one batch project and writes its Markdown file. Returns the result
+    row, or None if the call failed.
+    """
+    prompt_text = render_prompt(ultimate_prompt, project)
+    markdown_path = os.path.join(output_dir, project_filename(project["project_id"]) + ".md")
+    try:
+        if stream:
+            response_text, call_record = call_llm_streaming(model, prompt_text, temperature, max_tokens,
+                                                            markdown_path, title=project["title"], echo=False)
+        else:
+            response_text, call_record = generate_detailed(
+                model, prompt_text, generation_config={"temperature": temperature, "max_output_tokens": max_tokens})
+            response_text = response_text or "No Response"
+            save_markdown(markdown_path, response_text, title=project["title"])
+    except LLMCallError as e:
+        print(f"❌ ERROR: Project {project['project_id']} failed: {e}")
+        return None
+    return {
+        "Project ID": project["project_id"],
+        "Title": project["title"],
+        "Markdown Path": markdown_path,
+        "Temperature": temperature,
+        "Max Tokens": max_tokens,
+        "Response Text": response_text,
+        **metrics_columns(call_record)
+    }
+
+def run_batch(model, ultimate_prompt, batch_path, output_dir=BATCH_DIR, concurrency=DEFAULT_BATCH_CONCURRENCY,
+              resume=False, stream=True):
+    """
+    Runs every project of the batch file concurrently and returns the results table.
+    Each finished project is appended to batch_results.jsonl right away, so
+    `resume` skips the projects that are already done.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    results_path = os.path.join(output_dir, "batch_results.jsonl")
+    projects = read_projects(batch_path)
+    if resume:
+        done = {key[0] for key in completed_keys(results_path, ["Project ID"])}
+        pending = [project for project in projects if project["project_id"] not in done]
+        print(f"🔁 Resuming: {len(projects) - len(pending)} of {len(projects)} projects already in {results_path}")
+    else:
+        pending = projects
+
+    print(f"🚀 Executing the ultimate prompt for {len(pending)} projects with concurrency={concurrency}...")
+    failed = 0
+    events.progress(0, len(pending), unit="projects")
+    with JsonlResultsSink(results_path, resume=resume) as sink, \
+            ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+        futures = [pool.submit(run_project, model, ultimate_prompt, project, output_dir, stream) for project in pending]
+        for completed, future in enumerate(as_completed(futures), start=1):
+            row = future.result()
+            events.progress(completed, len(pending), unit="projects")
+            if row is None:
+                failed += 1
+                continue
+            sink.write(row)
+            print(f"⏱️ [{completed}/{len(pending)}] {row['Project ID']} -> {row['Markdown Path']} "
+                  f"({row.get('Latency (s)', 0):.2f}s)")
+
+    # Export the table in the batch file's order
+    import pandas as pd
+
+    order = {project["project_id"]: index for index, project in enumerate(projects)}
+    rows = {row["Project ID"]: row for row in read_rows(results_path) if row.get("Project ID") in order}
+    results = pd.DataFrame([rows[project_id] for project_id in sorted(rows, key=order.get)])
+    csv_path = os.path.join(output_dir, "batch_results.csv")
+    results.to_csv(csv_path, index=False)
+    if failed:
+        print(f"⚠️ WARNING: {failed} projects failed. Re-run with --resume to retry them.")
+    print(f"✅ Batch complete: {len(results)} of {len(projects)} projects in {csv_path}")
+    return results
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,391 @@
+#!/usr/bin/env python3
+"""
+experiment_history.py
+---------------------
+Run-scoped experiment history across pipeline runs (SQLite,
+artifacts/history.sqlite by default).
+
+Every generator sweep starts a run (run_id, e.g. 20250101-120000-1a2b) that
+the later stages of the same pipeline run attach to: in-process through
+DAPO_RUN_ID, as separate processes by picking the most recent run. The results
+rows carry the run in a "Run ID" column, so judge.py and jury.py only look at
+the rows of the current run.
+
+Tables:
+  - runs:    one row per run
+  - cells:   one row per generator draw (prompt type, temperature, max tokens,
+             sample, pre-score, tokens, latency, cost), indexed by run_id,
+             prompt_type and (temperature, max_tokens)
+  - texts:   prompt, response and report bodies by SHA-256, so queries over
+             cells and lineage never load them
+  - lineage: generator cell -> judge selection -> ultimate execution -> jury
+             verdict, each event pointing at its parent
+
+Queries (also from the command line):
+    python experiment_history.py best                      # best prompt per run
+    python experiment_history.py trend [--prompt-type cot] # pre-score trend per prompt type
+    python experiment_history.py lineage [RUN_ID]          # cell -> selection -> execution -> verdict
+    python experiment_history.py text SHA                  # a stored prompt/response/report
+
+DAPO_HISTORY=0 disables recording.
+"""
+
+import os
+import time
+import uuid
+import sqlite3
+import hashlib
+import argparse
+import threading
+
+DEFAULT_HISTORY_PATH = os.getenv("DAPO_HISTORY_PATH", os.path.join("artifacts", "history.sqlite"))
+RUN_ID_ENV = "DAPO_RUN_ID"
+RUN_ID_COLUMN = "Run ID"
+
+EVENT_KINDS = ["selection", "execution", "verdict"]
+
+settings = {"enabled": os.getenv("DAPO_HISTORY", "1") != "0"}
+
+# The run id start_run() exported, to tell it apart from one the user pinned
+_exported = {"run_id": None}
+
+SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS runs (
+           run_id TEXT PRIMARY KEY,
+           started_at REAL
+       )""",
+    """CREATE TABLE IF NOT EXISTS cells (
+           cell_id INTEGER PRIMARY KEY,
+           run_id TEXT NOT NULL,
+           prompt_type TEXT,
+           temperature REAL,
+           max_tokens INTEGER,
+           sample INTEGER,
+           prompt_sha TEXT,
+           response_sha TEXT,
+           pre_score REAL,
+           output_tokens INTEGER,
+           latency_seconds REAL,
+           cost_usd REAL,
+           finish_reason TEXT,
+           cluster INTEGER,
+           UNIQUE (run_id, prompt_type, temperature, max_tokens, sample)
+       )""",
+    "CREATE INDEX IF NOT EXISTS idx_cells_run ON cells(run_id)",
+    "CREATE INDEX IF NOT EXISTS idx_cells_prompt_type ON cells(prompt_type, run_id)",
+    "CREATE INDEX IF NOT EXISTS idx_cells_config ON cells(temperature, max_tokens)",
+    """CREATE TABLE IF NOT EXISTS texts (
+           sha TEXT PRIMARY KEY,
+           body TEXT
+       )""",
+    """CREATE TABLE IF NOT EXISTS lineage (
+           event_id INTEGER PRIMARY KEY,
+           run_id TEXT NOT NULL,
+           kind TEXT NOT NULL,
+           parent_id INTEGER,
+           cell_id INTEGER,
+           input_sha TEXT,
+           output_sha TEXT,
+           score REAL,
+           note TEXT,
+           created_at REAL
+       )""",
+    "CREATE INDEX IF NOT EXISTS idx_lineage_run ON lineage(run_id, kind)",
+]
+
+
+def text_sha(text):
+    return hashlib.sha256(str(text).encode("utf-8")).hexdigest()
+
+
+def new_run_id():
+    return f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:4]}"
+
+
+def _number(value):
+    """
+    Float for SQLite, or None for missing / non-finite values.
+    """
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return None
+    return value if value == value and abs(value) != float("inf") else None
+
+
+class ExperimentHistory:
+    """
+    SQLite-backed history of runs, cells and their lineage. Safe to share
+    between threads of one process.
+    """
+
+    def __init__(self, path=DEFAULT_HISTORY_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        for statement in SCHEMA:
+            self._conn.execute(statement)
+        self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # ----- writes -----
+
+    def _store_text(self, text):
+        sha = text_sha(text)
+        self._conn.execute("INSERT OR IGNORE INTO texts VALUES (?, ?)", (sha, str(text)))
+        return sha
+
+    def add_run(self, run_id):
+        with self._lock:
+            self._conn.execute("INSERT OR IGNORE INTO runs VALUES (?, ?)", (run_id, time.time()))
+            self._conn.commit()
+
+    def latest_run(self):
+        with self._lock:
+            row = self._conn.execute("SELECT run_id FROM runs ORDER BY started_at DESC LIMIT 1").fetchone()
+        return row["run_id"] if row else None
+
+    def record_cells(self, run_id, df):
+        """
+        Stores the rows of a generator results table (with a Pre-Score column
+        when available), replacing earlier rows of the same draws.
+        """
+        rows = []
+        with self._lock:
+            for row in df.to_dict(orient="records"):
+                rows.append((
+                    run_id, row["Prompt Type"], _number(row["Temperature"]), int(row["Max Tokens"]),
+                    int(_number(row.get("Sample")) or 0),
+                    self._store_text(row["Actual Prompt"]), self._store_text(row["Response Text"]),
+                    _number(row.get("Pre-Score")), _number(row.get("Output Tokens")),
+                    _number(row.get("Latency (s)")), _number(row.get("Cost (USD)")),
+                    row.get("Finish Reason") or None, _number(row.get("Cluster")),
+                ))
+            self._conn.executemany(
+                """INSERT OR REPLACE INTO cells (run_id, prompt_type, temperature, max_tokens, sample, prompt_sha,
+                       response_sha, pre_score, output_tokens, latency_seconds, cost_usd, finish_reason, cluster)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                rows,
+            )
+            self._conn.commit()
+        return len(rows)
+
+    def find_cell(self, run_id, prompt_type, temperature, max_tokens):
+        """
+        The best-scoring draw of a grid cell in a run, or None.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                """SELECT cell_id FROM cells
+                   WHERE run_id = ? AND prompt_type = ? AND temperature = ? AND max_tokens = ?
+                   ORDER BY pre_score IS NULL, pre_score DESC, sample LIMIT 1""",
+                (run_id, prompt_type, _number(temperature), int(max_tokens)),
+            ).fetchone()
+        return row["cell_id"] if row else None
+
+    def record_event(self, run_id, kind, input_text=None, output_text=None, cell_id=None, score=None, note=None):
+        """
+        Appends a lineage event. Its parent is the latest event of the previous
+        kind in the run (selection -> execution -> verdict). Returns the event id.
+        """
+        if kind not in EVENT_KINDS:
+            raise ValueError(f"❌ ERROR: Unknown lineage event '{kind}'. Choose from {', '.join(EVENT_KINDS)}.")
+        with self._lock:
+            parent_id = None
+            if EVENT_KINDS.index(kind) > 0:
+                parent = self._conn.execute(
+                    "SELECT event_id, cell_id FROM lineage WHERE run_id = ? AND kind = ? ORDER BY event_id DESC LIMIT 1",
+                    (run_id, EVENT_KINDS[EVENT_KINDS.index(kind) - 1]),
+                ).fetchone()
+                if parent is not None:
+                    parent_id = parent["event_id"]
+                    cell_id = cell_id if cell_id is not None else parent["cell_id"]
+            input_sha = self._store_text(input_text) if input_text is not None else None
+            output_sha = self._store_text(output_text) if output_text is not None else None
+            cursor = self._conn.execute(
+                """INSERT INTO lineage (run_id, kind, parent_id, cell_id, input_sha, output_sha, score, note, created_at)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                (run_id, kind, parent_id, cell_id, input_sha, output_sha, _number(score), note, time.time()),
+            )
+            self._conn.commit()
+            return cursor.lastrowid
+
+    # ----- queries -----
+
+    def _query(self, sql, params=()):
+        with self._lock:
+            return [dict(row) for row in self._conn.execute(sql, params).fetchall()]
+
+    def best_prompt_per_run(self):
+        """
+        The judge's latest selection of every run with the generator cell it
+        came from and the start of the refined prompt.
+        """
+        return self._query(
+            """SELECT r.run_id, c.prompt_type, c.temperature, c.max_tokens, c.pre_score,
+                      replace(substr(t.body, 1, 80), char(10), ' ') AS ultimate_prompt, l.output_sha AS ultimate_sha
+               FROM runs r
+               JOIN lineage l ON l.event_id = (SELECT MAX(event_id) FROM lineage
+                                              WHERE run_id = r.run_id AND kind = 'selection')
+               LEFT JOIN cells c ON c.cell_id = l.cell_id
+               LEFT JOIN texts t ON t.sha = l.output_sha
+               ORDER BY r.started_at"""
+        )
+
+    def score_trend(self, prompt_type=None):
+        """
+        Mean / best pre-score and draw count per run and prompt type, in run order.
+        """
+        where, params = ("WHERE c.prompt_type = ?", (prompt_type,)) if prompt_type else ("", ())
+        return self._query(
+            f"""SELECT c.run_id, c.prompt_type, COUNT(*) AS draws,
+                       ROUND(AVG(c.pre_score), 4) AS mean_pre_score, ROUND(MAX(c.pre_score), 4) AS best_pre_score
+                FROM cells c JOIN runs r ON r.run_id = c.run_id
+                {where}
+                GROUP BY c.run_id, c.prompt_type
+                ORDER BY r.started_at, c.prompt_type""",
+            params,
+        )
+
+    def lineage(self, run_id):
+        """
+        The lineage events of a run, each with the generator cell it traces back to.
+        """
+        return self._query(
+            """SELECT l.event_id, l.kind, l.parent_id, l.cell_id, c.prompt_type, c.temperature, c.max_tokens,
+                      l.input_sha, l.output_sha, l.score, l.note
+               FROM lineage l LEFT JOIN cells c ON c.cell_id = l.cell_id
+               WHERE l.run_id = ?
+               ORDER BY l.event_id""",
+            (run_id,),
+        )
+
+    def text(self, sha_prefix):
+        rows = self._query("SELECT body FROM texts WHERE sha LIKE ? LIMIT 2", (f"{sha_prefix}%",))
+        return rows[0]["body"] if len(rows) == 1 else None
+
+
+def start_run(resume=False, path=DEFAULT_HISTORY_PATH):
+    """
+    Returns the run id for a generator sweep: DAPO_RUN_ID if the user set it,
+    the latest run when resuming, otherwise a new one. The id is exported in
+    DAPO_RUN_ID so in-process stages that follow use it too; an id exported by
+    an earlier sweep of this process is only reused when resuming.
+    """
+    run_id = os.getenv(RUN_ID_ENV)
+    pinned = run_id and run_id != _exported["run_id"]
+    if not pinned:
+        if not resume:
+            run_id = None
+        elif not run_id and settings["enabled"]:
+            run_id = _safely(lambda history: history.latest_run(), path)
+        run_id = _exported["run_id"] = run_id or new_run_id()
+    os.environ[RUN_ID_ENV] = run_id
+    if settings["enabled"]:
+        _safely(lambda history: history.add_run(run_id), path)
+    return run_id
+
+
+def current_run_id(path=DEFAULT_HISTORY_PATH):
+    """
+    DAPO_RUN_ID, else the most recent run in the history, else None.
+    """
+    run_id = os.getenv(RUN_ID_ENV)
+    if run_id or not settings["enabled"] or not os.path.isfile(path):
+        return run_id
+    return _safely(lambda history: history.latest_run(), path)
+
+
+def rows_of_run(df, run_id):
+    """
+    Keeps the rows of `run_id`. Tables from before run ids (no Run ID column,
+    or no row with a run id) are returned unchanged; a table whose rows all
+    belong to other runs raises ValueError.
+    """
+    if not run_id or RUN_ID_COLUMN not in df.columns or not df[RUN_ID_COLUMN].notna().any():
+        return df
+    in_run = df[RUN_ID_COLUMN] == run_id
+    if not in_run.any():
+        raise ValueError(f"❌ ERROR: No rows of run {run_id} in the results (runs present: "
+                         f"{', '.join(sorted(df[RUN_ID_COLUMN].dropna().astype(str).unique()))}). "
+                         f"Run generator.py, or set {RUN_ID_ENV} to one of these runs.")
+    if not in_run.all():
+        print(f"🗂️ History: using the {int(in_run.sum())} rows of run {run_id} ({int((~in_run).sum())} from other runs ignored)")
+    return df[in_run]
+
+
+def record(action, path=DEFAULT_HISTORY_PATH):
+    """
+    Runs `action(history)` unless recording is disabled. History problems are
+    reported but never fail a stage.
+    """
+    if settings["enabled"]:
+        return _safely(action, path)
+    return None
+
+
+def _safely(action, path):
+    try:
+        with ExperimentHistory(path) as history:
+            return action(history)
+    except sqlite3.Error as e:
+        print(f"⚠️ WARNING: Experiment history unavailable ({e}); continuing without it.")
+        return None
+
+
+def print_rows(rows):
+    if not rows:
+        print("(no rows)")
+        return
+    columns = list(rows[0])
+    widths = {column: max(len(column), *(len(str(row[column])) for row in rows)) for column in columns}
+    print("  ".join(column.ljust(widths[column]) for column in columns))
+    for row in rows:
+        print("  ".join(str(row[column]).ljust(widths[column]) for column in columns))
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Query the cross-run experiment history.")
+    parser.add_argument("query", choices=["best", "trend", "lineage", "text"])
+    parser.add_argument("value", nargs="?", help="Run id for 'lineage' (default: latest run), SHA (prefix) for 'text'.")
+    parser.add_argument("--prompt-type", help="Only this prompt type for 'trend'.")
+    parser.add_argument("--path", default=DEFAULT_HISTORY_PATH,
+                        help="History database (default: %(default)s).")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if not os.path.isfile(args.path):
+        print(f"❌ ERROR: No experiment history at {args.path}. Run generator.py first.")
+        return
+    with ExperimentHistory(args.path) as history:
+        if args.query == "best":
+            print_rows(history.best_prompt_per_run())
+        elif args.query == "trend":
+            print_rows(history.score_trend(args.prompt_type))
+        elif args.query == "lineage":
+            run_id = args.value or history.latest_run()
+            print(f"🗂️ Lineage of run {run_id}:")
+            print_rows(history.lineage(run_id))
+        else:
+            body = history.text(args.value or "")
+            print(body if body is not None else f"❌ ERROR: No unique text for SHA '{args.value}'.")
+
+
+if __name__ == "__main__":
+    main()
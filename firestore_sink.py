@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+firestore_sink.py
+-----------------
+Experiment tracking sinks used by generator.py.
+
+- FirestoreBatchWriter queues documents and commits them from a background
+  thread in batched writes (up to Firestore's 500-operation limit), flushing
+  when a batch is full, when FLUSH_INTERVAL_SECONDS have passed, and on close().
+  The firestore.Client is only created when the writer starts.
+- "emulator" uses the same writer against FIRESTORE_EMULATOR_HOST.
+- FileSink appends documents to a local JSONL file and NullSink drops them,
+  for tests and offline runs.
+"""
+
+import os
+import json
+import time
+import queue
+import threading
+
+COLLECTION_NAME = "prompt_experiments"
+
+# Firestore rejects batches with more than 500 operations
+MAX_BATCH_SIZE = 500
+FLUSH_INTERVAL_SECONDS = 2.0
+COMMIT_RETRIES = 3
+
+SINK_KINDS = ["cloud", "emulator", "file", "none"]
+DEFAULT_SINK_KIND = os.getenv("DAPO_FIRESTORE", "cloud")
+DEFAULT_FILE_SINK_PATH = os.path.join("artifacts", "firestore_documents.jsonl")
+
+_STOP = object()
+
+
+def create_firestore_client():
+    from google.cloud import firestore
+    return firestore.Client()
+
+
+class FirestoreBatchWriter:
+    """
+    Non-blocking Firestore writer. add() only enqueues; a daemon thread batches
+    and commits the documents.
+    """
+
+    def __init__(self, collection=COLLECTION_NAME, client_factory=create_firestore_client,
+                 max_batch_size=MAX_BATCH_SIZE, flush_interval=FLUSH_INTERVAL_SECONDS):
+        self.collection = collection
+        self.client_factory = client_factory
+        self.max_batch_size = min(max_batch_size, MAX_BATCH_SIZE)
+        self.flush_interval = flush_interval
+        self.written = 0
+        self.failed = 0
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="firestore-writer", daemon=True)
+        self._thread.start()
+
+    def add(self, document):
+        self._queue.put(document)
+
+    def close(self):
+        """
+        Flushes everything still queued and stops the writer thread.
+        """
+        self._queue.put(_STOP)
+        self._thread.join()
+        print(f"🗃️ Firestore: {self.written} documents written in batches, {self.failed} failed")
+
+    def _run(self):
+        client = None
+        pending = []
+        deadline = time.monotonic() + self.flush_interval
+        stopping = False
+        while not stopping:
+            try:
+                item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                if item is _STOP:
+                    stopping = True
+                else:
+                    pending.append(item)
+            except queue.Empty:
+                pass
+
+            if pending and (stopping or len(pending) >= self.max_batch_size or time.monotonic() >= deadline):
+                if client is None:
+                    try:
+                        client = self.client_factory()
+                    except Exception as e:
+                        print(f"❌ ERROR: Could not create Firestore client: {e}")
+                        self.failed += len(pending)
+                        pending = []
+                        continue
+                self._commit(client, pending[:self.max_batch_size])
+                pending = pending[self.max_batch_size:]
+            if time.monotonic() >= deadline:
+                deadline = time.monotonic() + self.flush_interval
+
+        while pending:
+            self._commit(client, pending[:self.max_batch_size])
+            pending = pending[self.max_batch_size:]
+
+    def _commit(self, client, documents):
+        collection = client.collection(self.collection)
+        for attempt in range(COMMIT_RETRIES):
+            try:
+                batch = client.batch()
+                for document in documents:
+                    batch.set(collection.document(), document)
+                batch.commit()
+                self.written += len(documents)
+                return
+            except Exception as e:
+                if attempt == COMMIT_RETRIES - 1:
+                    print(f"❌ ERROR: Firestore batch of {len(documents)} documents failed: {e}")
+                    self.failed += len(documents)
+                    return
+                time.sleep(2 ** attempt)
+
+
+class FileSink:
+    """
+    Writes documents to a local JSONL file instead of Firestore.
+    """
+
+    def __init__(self, path=DEFAULT_FILE_SINK_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = open(path, "a", encoding="utf-8")
+        self.written = 0
+
+    def add(self, document):
+        with self._lock:
+            self._file.write(json.dumps(document, ensure_ascii=False) + "\n")
+            self.written += 1
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+        print(f"🗃️ File sink: {self.written} documents written to {self.path}")
+
+
+class NullSink:
+    """
+    Discards documents (Firestore tracking disabled).
+    """
+
+    def add(self, document):
+        pass
+
+    def close(self):
+        pass
+
+
+def make_sink(kind=DEFAULT_SINK_KIND):
+    """
+    Builds the tracking sink selected by --firestore / DAPO_FIRESTORE.
+    """
+    if kind == "cloud":
+        return FirestoreBatchWriter()
+    if kind == "emulator":
+        if not os.getenv("FIRESTORE_EMULATOR_HOST"):
+            raise ValueError("❌ ERROR: FIRESTORE_EMULATOR_HOST must be set to use the Firestore emulator.")
+        os.environ.setdefault("GOOGLE_CLOUD_PROJECT", "dapo-local")
+        return FirestoreBatchWriter()
+    if kind == "file":
+        return FileSink()
+    if kind == "none":
+        return NullSink()
+    raise ValueError(f"❌ ERROR: Unknown Firestore sink '{kind}'. Choose from {', '.join(SINK_KINDS)}.")
@@ -5,28 +5,29 @@ generator.py
 Generates multiple prompt variations, evaluates outputs, and saves:
   - experiment_results.csv (inside artifacts/)
   - Stores results in Firestore (for cloud tracking)
+
+Sweep options (concurrency, --resume, --samples, --search, --batch-prediction,
+--dry-run) are described in the README.
 """
 
 import os
 import time
 import json
-import pandas as pd
-from google.cloud import firestore
-import google.generativeai as genai
-
-# Initialize Firestore
-db = firestore.Client()
-
-# Retrieve the API key from system environment variables
-api_key = os.getenv("GEMINI_API_KEY")
-if not api_key:
-    raise ValueError("❌ ERROR: GEMINI_API_KEY environment variable not set.")
-
-# Configure Gemini 1.5 Pro Model
-genai.configure(api_key=api_key)
-
-# Define the model
-model = genai.GenerativeModel("gemini-1.5-pro")
+import argparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from llm_client import MODEL_NAME, generate_detailed, configure_model, estimate_tokens, LLMCallError, print_stats
+from metrics import set_stage, result_columns, record_call, estimate_cost
+from results_sink import JsonlResultsSink, read_rows, completed_keys
+from firestore_sink import make_sink, SINK_KINDS, DEFAULT_SINK_KIND
+from results_store import ResultsStore
+from search import QuickJudge, QUICK_JUDGE_MODEL, planned_calls, successive_halving, save_search_history
+from dedup import assign_clusters
+from prescore import prescore
+from experiment_history import RUN_ID_COLUMN, record, start_run
+from batch_prediction import (BATCH_BACKENDS, BATCH_COST_FACTOR, DEFAULT_GCS_URI, DEFAULT_POLL_SECONDS,
+                              DEFAULT_TIMEOUT_SECONDS, LOCAL_POLL_SECONDS, build_request, make_client, run_batch_job)
+import response_cache
+import events
 
 # Experiment configurations
 prompt_types = {
@@ -56,62 +57,402 @@ prompt_types = {
 temperatures = [0.3, 0.5, 0.7]
 max_tokens = [512, 768, 1024]
 
-# Ensure artifacts directory exists
+# Number of grid cells sent to Gemini at the same time
+DEFAULT_CONCURRENCY = int(os.getenv("GENERATOR_CONCURRENCY", "4"))
+
+RESULT_COLUMNS = ["Prompt Type", "Actual Prompt", "Temperature", "Max Tokens", "Sample", "Response Text", "Latency (s)",
+                  "Queue Wait (s)", "Input Tokens", "Output Tokens", "Finish Reason", "Truncated", "Retries", "Cached", "Cost (USD)"]
+
+# Columns that identify one draw of a grid cell (used to resume an interrupted sweep)
+CELL_KEY_COLUMNS = ["Prompt Type", "Temperature", "Max Tokens", "Sample"]
+
+# Largest max_output_tokens Gemini 1.5 accepts
+MAX_OUTPUT_TOKENS = 8192
+
 artifacts_dir = "artifacts"
-if not os.path.exists(artifacts_dir):
-    os.makedirs(artifacts_dir)
 
 # Path for storing CSV output
 csv_file_path = os.path.join(artifacts_dir, "experiment_results.csv")
 
-# Store results for CSV export
-results = []
+# Append-only log of completed cells, flushed as each call finishes
+jsonl_file_path = os.path.join(artifacts_dir, "experiment_results.jsonl")
+
+# Per-round scores of --search halving
+search_history_path = os.path.join(artifacts_dir, "search_history.csv")
+
+# Aggregates over the samples of every cell
+cell_stats_path = os.path.join(artifacts_dir, "cell_stats.csv")
 
 # Function to run a single experiment
-def run_experiment(prompt_type, prompt_text, temp, max_tok):
-    print(f"🚀 Running: {prompt_type} | Temp: {temp} | Max Tokens: {max_tok}")
+def run_experiment(model, tracker, prompt_type, prompt_text, temp, max_tok, sample=0):
+    """
+    Runs one draw (`sample`) of a grid cell and returns its result row
+    (including latency, token usage, finish reason and estimated cost),
+    or None when the call failed so no error text ends up in the results.
+    Latency is the model call alone; time spent waiting on the rate limiter
+    or backing off between retries is reported as the queue wait.
+    """
+    print(f"🚀 Running: {prompt_type} | Temp: {temp} | Max Tokens: {max_tok} | Sample: {sample}")
 
+    start_time = time.perf_counter()
     try:
-        # Generate content with Gemini 1.5 Pro
-        response = model.generate_content(
+        # Generate content with Gemini 1.5 Pro (rate limited, retried on quota errors)
+        response_text, call_record = generate_detailed(
+            model,
             prompt_text,
             generation_config={
                 "temperature": temp,
                 "max_output_tokens": max_tok
-            }
+            },
+            sample=sample
         )
-        response_text = response.text.strip() if response.text else "No Response"
-    except Exception as e:
-        response_text = f"Error: {e}"
+        response_text = response_text or "No Response"
+    except LLMCallError as e:
+        print(f"❌ ERROR: {prompt_type} | Temp: {temp} | Max Tokens: {max_tok} failed: {e}")
+        return None
+    elapsed = time.perf_counter() - start_time
+    latency = call_record["latency_seconds"]
+    return build_row(tracker, prompt_type, prompt_text, temp, max_tok, sample, response_text, latency, call_record,
+                     queue_wait=max(0.0, elapsed - latency))
 
-    # Store result in Firestore
-    db.collection("prompt_experiments").add({
+def build_row(tracker, prompt_type, prompt_text, temp, max_tok, sample, response_text, latency, call_record,
+              queue_wait=None):
+    """
+    Tracks one completed draw and returns its result row.
+    """
+    # Queue the result for Firestore (written in batches by a background thread)
+    tracker.add({
         "prompt_type": prompt_type,
         "actual_prompt": prompt_text,
         "temperature": temp,
         "max_tokens": max_tok,
+        "sample": sample,
         "response_text": response_text,
+        "latency_seconds": latency,
+        "queue_wait_seconds": queue_wait,
         "timestamp": time.time()
     })
 
-    # Store in list for CSV export
-    results.append([prompt_type, prompt_text, temp, max_tok, response_text])
+    row = {
+        "Prompt Type": prompt_type,
+        "Actual Prompt": prompt_text,
+        "Temperature": temp,
+        "Max Tokens": max_tok,
+        "Sample": sample,
+        "Response Text": response_text,
+        "Latency (s)": round(latency, 3) if latency is not None else None,
+        "Queue Wait (s)": round(queue_wait, 3) if queue_wait is not None else None
+    }
+    row.update(result_columns(call_record))
+    return row
+
+def build_grid(temperature_values=None, max_token_values=None):
+    """
+    Expands prompt_types × temperatures × max_tokens into an ordered list of cells.
+    The order of this list is the row order of experiment_results.csv.
+    """
+    return [
+        (prompt_type, prompt_text, temp, max_tok)
+        for prompt_type, prompt_text in prompt_types.items()
+        for temp in (temperature_values or temperatures)
+        for max_tok in (max_token_values or max_tokens)
+    ]
+
+def validate_grid(grid, samples=1):
+    """
+    Raises ValueError listing every problem of the grid (empty prompts,
+    out-of-range temperatures or max_tokens, duplicate cells).
+    """
+    problems = []
+    if samples < 1:
+        problems.append(f"--samples must be at least 1 (got {samples})")
+    seen = set()
+    for prompt_type, prompt_text, temp, max_tok in grid:
+        label = f"{prompt_type} | Temp: {temp} | Max Tokens: {max_tok}"
+        if not prompt_text.strip():
+            problems.append(f"{label}: empty prompt")
+        if not 0.0 <= temp <= 2.0:
+            problems.append(f"{label}: temperature must be between 0 and 2")
+        if not 0 < max_tok <= MAX_OUTPUT_TOKENS:
+            problems.append(f"{label}: max_tokens must be between 1 and {MAX_OUTPUT_TOKENS}")
+        if cell_key(prompt_type, temp, max_tok) in seen:
+            problems.append(f"{label}: duplicate cell")
+        seen.add(cell_key(prompt_type, temp, max_tok))
+    if problems:
+        raise ValueError("❌ ERROR: Invalid sweep grid:\n  - " + "\n  - ".join(problems))
+
+def dry_run(grid, jobs, args):
+    """
+    Builds the request of every draw and prints the size of the sweep with an
+    upper bound on its output tokens and cost. Makes no calls.
+    """
+    if args.search == "halving":
+        dry_run_search(grid, args)
+        return
+    requests = [build_request(prompt_text, temp, max_tok) for _, prompt_text, temp, max_tok, _ in jobs]
+    input_tokens = sum(estimate_tokens(job[1]) for job in jobs)
+    output_tokens = sum(job[3] for job in jobs)
+    cost_factor = BATCH_COST_FACTOR if args.batch_prediction != "off" else 1.0
+    cost = cost_factor * estimate_cost(MODEL_NAME, input_tokens, output_tokens)
+    print(f"🧪 Dry run: {len(grid)} cells × {args.samples} samples = {len(requests)} draws "
+          f"({len(prompt_types)} prompt types, temperatures {args.temperatures}, max tokens {args.max_tokens})")
+    print(f"🧪 ~{input_tokens:,} input tokens, at most {output_tokens:,} output tokens, "
+          f"at most ${cost:.4f}; no model calls made.")
+
+def dry_run_search(grid, args):
+    """
+    Prints the most calls a successive-halving search can make (every round
+    run, the longest max_tokens for every full-length draw).
+    """
+    probes, rounds = planned_calls(grid, args.eta, args.probe_tokens, args.max_rounds)
+    draws = len(probes) + sum(rounds)
+    longest_prompt = max(estimate_tokens(prompt_text) for _, prompt_text, _, _ in grid)
+    input_tokens = sum(estimate_tokens(job[1]) for job in probes) + sum(rounds) * longest_prompt
+    output_tokens = sum(job[3] for job in probes) + sum(rounds) * max(cell[3] for cell in grid)
+    # The quick judge reads every draw and answers with a short JSON object
+    cost = estimate_cost(MODEL_NAME, input_tokens, output_tokens) + estimate_cost(args.judge_model, output_tokens, 64 * draws)
+    print(f"🧪 Dry run (successive halving): {len(probes)} probes + at most {sum(rounds)} full-length draws "
+          f"in {len(rounds)} rounds (sampled cells per round: {rounds}); the exhaustive grid has {len(grid)} cells")
+    print(f"🧪 ~{input_tokens:,} input tokens, at most {output_tokens:,} output tokens and {draws} quick-judge calls, "
+          f"at most ${cost:.4f}; no model calls made.")
+
+def build_jobs(grid, samples=1):
+    """
+    Expands grid cells into (prompt_type, prompt_text, temp, max_tok, sample) jobs.
+    """
+    return [cell + (sample,) for cell in grid for sample in range(samples)]
+
+def run_sweep(model, jobs, sink, tracker, concurrency=DEFAULT_CONCURRENCY, on_row=None):
+    """
+    Fans the jobs out over a bounded thread pool and streams each completed
+    row to `sink` as soon as its call returns (and to `on_row`, if given).
+    Failed jobs are not written. Returns the number of jobs that failed.
+    """
+    failed = 0
+    events.progress(0, len(jobs), unit="draws")
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+        futures = [pool.submit(run_experiment, model, tracker, *job) for job in jobs]
+        for completed, future in enumerate(as_completed(futures), start=1):
+            row = future.result()
+            events.progress(completed, len(jobs), unit="draws")
+            if row is None:
+                failed += 1
+                continue
+            sink.write(row)
+            if on_row:
+                on_row(row)
+            print(f"⏱️ [{completed}/{len(jobs)}] {row['Prompt Type']} | Temp: {row['Temperature']} "
+                  f"| Max Tokens: {row['Max Tokens']} | Sample: {row['Sample']} -> {row['Latency (s)']:.2f}s")
+    return failed
+
+def run_batch_sweep(model, jobs, sink, tracker, args):
+    """
+    Runs the jobs as one batch prediction job and streams the ingested rows to
+    `sink`. Batch rows have no per-call latency, so they are recorded without
+    one and left out of the latency stats. Returns the number of draws without
+    a usable prediction.
+    """
+    model_name = getattr(model, "model_name", "gemini-1.5-pro")
+    client = make_client(args.batch_prediction, model, model_name, args.batch_gcs_uri)
+    failed = 0
+    events.progress(0, len(jobs), unit="draws")
+    for job, prediction in run_batch_job(client, jobs, artifacts_dir, poll_seconds=args.poll_interval,
+                                             timeout_seconds=args.batch_timeout):
+        prompt_type, prompt_text, temp, max_tok, sample = job
+        if prediction is None or prediction[5]:
+            print(f"❌ ERROR: {prompt_type} | Temp: {temp} | Max Tokens: {max_tok} | Sample: {sample} "
+                  f"has no batch prediction: {prediction[5] if prediction else 'missing from output'}")
+            failed += 1
+            continue
+        _, text, input_tokens, output_tokens, finish_reason, _ = prediction
+        call_record = record_call(model_name, None, input_tokens, output_tokens, finish_reason,
+                                  cost_factor=BATCH_COST_FACTOR)
+        sink.write(build_row(tracker, prompt_type, prompt_text, temp, max_tok, sample,
+                             text or "No Response", None, call_record))
+    events.progress(len(jobs), len(jobs), unit="draws")
+    return failed
+
+def cell_stats(df):
+    """
+    Aggregates the samples of every cell: mean and spread of the local pre-score,
+    output length, latency, truncation rate and the number of distinct
+    near-duplicate clusters among the samples.
+    """
+    scored = prescore(df)
+    scored["Pre-Score"] = scored["Pre-Score"].clip(lower=0.0)
+    if "Cluster" not in scored.columns:
+        scored["Cluster"] = range(len(scored))
+    stats = scored.groupby(["Prompt Type", "Temperature", "Max Tokens"], sort=False).agg(**{
+        "Samples": ("Sample", "size"),
+        "Pre-Score Mean": ("Pre-Score", "mean"),
+        "Pre-Score Std": ("Pre-Score", "std"),
+        "Output Tokens Mean": ("Output Tokens", "mean"),
+        "Latency Mean (s)": ("Latency (s)", "mean"),
+        "Truncated Rate": ("Truncated", "mean"),
+        "Distinct Clusters": ("Cluster", "nunique"),
+    }).reset_index()
+    return stats.fillna({"Pre-Score Std": 0.0}).round(4)
+
+def cell_key(prompt_type, temp, max_tok):
+    return (prompt_type, temp, max_tok)
+
+def load_results(grid):
+    """
+    Reads the streamed rows back in grid order, samples in order within a cell
+    (the last row wins if a draw was written more than once). Rows for cells
+    outside the grid and search probe rows (Sample < 0) are ignored.
+    """
+    import pandas as pd
+
+    order = {cell_key(prompt_type, temp, max_tok): index for index, (prompt_type, _, temp, max_tok) in enumerate(grid)}
+    rows = {}
+    for row in read_rows(jsonl_file_path):
+        row.setdefault("Sample", 0)
+        key = cell_key(row["Prompt Type"], row["Temperature"], row["Max Tokens"])
+        if key in order and row["Sample"] >= 0:
+            rows[(order[key], row["Sample"])] = row
+    return pd.DataFrame([rows[index] for index in sorted(rows)], columns=RESULT_COLUMNS)
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Run the prompt × temperature × max_tokens sweep.")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY,
+                        help="Maximum number of Gemini calls in flight (default: %(default)s).")
+    parser.add_argument("--temperatures", type=float, nargs="+", default=temperatures,
+                        help="Temperatures to sweep (default: %(default)s).")
+    parser.add_argument("--max-tokens", type=int, nargs="+", default=max_tokens,
+                        help="max_output_tokens values to sweep (default: %(default)s).")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Bypass the on-disk response cache entirely.")
+    parser.add_argument("--resample", action="store_true",
+                        help="Re-draw cells with temperature > 0 instead of reusing cached responses.")
+    parser.add_argument("--resume", action="store_true",
+                        help="Keep the rows already in experiment_results.jsonl and only run missing cells.")
+    parser.add_argument("--firestore", choices=SINK_KINDS, default=DEFAULT_SINK_KIND,
+                        help="Where experiment documents are tracked (default: %(default)s).")
+    parser.add_argument("--samples", type=int, default=1,
+                        help="Independent draws per grid cell, run concurrently (default: %(default)s).")
+    parser.add_argument("--batch-prediction", choices=BATCH_BACKENDS, default="off",
+                        help="Submit the grid as one batch prediction job on Vertex AI or the local "
+                             "file-based stand-in instead of online calls (default: %(default)s).")
+    parser.add_argument("--batch-gcs-uri", default=DEFAULT_GCS_URI,
+                        help="gs:// prefix for Vertex batch input and output (default: $DAPO_BATCH_GCS_URI).")
+    parser.add_argument("--poll-interval", type=float, default=None,
+                        help=f"Seconds between batch job status checks (default: {DEFAULT_POLL_SECONDS:g} on Vertex, "
+                             f"{LOCAL_POLL_SECONDS:g} for the local stand-in).")
+    parser.add_argument("--batch-timeout", type=float, default=DEFAULT_TIMEOUT_SECONDS,
+                        help="Give up on a batch prediction job still running after this many seconds "
+                             "(default: %(default)g).")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="Build all prompts, validate the grid and exit without calling the model.")
+    parser.add_argument("--search", choices=["grid", "halving"], default="grid",
+                        help="Run every cell once (grid, default) or adaptively allocate samples "
+                             "to promising cells with successive halving.")
+    parser.add_argument("--judge-model", default=QUICK_JUDGE_MODEL,
+                        help="Cheap model that scores responses during --search halving (default: %(default)s).")
+    parser.add_argument("--eta", type=int, default=3,
+                        help="Keep the top 1/eta cells after every halving round (default: %(default)s).")
+    parser.add_argument("--probe-tokens", type=int, default=256,
+                        help="max_output_tokens of the cheap first halving round (default: %(default)s).")
+    parser.add_argument("--max-rounds", type=int, default=5,
+                        help="Maximum number of halving rounds (default: %(default)s).")
+    parser.add_argument("--patience", type=int, default=2,
+                        help="Stop once the same leader has won this many rounds in a row (default: %(default)s).")
+    args = parser.parse_args(argv)
+    if args.batch_timeout <= 0:
+        parser.error("--batch-timeout must be positive")
+    if args.search == "halving":
+        # Halving decides itself how often each cell is drawn and streams its own rounds
+        conflicts = [flag for flag, used in (("--samples", args.samples != 1), ("--resume", args.resume),
+                                             ("--batch-prediction", args.batch_prediction != "off")) if used]
+        if conflicts:
+            parser.error(f"--search halving cannot be combined with {', '.join(conflicts)}")
+        if args.max_rounds < 1:
+            parser.error("--max-rounds must be at least 1")
+    return args
+
+def main(argv=None, model=None, df=None):
+    """
+    Runs the sweep and returns the results DataFrame. `model` lets an in-process
+    caller (pipeline.py) share its configured Gemini client; `df` is ignored
+    because the generator always starts a fresh results table.
+    """
+    args = parse_args(argv)
+    grid = build_grid(args.temperatures, args.max_tokens)
+    validate_grid(grid, args.samples)
+    jobs = build_jobs(grid, args.samples)
+    if args.dry_run:
+        dry_run(grid, jobs, args)
+        return df
+
+    set_stage("generator")
+    os.makedirs(artifacts_dir, exist_ok=True)
+    run_id = start_run(resume=args.resume)
+    print(f"🗂️ Run ID: {run_id}")
+    model = model or configure_model()
+    response_cache.configure(enabled=False if args.no_cache else None, resample=True if args.resample else None)
+    total_jobs = len(jobs)
+    if args.resume:
+        done = completed_keys(jsonl_file_path, CELL_KEY_COLUMNS)
+        jobs = [job for job in jobs if (job[0], job[2], job[3], job[4]) not in done]
+        print(f"🔁 Resuming: {total_jobs - len(jobs)} of {total_jobs} draws already in {jsonl_file_path}")
+
+    # Run all experiments, streaming each completed cell to disk
+    sweep_start = time.perf_counter()
+    tracker = make_sink(args.firestore)
+    try:
+        with JsonlResultsSink(jsonl_file_path, resume=args.resume) as sink:
+            if args.search == "halving":
+                print(f"🔍 Successive-halving search over {len(grid)} cells with concurrency={args.concurrency}")
+                run_jobs = lambda batch, on_row: run_sweep(model, batch, sink, tracker, args.concurrency, on_row)
+                quick_judge = QuickJudge(configure_model(args.judge_model), concurrency=args.concurrency)
+                search = successive_halving(grid, run_jobs, quick_judge, eta=args.eta, probe_tokens=args.probe_tokens,
+                                            max_rounds=args.max_rounds, patience=args.patience)
+                save_search_history(search_history_path, search)
+                failed = search["failed"]
+            elif args.batch_prediction != "off":
+                print(f"🔍 Submitting {len(jobs)} draws as a {args.batch_prediction} batch prediction job")
+                failed = run_batch_sweep(model, jobs, sink, tracker, args)
+            else:
+                print(f"🔍 Sweeping {len(jobs)} draws ({len(grid)} cells × {max(1, args.samples)} samples) with concurrency={args.concurrency}")
+                failed = run_sweep(model, jobs, sink, tracker, concurrency=args.concurrency)
+    finally:
+        tracker.close()
+    sweep_elapsed = time.perf_counter() - sweep_start
+    print_stats("generator.py")
+    if failed:
+        print(f"⚠️ WARNING: {failed} calls failed and were left out of the results. "
+              f"Re-run with --resume to retry them.")
+
+    # Save the sweep (with near-duplicate clusters) to the results store and export it to CSV (grid order)
+    df = assign_clusters(load_results(grid))
+    df[RUN_ID_COLUMN] = run_id
+    ResultsStore().replace(df)
+    recorded = record(lambda history: history.record_cells(run_id, prescore(df)))
+    if recorded is not None:
+        print(f"🗂️ History: recorded {recorded} draws of run {run_id}")
+    df.to_csv(csv_file_path, index=False)
+    stats = cell_stats(df)
+    stats.to_csv(cell_stats_path, index=False)
+    if args.samples > 1:
+        print(f"📊 Per-cell stats over {args.samples} samples (saved to {cell_stats_path}):")
+        print(stats.sort_values("Pre-Score Mean", ascending=False).head(10).to_string(index=False))
 
-# Run all experiments
-for prompt_type, prompt_text in prompt_types.items():
-    for temp in temperatures:
-        for max_tok in max_tokens:
-            run_experiment(prompt_type, prompt_text, temp, max_tok)
-            time.sleep(2)  # Avoid API rate limits
+    latencies = df["Latency (s)"].dropna()
+    if latencies.empty:
+        print(f"⏱️ Sweep wall time: {sweep_elapsed:.2f}s")
+    else:
+        print(f"⏱️ Sweep wall time: {sweep_elapsed:.2f}s | per-cell latency "
+              f"mean {latencies.mean():.2f}s, max {latencies.max():.2f}s, total {latencies.sum():.2f}s, "
+              f"queue wait {df['Queue Wait (s)'].fillna(0).sum():.2f}s")
+    print(f"✅ Experimentation Complete! Results exported to: {csv_file_path}")
 
-# Export results to CSV in the artifacts directory
-df = pd.DataFrame(results, columns=["Prompt Type", "Actual Prompt", "Temperature", "Max Tokens", "Response Text"])
-df.to_csv(csv_file_path, index=False)
+    # Verify file creation
+    if os.path.isfile(csv_file_path):
+        print(f"✅ File successfully written: {csv_file_path}")
+    else:
+        print(f"❌ ERROR: experiment_results.csv not found in {artifacts_dir}")
 
-print(f"✅ Experimentation Complete! Results exported to: {csv_file_path}")
+    return df
 
-# Verify file creation
-if os.path.isfile(csv_file_path):
-    print(f"✅ File successfully written: {csv_file_path}")
-else:
-    print(f"❌ ERROR: experiment_results.csv not found in {artifacts_dir}")
+if __name__ == "__main__":
+    main()
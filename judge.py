@@ -1,15 +1,104 @@
 #!/usr/bin/env python3
 """
 judge.py
---------------
+--------
+Reads artifacts/experiment_results.csv, asks Gemini 1.5 Pro to pick the best
+prompt, refines it, and writes artifacts/best_prompt.json and
+artifacts/best_prompt_reasoning.md.
+
+Judge modes, the refinement loop and context caching are described in the
+README.
+"""
+
 import os
 import json
-import pandas as pd
 import traceback
 import re
-import google.generativeai as genai
+import time
+import difflib
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from llm_client import (MODEL_NAME, generate, generate_detailed, configure_model, estimate_tokens, LLMCallError,
+                        print_stats, stats)
+from metrics import set_stage
+from results_store import ResultsStore, CORE_COLUMNS, load_results
+from prescore import PRESCORE_COLUMNS, select_top_k
+from dedup import DEFAULT_THRESHOLD, assign_clusters, representatives
+from experiment_history import RUN_ID_COLUMN, current_run_id, record, rows_of_run
+from tournament import DEFAULT_OPPONENTS, PairwiseJudge, RANKING_COLUMNS
+from tournament import preview as tournament_preview
+from context_cache import CACHE_KINDS, DEFAULT_KIND, DEFAULT_TTL_SECONDS, prefix_model
+from context_cache import print_stats as print_context_cache_stats
+from prompt_budget import (DEFAULT_PROMPT_BUDGET, DEFAULT_ROW_BUDGET, compact_json, count_tokens,
+                           fit_rows, pack_rows)
+
+# Hierarchical judging defaults
+DEFAULT_BATCH_SIZE = 8
+DEFAULT_JUDGE_CONCURRENCY = 4
+
+# Rows (by pre-score) that reach the LLM judge
+DEFAULT_TOP_K = 16
+
+# Generation settings of candidate executions (same as executioner.py) and drafts
+EXECUTION_CONFIG = {"temperature": 0.3, "max_output_tokens": 2048}
+DRAFT_TEMPERATURE = 0.9
 
-def main():
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Select and refine the best prompt from the experiment results.")
+    parser.add_argument("--judge-mode", choices=["hierarchical", "single", "tournament"], default="hierarchical",
+                        help="Judge in parallel batches and reduce the winners (default), send every row in "
+                             "one prompt, or rank the rows by cached pairwise comparisons.")
+    parser.add_argument("--opponents", type=int, default=DEFAULT_OPPONENTS,
+                        help="Tournament mode: comparisons each row needs (default: %(default)s).")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE,
+                        help="Rows per judge call in hierarchical mode (default: %(default)s).")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_JUDGE_CONCURRENCY,
+                        help="Batch judge calls in flight (default: %(default)s).")
+    parser.add_argument("--prompt-budget", type=int, default=DEFAULT_PROMPT_BUDGET,
+                        help="Maximum input tokens per judge prompt (default: %(default)s).")
+    parser.add_argument("--row-budget", type=int, default=DEFAULT_ROW_BUDGET,
+                        help="Maximum tokens of Response Text per row (default: %(default)s).")
+    parser.add_argument("--count-tokens", choices=["estimate", "model"], default="estimate",
+                        help="Check prompt sizes with a local estimate (default) or model.count_tokens.")
+    parser.add_argument("--context-cache", choices=CACHE_KINDS, default=DEFAULT_KIND,
+                        help="Upload the dataset once as cached content (auto picks the local stand-in for the "
+                             "mock backend and Gemini otherwise; default: %(default)s).")
+    parser.add_argument("--context-cache-ttl", type=int, default=DEFAULT_TTL_SECONDS,
+                        help="Seconds the cached dataset is kept (default: %(default)s).")
+    parser.add_argument("--top-k", type=int, default=DEFAULT_TOP_K,
+                        help="Send only the K best rows by pre-score to the judge; 0 keeps every valid, "
+                             "non-duplicate row (default: %(default)s).")
+    parser.add_argument("--cluster-threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="Similarity at which responses count as near-duplicates (default: %(default)s).")
+    parser.add_argument("--no-cluster", action="store_true",
+                        help="Send near-duplicate responses individually instead of one per cluster.")
+    parser.add_argument("--no-prescore", action="store_true",
+                        help="Judge every row without pre-scoring.")
+    parser.add_argument("--rounds", type=int, default=1,
+                        help="Maximum refinement rounds; 1 refines once without executing (default: %(default)s).")
+    parser.add_argument("--candidates", type=int, default=3,
+                        help="Refined candidates drafted and executed per round (default: %(default)s).")
+    parser.add_argument("--min-gain", type=float, default=0.0,
+                        help="Score gain a candidate needs to replace the incumbent (default: %(default)s).")
+    parser.add_argument("--min-edit-distance", type=float, default=0.05,
+                        help="Stop once the adopted prompt changes less than this normalized "
+                             "edit distance (default: %(default)s).")
+    parser.add_argument("--max-calls", type=int, default=None,
+                        help="Stop refining after this many LLM calls in the judge stage.")
+    parser.add_argument("--max-seconds", type=float, default=None,
+                        help="Stop refining after this many seconds.")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="Build the judge prompts and print the planned calls without calling the model.")
+    return parser.parse_args(argv)
+
+def main(argv=None, model=None, df=None):
+    """
+    Judges the results and returns them unchanged. When called in-process,
+    `model` is the shared Gemini client and `df` the results table, which
+    avoids re-reading experiment_results.csv.
+    """
+    args = parse_args(argv)
+    set_stage("judge")
     print("🔍 Debug: Starting judge.py")
 
     # Ensure artifacts directory exists
@@ -23,59 +112,250 @@ def main():
     best_prompt_file = os.path.join(artifacts_dir, "best_prompt.json")
     markdown_file_path = os.path.join(artifacts_dir, "best_prompt_reasoning.md")
 
-    print(f"🔍 Debug: Looking for CSV at '{csv_file_path}'")
-    if not os.path.isfile(csv_file_path):
-        print(f"❌ ERROR: '{csv_file_path}' not found. Run generator.py first.")
-        return
+    if df is None:
+        store = ResultsStore()
+        print(f"🔍 Debug: Looking for results in '{store.root}' (or '{csv_file_path}')")
+        if store.is_empty() and not os.path.isfile(csv_file_path):
+            raise FileNotFoundError(f"❌ ERROR: No results in '{store.root}' or '{csv_file_path}'. Run generator.py first.")
+
+        df = load_results(store, csv_file_path, columns=CORE_COLUMNS + PRESCORE_COLUMNS + [RUN_ID_COLUMN])
+        print(f"✅ Debug: {len(df)} result rows loaded from the {store.backend} store")
+    else:
+        print(f"✅ Debug: Using {len(df)} in-memory result rows")
+
+    # Generator rows of this run only ('ultimate' rows are outputs of earlier executions)
+    run_id = current_run_id()
+    candidates = rows_of_run(df, run_id)
+    candidates = candidates[candidates["Prompt Type"] != "ultimate"]
 
-    print("✅ Debug: CSV file found. Reading contents...")
-    df = pd.read_csv(csv_file_path)
-    print("✅ Debug: CSV loaded successfully")
-    experiment_data = df.to_dict(orient="records")
+    # One representative per near-duplicate cluster, then the top-K by the cheap local pre-score
+    judged = candidates if args.no_cluster else assign_clusters(candidates, args.cluster_threshold)
+    if args.no_prescore:
+        judged = judged if args.no_cluster else representatives(judged)
+    else:
+        judged = select_top_k(judged, args.top_k or None, keep_prompt_types=())
+    columns = CORE_COLUMNS + ([] if args.no_cluster else ["Cluster Size"])
+    experiment_data = judged[[column for column in columns if column in judged.columns]].to_dict(orient="records")
+    experiment_data = fit_rows(experiment_data, args.row_budget)
+    if args.dry_run:
+        dry_run(experiment_data, args)
+        return df
 
     # Configure Gemini 1.5 Pro
-    api_key = os.getenv("GEMINI_API_KEY")
-    if not api_key:
-        print("❌ ERROR: GEMINI_API_KEY not set.")
-        return
-
-    print("✅ Debug: GEMINI_API_KEY detected, configuring API...")
-    genai.configure(api_key=api_key)
-    model = genai.GenerativeModel("gemini-1.5-pro")
+    model = model or configure_model()
     print("✅ Debug: Gemini model configured")
 
     # Step 1: Identify the Best Prompt
     print("🔍 Debug: Asking LLM to select the best prompt based on outputs...")
-    selection_prompt = build_judge_prompt(experiment_data)
-    raw_judge_response = call_llm(model, selection_prompt)
-    best_prompt_data = parse_judge_json(raw_judge_response)
+    token_model = model if args.count_tokens == "model" else None
+    context_model = None
+    if args.judge_mode == "tournament":
+        best_prompt_data = run_tournament(model, experiment_data, args.opponents, args.concurrency)
+    else:
+        # Single mode only splits the dataset when it exceeds the prompt budget
+        batch_size = args.batch_size if args.judge_mode == "hierarchical" else max(2, len(experiment_data))
+        if args.context_cache != "off":
+            experiment_data = [dict(row, Row=index) for index, row in enumerate(experiment_data)]
+            context_model = cache_candidates(model, experiment_data, args, token_model)
+        experiment_data = reduce_candidates(model, experiment_data, batch_size, args.concurrency,
+                                            args.prompt_budget, token_model, context_model)
+        selection_prompt = build_judge_prompt(experiment_data, context_model is not None)
+        raw_judge_response = call_llm(context_model or model, selection_prompt)
+        best_prompt_data = parse_judge_json(raw_judge_response)
 
     # Step 2: Refine the Best Prompt
     print("🔍 Debug: Asking LLM to refine the best prompt if needed...")
-    refined_prompt = refine_best_prompt(model, best_prompt_data)
+    if args.rounds > 1:
+        refined_prompt = refinement_loop(model, best_prompt_data, args)
+    else:
+        refined_prompt = refine_best_prompt(context_model or model, best_prompt_data, context_model is not None)
     best_prompt_data["ultimate_prompt"] = refined_prompt
+    source = selected_row(best_prompt_data.get("best_prompt", ""), experiment_data)
+    if run_id:
+        best_prompt_data["run_id"] = run_id
+    if source is not None:
+        best_prompt_data["source_cell"] = {key: source[key] for key in ("Prompt Type", "Temperature", "Max Tokens")}
+    if run_id:
+        record(lambda history: history.record_event(
+            run_id, "selection", input_text=best_prompt_data.get("best_prompt", ""), output_text=refined_prompt,
+            cell_id=None if source is None else history.find_cell(
+                run_id, source["Prompt Type"], source["Temperature"], source["Max Tokens"]),
+            note=str(best_prompt_data.get("reasoning", ""))[:500]))
 
     # Step 3: Save best prompt & reasoning
     save_json(best_prompt_file, best_prompt_data)
     save_markdown(markdown_file_path, best_prompt_data)
 
+    print_stats("judge.py")
+    print_context_cache_stats("judge.py context cache")
     print("✅ judge.py: Successfully completed!")
+    return df
+
+def run_tournament(model, experiment_data, opponents=DEFAULT_OPPONENTS, concurrency=DEFAULT_JUDGE_CONCURRENCY,
+                   ranking_path=os.path.join("artifacts", "tournament_ranking.csv")):
+    """
+    Ranks the candidates pairwise and returns the top row as the judge's selection.
+    """
+    import pandas as pd
+
+    if not experiment_data:
+        raise ValueError("❌ ERROR: No candidates to rank in the tournament. Check if generator.py ran correctly.")
+    ranked = PairwiseJudge(model, concurrency=concurrency).rank(experiment_data, opponents)
+    columns = ["Prompt Type", "Temperature", "Max Tokens"] + RANKING_COLUMNS
+    pd.DataFrame(ranked).reindex(columns=columns).to_csv(ranking_path, index=False)
+    best = ranked[0]
+    print(f"🏆 Top-rated: {best['Prompt Type']} | Temp: {best['Temperature']} | Max Tokens: {best['Max Tokens']} "
+          f"(rating {best['Rating']}); ranking saved to {ranking_path}")
+    return {
+        "best_prompt": best["Actual Prompt"],
+        "reasoning": (f"Highest Bradley-Terry rating ({best['Rating']}) in a pairwise tournament over "
+                      f"{len(ranked)} responses: {best['Wins']} wins, {best['Losses']} losses, {best['Ties']} ties."),
+    }
+
+def build_dataset_block(experiment_data):
+    """
+    The dataset as placed in the context cache, or inline when caching is off.
+    """
+    return f"""DATASET: {compact_json(experiment_data)}
 
-def build_judge_prompt(experiment_data):
+A row with a "Cluster Size" above 1 stands for that many near-identical responses."""
+
+def cached_rows_reference(rows):
+    return f'the rows of the DATASET above whose "Row" is one of {[row["Row"] for row in rows]}'
+
+def build_judge_prompt(experiment_data, dataset_cached=False):
+    dataset = f"Consider {cached_rows_reference(experiment_data)}." if dataset_cached else build_dataset_block(experiment_data)
     return f"""You are an AI judge evaluating prompt effectiveness based on output quality. Identify the best prompt, explain why it is the best, and then refine it for clarity and effectiveness.
 
-DATASET: {json.dumps(experiment_data, indent=2)}
+{dataset}
 
 Please return ONLY a JSON object with exactly three keys: "best_prompt", "reasoning", and "ultimate_prompt". Do not include any additional text or formatting."""
 
+def build_batch_judge_prompt(batch, dataset_cached=False):
+    if dataset_cached:
+        dataset = f"Consider only {cached_rows_reference(batch)}."
+    else:
+        dataset = build_dataset_block([dict(row, Row=index) for index, row in enumerate(batch)])
+    return f"""You are an AI judge evaluating prompt effectiveness based on output quality. Each row is one prompt run; judge the Requirements Analysis in "Response Text" for structure, completeness and clarity.
+
+{dataset}
+
+Please return ONLY a JSON object with exactly three keys: "best_row" (the integer "Row" of the best entry), "score" (0-10), and "reasoning". Do not include any additional text or formatting."""
+
+def cache_candidates(model, rows, args, token_model=None):
+    """
+    Places every candidate (with its "Row" number) in the context cache when
+    the block and the largest prompt that refers to it fit the prompt budget
+    together. The map-step batches, the final selection and the refinement then
+    share it. Returns the cached model, or None to judge inline.
+    """
+    block = build_dataset_block(rows)
+    size = count_tokens(block, token_model) + count_tokens(build_judge_prompt(rows, dataset_cached=True), token_model)
+    if size > args.prompt_budget:
+        print(f"💾 Context cache: the candidates need ~{size:,} tokens, more than the prompt budget of "
+              f"{args.prompt_budget:,}; judging them in inline batches")
+        return None
+    return prefix_model(model, block, kind=args.context_cache, ttl_seconds=args.context_cache_ttl,
+                        prompt_budget=args.prompt_budget)
+
+def judge_batch(model, batch, dataset_cached=False):
+    """
+    Map step: returns the winning row of one batch.
+    """
+    if len(batch) == 1:
+        return batch[0]
+    verdict = parse_judge_json(call_llm(model, build_batch_judge_prompt(batch, dataset_cached)))
+    try:
+        if dataset_cached:
+            return {row["Row"]: row for row in batch}[int(verdict["best_row"])]
+        return batch[int(verdict["best_row"])]
+    except (KeyError, ValueError, TypeError, IndexError):
+        print("⚠️ WARNING: Batch verdict had no valid 'best_row'; keeping the first row of the batch.")
+        return batch[0]
+
+def reduce_candidates(model, experiment_data, batch_size=DEFAULT_BATCH_SIZE, concurrency=DEFAULT_JUDGE_CONCURRENCY,
+                      prompt_budget=DEFAULT_PROMPT_BUDGET, token_model=None, context_model=None):
+    """
+    Repeatedly judges batches of at most `batch_size` rows (and `prompt_budget`
+    tokens) in parallel and keeps only the batch winners, until the survivors
+    fit into a single final judge prompt. With a `context_model` every row is
+    already cached (see cache_candidates), so batches only name their rows.
+    """
+    candidates = list(experiment_data)
+    dataset_cached = context_model is not None
+    plan = cached_batches if dataset_cached else plan_batches
+    batches = plan(candidates, batch_size, prompt_budget, token_model)
+    level = 1
+    while batches:
+        print(f"🔍 Debug: Judge round {level}: {len(candidates)} rows in {len(batches)} batches")
+        with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+            candidates = list(pool.map(lambda batch: judge_batch(context_model or model, batch, dataset_cached),
+                                       batches))
+        batches = plan(candidates, batch_size, prompt_budget, token_model)
+        level += 1
+    print(f"🔍 Debug: Final judge round over {len(candidates)} batch winners")
+    return candidates
+
+def cached_batches(candidates, batch_size=DEFAULT_BATCH_SIZE, prompt_budget=None, token_model=None):
+    """
+    The batches of the next map round over cached rows, or [] once at most
+    `batch_size` remain; the budget was checked when the rows were cached.
+    """
+    batch_size = max(2, batch_size)
+    if len(candidates) <= batch_size:
+        return []
+    return [candidates[i:i + batch_size] for i in range(0, len(candidates), batch_size)]
+
+def plan_batches(candidates, batch_size=DEFAULT_BATCH_SIZE, prompt_budget=DEFAULT_PROMPT_BUDGET, token_model=None):
+    """
+    The batches of the next map round, or [] once the candidates fit into the
+    final judge prompt.
+    """
+    batch_size = max(2, batch_size)
+    if len(candidates) <= 1 or (len(candidates) <= batch_size and
+                                count_tokens(build_judge_prompt(candidates), token_model) <= prompt_budget):
+        return []
+    batches = pack_rows(candidates, prompt_budget, count_tokens(build_batch_judge_prompt([])), max_rows=batch_size)
+    if len(batches) == len(candidates):
+        # Every row fills a prompt on its own; pair them up so the round still shrinks
+        batches = [candidates[i:i + 2] for i in range(0, len(candidates), 2)]
+    return batches
+
+def dry_run(experiment_data, args):
+    """
+    Prints the judge calls the selection and refinement would make and the size
+    of their prompts, without configuring a model. Map rounds after the first
+    are estimated with the first row of every batch standing in for its winner.
+    """
+    mode = args.judge_mode
+    if mode == "tournament":
+        calls, tokens = tournament_preview(experiment_data, f"models/{MODEL_NAME}", args.opponents)
+    else:
+        # Single mode only splits the dataset when it exceeds the prompt budget
+        batch_size = args.batch_size if mode == "hierarchical" else max(2, len(experiment_data))
+        calls, tokens, candidates = 0, 0, list(experiment_data)
+        batches = plan_batches(candidates, batch_size, args.prompt_budget)
+        while batches:
+            judged = [batch for batch in batches if len(batch) > 1]
+            calls += len(judged)
+            tokens += sum(estimate_tokens(build_batch_judge_prompt(batch)) for batch in judged)
+            print(f"🧪 Judge round: {len(candidates)} rows in {len(batches)} batches")
+            candidates = [batch[0] for batch in batches]
+            batches = plan_batches(candidates, batch_size, args.prompt_budget)
+        selection = estimate_tokens(build_judge_prompt(candidates))
+        calls, tokens = calls + 1, tokens + selection
+        print(f"🧪 Final round: {len(candidates)} rows, ~{selection:,} of {args.prompt_budget:,} budget tokens")
+    refinement = 1 if args.rounds <= 1 else 1 + args.rounds * (2 * max(1, args.candidates) + 1)
+    print(f"🧪 Dry run ({mode}): {calls} judge calls, ~{tokens:,} input tokens, plus up to {refinement} "
+          f"refinement calls; no model calls made.")
+
 def call_llm(model, prompt_text):
     try:
-        response = model.generate_content(prompt_text)
-        return response.text.strip() if response.text else "No response."
-    except Exception as e:
+        return generate(model, prompt_text) or "No response."
+    except LLMCallError as e:
         print(f"❌ Error in LLM call: {e}")
         print(traceback.format_exc())
-        return f"Error: {e}"
+        raise
 
 def parse_judge_json(response_text):
     try:
@@ -90,14 +370,135 @@ def parse_judge_json(response_text):
         print("❌ ERROR: Could not parse JSON from judge response.")
         return {}
 
-def refine_best_prompt(model, best_prompt_data):
+def refine_best_prompt(model, best_prompt_data, dataset_cached=False):
+    context = ("\nThe DATASET above shows how each prompt performed; address the weaknesses it reveals.\n"
+               if dataset_cached else "")
     refinement_prompt = f"""You are tasked with refining the following prompt for clarity and effectiveness.
-
+{context}
 Best Prompt: {best_prompt_data.get('best_prompt', '').strip()}
 
 Please return ONLY the refined prompt as a plain text string."""
     return call_llm(model, refinement_prompt).strip()
 
+def selected_row(best_prompt, rows):
+    """
+    The candidate row whose Actual Prompt is (closest to) the judge's best prompt.
+    """
+    best_prompt = str(best_prompt).strip()
+    if not rows:
+        return None
+    for row in rows:
+        if str(row["Actual Prompt"]).strip() == best_prompt:
+            return row
+    return min(rows, key=lambda row: edit_distance(str(row["Actual Prompt"]), best_prompt))
+
+def edit_distance(a, b):
+    """
+    Normalized word-level edit distance between two prompts (0 = identical, 1 = disjoint).
+    """
+    return 1.0 - difflib.SequenceMatcher(None, a.split(), b.split(), autojunk=False).ratio()
+
+def draft_candidate(model, prompt_text, index):
+    """
+    Drafts one refinement of `prompt_text`. `index` keeps the drafts of a round
+    distinct in the response cache.
+    """
+    refinement_prompt = f"""You are tasked with refining the following prompt for clarity and effectiveness.
+
+Best Prompt: {prompt_text.strip()}
+
+Please return ONLY the refined prompt as a plain text string."""
+    text, _ = generate_detailed(model, refinement_prompt, generation_config={"temperature": DRAFT_TEMPERATURE},
+                                sample=index)
+    return text.strip()
+
+def execute_prompt(model, prompt_text):
+    return generate(model, prompt_text, generation_config=EXECUTION_CONFIG) or "No Response"
+
+def build_round_judge_prompt(incumbent, candidates):
+    rows = [{"Row": 0, "Prompt": incumbent["prompt"], "Response Text": incumbent["response"]}]
+    rows += [{"Row": index, "Prompt": candidate["prompt"], "Response Text": candidate["response"]}
+             for index, candidate in enumerate(candidates, start=1)]
+    return f"""You are an AI judge comparing prompts by the Requirements Analysis each produced. Row 0 is the current best prompt; the other rows are refinements of it. Judge each "Response Text" for structure, completeness and clarity.
+
+DATASET: {compact_json(rows)}
+
+Please return ONLY a JSON object with exactly four keys: "best_row" (the integer "Row" of the best entry), "best_score" (0-10), "incumbent_score" (0-10, for Row 0), and "reasoning". Do not include any additional text or formatting."""
+
+def refinement_loop(model, best_prompt_data, args, history_path=os.path.join("artifacts", "refinement_history.csv")):
+    """
+    Refine -> execute candidates in parallel -> judge against the incumbent,
+    until convergence or the call/time budget runs out. Returns the final prompt.
+    The loop stops when no candidate beats the incumbent by more than
+    --min-gain, when the adopted prompt changed less than --min-edit-distance,
+    or when --max-calls / --max-seconds is spent; every round is written to
+    `history_path`.
+    """
+    import pandas as pd
+
+    start_time = time.perf_counter()
+    start_calls = stats["calls"]
+    incumbent_prompt = best_prompt_data.get("best_prompt", "").strip()
+    if not incumbent_prompt:
+        print("⚠️ WARNING: No best prompt to iterate on; refining once instead.")
+        return refine_best_prompt(model, best_prompt_data)
+    incumbent = {"prompt": incumbent_prompt, "response": execute_prompt(model, incumbent_prompt)}
+    history = [{"Round": 0, "Candidate": 0, "Prompt": incumbent_prompt, "Response Text": incumbent["response"],
+                "Score": None, "Selected": True, "Edit Distance": None}]
+
+    def out_of_budget():
+        calls = stats["calls"] - start_calls
+        elapsed = time.perf_counter() - start_time
+        return ((args.max_calls is not None and calls >= args.max_calls)
+                or (args.max_seconds is not None and elapsed >= args.max_seconds))
+
+    stop_reason = f"reached {args.rounds} rounds"
+    for round_number in range(1, args.rounds + 1):
+        if out_of_budget():
+            stop_reason = "call/time budget spent"
+            break
+
+        def draft_and_execute(index):
+            prompt_text = draft_candidate(model, incumbent["prompt"], (round_number - 1) * args.candidates + index)
+            return {"prompt": prompt_text, "response": execute_prompt(model, prompt_text)}
+
+        with ThreadPoolExecutor(max_workers=max(1, min(args.concurrency, args.candidates))) as pool:
+            candidates = list(pool.map(draft_and_execute, range(1, max(1, args.candidates) + 1)))
+
+        verdict = parse_judge_json(call_llm(model, build_round_judge_prompt(incumbent, candidates)))
+        try:
+            best_row = int(verdict.get("best_row", 0))
+            gain = float(verdict.get("best_score", 0)) - float(verdict.get("incumbent_score", 0))
+        except (TypeError, ValueError):
+            best_row, gain = 0, 0.0
+        improved = 1 <= best_row <= len(candidates) and gain > args.min_gain
+        distances = [edit_distance(incumbent["prompt"], candidate["prompt"]) for candidate in candidates]
+        winner = candidates[best_row - 1] if improved else None
+        distance = distances[best_row - 1] if improved else 0.0
+
+        for index, candidate in enumerate(candidates, start=1):
+            history.append({"Round": round_number, "Candidate": index, "Prompt": candidate["prompt"],
+                            "Response Text": candidate["response"],
+                            "Score": verdict.get("best_score") if index == best_row else None,
+                            "Selected": improved and index == best_row,
+                            "Edit Distance": round(distances[index - 1], 4)})
+        print(f"🔁 Refinement round {round_number}: {len(candidates)} candidates, "
+              + (f"candidate {best_row} adopted (+{gain:.2f}, edit distance {distance:.3f})" if improved
+                 else "incumbent kept"))
+
+        if not improved:
+            stop_reason = "no score improvement"
+            break
+        incumbent = winner
+        if distance < args.min_edit_distance:
+            stop_reason = f"prompt changed less than {args.min_edit_distance} edit distance"
+            break
+
+    pd.DataFrame(history).to_csv(history_path, index=False)
+    print(f"✅ Refinement stopped ({stop_reason}) after {stats['calls'] - start_calls} calls and "
+          f"{time.perf_counter() - start_time:.1f}s; history saved to {history_path}")
+    return incumbent["prompt"]
+
 def save_json(filepath, data):
     with open(filepath, "w") as f:
         json.dump(data, f, indent=2)
@@ -12,12 +12,60 @@ Outputs a structured Markdown report to artifacts/final_analysis_report.md.
 """
 
 import os
-import json
-import pandas as pd
 import traceback
-import google.generativeai as genai
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from llm_client import MODEL_NAME, generate, configure_model, estimate_tokens, LLMCallError, print_stats
+from metrics import set_stage
+from results_store import ResultsStore, CORE_COLUMNS, load_results
+from prescore import PRESCORE_COLUMNS, select_top_k
+from dedup import DEFAULT_THRESHOLD, assign_clusters, representatives
+from experiment_history import RUN_ID_COLUMN, current_run_id, record, rows_of_run
+from tournament import DEFAULT_OPPONENTS, PairwiseJudge
+from tournament import preview as tournament_preview
+from prompt_budget import (DEFAULT_PROMPT_BUDGET, DEFAULT_ROW_BUDGET, compact_json, count_tokens,
+                           fit_rows, pack_rows)
 
-def main():
+# Rows (by pre-score) that reach the jury besides the 'ultimate' rows
+DEFAULT_TOP_K = 12
+
+# Partial analyses in flight when the dataset is split
+DEFAULT_JURY_CONCURRENCY = 4
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Write the final analysis report over all results.")
+    parser.add_argument("--prompt-budget", type=int, default=DEFAULT_PROMPT_BUDGET,
+                        help="Maximum input tokens per analysis prompt (default: %(default)s).")
+    parser.add_argument("--row-budget", type=int, default=DEFAULT_ROW_BUDGET,
+                        help="Maximum tokens of Response Text per row (default: %(default)s).")
+    parser.add_argument("--count-tokens", choices=["estimate", "model"], default="estimate",
+                        help="Check prompt sizes with a local estimate (default) or model.count_tokens.")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_JURY_CONCURRENCY,
+                        help="Partial analyses in flight when the dataset is split (default: %(default)s).")
+    parser.add_argument("--tournament", action="store_true",
+                        help="Rate the rows by cached pairwise comparisons and include the ratings in the dataset.")
+    parser.add_argument("--opponents", type=int, default=DEFAULT_OPPONENTS,
+                        help="With --tournament: comparisons each row needs (default: %(default)s).")
+    parser.add_argument("--top-k", type=int, default=DEFAULT_TOP_K,
+                        help="Send the 'ultimate' rows plus the K best other rows by pre-score; "
+                             "0 keeps every valid, non-duplicate row (default: %(default)s).")
+    parser.add_argument("--cluster-threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="Similarity at which responses count as near-duplicates (default: %(default)s).")
+    parser.add_argument("--no-cluster", action="store_true",
+                        help="Send near-duplicate responses individually instead of one per cluster.")
+    parser.add_argument("--no-prescore", action="store_true",
+                        help="Send every row without pre-scoring.")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="Build the analysis prompt(s) and print the planned calls without calling the model.")
+    return parser.parse_args(argv)
+
+def main(argv=None, model=None, df=None):
+    """
+    Writes the final analysis report and returns the results table unchanged.
+    In-process callers pass the shared `model` and the in-memory results `df`.
+    """
+    args = parse_args(argv)
+    set_stage("jury")
     # Ensure artifacts directory exists
     artifacts_dir = "artifacts"
     if not os.path.exists(artifacts_dir):
@@ -32,43 +80,60 @@ def main():
     print(f"   - CSV Input: {csv_file_path}")
     print(f"   - Markdown Output: {markdown_file_path}")
 
-    # 1) Read experiment_results.csv
-    if not os.path.isfile(csv_file_path):
-        raise FileNotFoundError(f"❌ ERROR: '{csv_file_path}' not found. Run generator.py first.")
+    # 1) Read the results store (unless the pipeline handed us the table)
+    if df is None:
+        store = ResultsStore()
+        if store.is_empty() and not os.path.isfile(csv_file_path):
+            raise FileNotFoundError(f"❌ ERROR: No results in '{store.root}' or '{csv_file_path}'. Run generator.py first.")
 
-    df = pd.read_csv(csv_file_path)
+        df = load_results(store, csv_file_path, columns=CORE_COLUMNS + PRESCORE_COLUMNS + [RUN_ID_COLUMN])
 
     # Ensure the dataset is not empty
     if df.empty:
         raise ValueError(f"❌ ERROR: '{csv_file_path}' is empty. Check if generator.py ran correctly.")
 
-    experiment_data = df.to_dict(orient="records")
+    # Rows of this run only; one representative per near-duplicate cluster; keep the 'ultimate' rows plus the
+    # top-K others by pre-score
+    run_id = current_run_id()
+    reviewed = rows_of_run(df, run_id)
+    reviewed = reviewed if args.no_cluster else assign_clusters(reviewed, args.cluster_threshold)
+    if args.no_prescore:
+        reviewed = reviewed if args.no_cluster else representatives(reviewed, keep_prompt_types=("ultimate",))
+    else:
+        reviewed = select_top_k(reviewed, args.top_k or None)
+    columns = CORE_COLUMNS + ([] if args.no_cluster else ["Cluster Size"])
+    experiment_data = reviewed[[column for column in columns if column in reviewed.columns]].to_dict(orient="records")
+    experiment_data = fit_rows(experiment_data, args.row_budget)
+    if args.dry_run:
+        dry_run(experiment_data, args)
+        return df
 
     # 2) Configure Gemini 1.5 Pro
-    api_key = os.getenv("GEMINI_API_KEY")
-    if not api_key:
-        raise ValueError("❌ ERROR: GEMINI_API_KEY not set.")
-    genai.configure(api_key=api_key)
-    model = genai.GenerativeModel("gemini-1.5-pro")
-
-    # 3) Build the final analysis prompt
-    final_analysis_prompt = build_final_analysis_prompt(experiment_data)
-
-    # 4) Call the LLM with a higher max token limit
-    final_analysis_text = call_llm(
-        model=model,
-        prompt_text=final_analysis_prompt,
-        temperature=0.2,  # Keep low for analysis
-        max_tokens=2048  # Increased from 1024 to avoid truncation
+    model = model or configure_model()
+    if args.tournament:
+        ranked = PairwiseJudge(model, concurrency=args.concurrency).rank(experiment_data, args.opponents)
+        experiment_data = [{key: value for key, value in row.items() if key in columns + ["Rating"]}
+                           for row in ranked]
+
+    # 3-4) Build the final analysis prompt(s) and call the LLM
+    final_analysis_text = run_analysis(
+        model,
+        experiment_data,
+        prompt_budget=args.prompt_budget,
+        token_model=model if args.count_tokens == "model" else None,
+        concurrency=args.concurrency
     )
 
-    # Ensure response is valid
-    if "Error:" in final_analysis_text or final_analysis_text.strip() == "":
-        raise ValueError("❌ ERROR: LLM response was empty or contained an error.")
+    # Failed calls raise LLMCallError, so only an empty analysis is left to reject
+    if not final_analysis_text.strip():
+        raise ValueError("❌ ERROR: LLM response was empty.")
 
     # 5) Save the analysis in Markdown format
     save_markdown(markdown_file_path, final_analysis_text)
+    if run_id:
+        record(lambda history: history.record_event(run_id, "verdict", output_text=final_analysis_text))
 
+    print_stats("jury.py")
     print(f"\n✅ jury.py: Successfully created '{markdown_file_path}'.\n")
     print("🔍 Analysis Preview:\n")
     print(final_analysis_text[:500], "...\n")  # Print first 500 chars as a preview
@@ -79,12 +144,68 @@ def main():
     else:
         print(f"❌ ERROR: Markdown file missing after writing. Check jury.py.")
 
-def build_final_analysis_prompt(experiment_data):
+    return df
+
+def run_analysis(model, experiment_data, prompt_budget=DEFAULT_PROMPT_BUDGET, token_model=None,
+                 concurrency=DEFAULT_JURY_CONCURRENCY):
+    """
+    Returns the final analysis text. A dataset that exceeds `prompt_budget` is
+    split into parts that are analysed in parallel and then merged.
+    """
+    prompts, split = analysis_prompts(experiment_data, prompt_budget, token_model)
+    if not split:
+        return call_llm(model=model, prompt_text=prompts[0],
+                        temperature=0.2,  # Keep low for analysis
+                        max_tokens=2048)  # Increased from 1024 to avoid truncation
+
+    print(f"✂️ Prompt budget: dataset exceeds {prompt_budget} tokens; analysing it in {len(prompts)} parts")
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+        partial_analyses = list(pool.map(
+            lambda part_prompt: call_llm(model=model, prompt_text=part_prompt, temperature=0.2, max_tokens=2048),
+            prompts))
+    return call_llm(model=model, prompt_text=build_merge_prompt(partial_analyses), temperature=0.2, max_tokens=2048)
+
+def analysis_prompts(experiment_data, prompt_budget=DEFAULT_PROMPT_BUDGET, token_model=None):
+    """
+    Returns (prompts, split): the single analysis prompt, or one prompt per
+    part when the dataset exceeds `prompt_budget`.
+    """
+    prompt = build_final_analysis_prompt(experiment_data)
+    if count_tokens(prompt, token_model) <= prompt_budget:
+        return [prompt], False
+    ultimate = [row for row in experiment_data if row.get("Prompt Type") == "ultimate"]
+    others = [row for row in experiment_data if row.get("Prompt Type") != "ultimate"]
+    overhead = count_tokens(build_final_analysis_prompt(ultimate, part=(1, 1)))
+    chunks = pack_rows(others, prompt_budget, overhead)
+    return [build_final_analysis_prompt(ultimate + chunk, part=(number, len(chunks)))
+            for number, chunk in enumerate(chunks, start=1)], True
+
+def dry_run(experiment_data, args):
+    """
+    Prints the analysis calls the report would take and the size of their
+    prompts, without configuring a model.
+    """
+    calls, tokens = 0, 0
+    if args.tournament:
+        calls, tokens = tournament_preview(experiment_data, f"models/{MODEL_NAME}", args.opponents)
+    prompts, split = analysis_prompts(experiment_data, args.prompt_budget)
+    sizes = [estimate_tokens(prompt) for prompt in prompts]
+    calls, tokens = calls + len(prompts) + (1 if split else 0), tokens + sum(sizes)
+    print(f"🧪 Analysis: {len(prompts)} prompt(s) of at most ~{max(sizes):,} tokens"
+          + (" plus a merge call" if split else "") + f" (budget {args.prompt_budget:,})")
+    print(f"🧪 Dry run: {calls} calls, ~{tokens:,} input tokens; no model calls made.")
+
+def build_final_analysis_prompt(experiment_data, part=None):
     """
     Construct a prompt that instructs the LLM to re-evaluate the entire dataset,
     focusing on whether the 'ultimate' prompt truly remains best, 
     or if there are any interesting runner-ups or issues with other techniques.
+    `part` = (number, total) marks one part of a split dataset.
     """
+    scope = ""
+    if part:
+        scope = (f"\nThis is part {part[0]} of {part[1]} of the dataset (the 'ultimate' rows are included in every part); "
+                 f"analyse only the rows below, a later step merges the parts.\n")
 
     prompt = f"""
 You are a senior AI consultant. You have the final experiment data from multiple prompt engineering runs,
@@ -95,9 +216,29 @@ including a newly added 'ultimate' prompt. Please perform a thorough final analy
 3) Discuss how different prompt engineering strategies (Zero-Shot, Few-Shots, CoT, Meta-Prompting) compare,
    referencing any common mistakes or noteworthy highlights from the dataset.
 4) Offer overall recommendations or lessons learned about prompt engineering for requirements analysis.
+{scope}
+DATASET (each row includes 'Prompt Type', 'Actual Prompt', 'Temperature', 'Max Tokens', 'Response Text';
+'Cluster Size', when present, is the number of near-identical responses the row stands for; 'Rating', when
+present, is the row's Elo-scale rating from pairwise comparisons, 1500 being average):
+{compact_json(experiment_data)}
+
+Output a detailed analysis as a structured Markdown document with headings and bullet points.
+"""
+    return prompt.strip()
+
+def build_merge_prompt(partial_analyses):
+    """
+    Prompt that merges the analyses of the parts of a split dataset into one report.
+    """
+    parts = "\n\n".join(f"--- PART {number} ---\n{analysis}" for number, analysis in enumerate(partial_analyses, start=1))
+    prompt = f"""
+You are a senior AI consultant. The experiment dataset was too large for one request, so it was analysed in
+{len(partial_analyses)} parts (each compared against the 'ultimate' prompt). Merge the partial analyses below into
+one final analysis: whether the 'ultimate' prompt truly delivers the best Requirements Analysis outcome, the most
+interesting runner-ups and weak approaches, how the prompt engineering strategies compare, and overall recommendations.
+Resolve contradictions between parts and do not repeat points.
 
-DATASET (each row includes 'Prompt Type', 'Actual Prompt', 'Temperature', 'Max Tokens', 'Response Text'):
-{json.dumps(experiment_data, indent=2)}
+{parts}
 
 Output a detailed analysis as a structured Markdown document with headings and bullet points.
 """
@@ -108,7 +249,8 @@ def call_llm(model, prompt_text, temperature, max_tokens):
     Calls Gemini 1.5 Pro with the final analysis prompt. Returns a textual commentary.
     """
     try:
-        response = model.generate_content(
+        response_text = generate(
+            model,
             prompt_text,
             generation_config={
                 "temperature": temperature,
@@ -116,15 +258,15 @@ def call_llm(model, prompt_text, temperature, max_tokens):
             }
         )
 
-        if response.text:
-            print(f"✅ Analysis Preview (First 200 chars): {response.text.strip()[:200]}...")
+        if response_text:
+            print(f"✅ Analysis Preview (First 200 chars): {response_text[:200]}...")
 
-        return response.text.strip() if response.text else "No analysis produced."
+        return response_text or "No analysis produced."
 
-    except Exception as e:
+    except LLMCallError as e:
         print(f"❌ ERROR: LLM call failed: {e}")
         print(traceback.format_exc())  
-        return f"Error: {e}"
+        raise
 
 def save_markdown(filepath, content):
     """
@@ -0,0 +1,434 @@
+#!/usr/bin/env python3
+"""
+llm_client.py
+-------------
+Shared Gemini calling layer used by generator.py, judge.py, executioner.py and jury.py.
+
+- A process-wide token bucket enforces a requests-per-minute and a
+  tokens-per-minute budget (GEMINI_RPM / GEMINI_TPM).
+- Quota (429) and transient (5xx / timeout) errors are retried with jittered
+  exponential backoff; a quota error also pauses every caller sharing the bucket.
+- Calls that still fail raise LLMCallError instead of returning "Error: ..." text.
+- Successful responses are stored in the on-disk response cache (response_cache.py)
+  and repeated calls with the same model, prompt and generation_config are served from it.
+- Every call is recorded by metrics.py (latency, tokens, finish reason, retries, cost)
+  and emits call_start / call_retry / call_end events (events.py).
+"""
+
+import os
+import time
+import random
+import threading
+import backends
+import response_cache
+import metrics
+import events
+
+# Quota configuration (defaults are conservative; raise them to match your project's quota)
+DEFAULT_RPM = int(os.getenv("GEMINI_RPM", "60"))
+DEFAULT_TPM = int(os.getenv("GEMINI_TPM", "1000000"))
+MAX_RETRIES = int(os.getenv("GEMINI_MAX_RETRIES", "6"))
+BACKOFF_BASE_SECONDS = float(os.getenv("GEMINI_BACKOFF_BASE", "1.0"))
+BACKOFF_MAX_SECONDS = float(os.getenv("GEMINI_BACKOFF_MAX", "60.0"))
+
+MODEL_NAME = "gemini-1.5-pro"
+
+# Output tokens reserved against the TPM budget when a call sets no max_output_tokens
+DEFAULT_OUTPUT_TOKEN_ESTIMATE = 2048
+
+# HTTP and gRPC statuses of quota and transient server errors
+RETRYABLE_STATUS_CODES = (429, 500, 503, 504)
+RETRYABLE_GRPC_STATUSES = ("RESOURCE_EXHAUSTED", "UNAVAILABLE", "DEADLINE_EXCEEDED", "INTERNAL")
+QUOTA_STATUSES = (429, "RESOURCE_EXHAUSTED")
+
+# Error messages that identify a retryable failure when neither the type nor a status code is known
+RETRYABLE_MARKERS = ("resource has been exhausted", "quota", "deadline exceeded", "unavailable")
+
+
+class LLMCallError(RuntimeError):
+    """Raised when a Gemini call fails permanently or exhausts its retries."""
+
+
+class RateLimiter:
+    """
+    Thread-safe token bucket holding two budgets: requests and tokens per minute.
+    Both refill continuously, so bursts up to the per-minute budget are allowed.
+    """
+
+    def __init__(self, requests_per_minute=DEFAULT_RPM, tokens_per_minute=DEFAULT_TPM):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self._request_allowance = float(requests_per_minute)
+        self._token_allowance = float(tokens_per_minute)
+        self._last_refill = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+        self.throttled_seconds = 0.0
+
+    def _refill(self, now):
+        elapsed = now - self._last_refill
+        self._last_refill = now
+        self._request_allowance = min(self.requests_per_minute,
+                                      self._request_allowance + elapsed * self.requests_per_minute / 60.0)
+        self._token_allowance = min(self.tokens_per_minute,
+                                    self._token_allowance + elapsed * self.tokens_per_minute / 60.0)
+
+    def acquire(self, tokens):
+        """
+        Blocks until one request and `tokens` tokens are available, then consumes them.
+        """
+        tokens = min(tokens, self.tokens_per_minute)
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                wait = self._paused_until - now
+                if wait <= 0:
+                    request_deficit = 1 - self._request_allowance
+                    token_deficit = tokens - self._token_allowance
+                    if request_deficit <= 0 and token_deficit <= 0:
+                        self._request_allowance -= 1
+                        self._token_allowance -= tokens
+                        return
+                    wait = max(request_deficit * 60.0 / self.requests_per_minute,
+                               token_deficit * 60.0 / self.tokens_per_minute)
+                self.throttled_seconds += wait
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        """
+        Stops every caller sharing this limiter for `seconds` (used after a quota error).
+        """
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+
+# Retry accounting for the current process
+stats = {"calls": 0, "retries": 0, "failures": 0}
+_stats_lock = threading.Lock()
+
+_rate_limiter = None
+_rate_limiter_lock = threading.Lock()
+
+_models = {}
+_models_lock = threading.Lock()
+
+
+def configure_model(model_name=MODEL_NAME):
+    """
+    Returns the model for the configured backend (backends.py): a Gemini
+    GenerativeModel configured from GEMINI_API_KEY, or the local mock when
+    DAPO_BACKEND=mock. The model is built once per process and shared by every
+    stage that asks for it.
+    """
+    with _models_lock:
+        if model_name not in _models:
+            _models[model_name] = backends.create_model(model_name)
+        return _models[model_name]
+
+
+def get_rate_limiter():
+    """
+    Returns the process-wide RateLimiter, creating it on first use.
+    """
+    global _rate_limiter
+    with _rate_limiter_lock:
+        if _rate_limiter is None:
+            _rate_limiter = RateLimiter()
+        return _rate_limiter
+
+
+def estimate_tokens(text):
+    """
+    Cheap local token estimate (~4 characters per token) used for TPM accounting.
+    """
+    return max(1, len(text) // 4)
+
+
+def status_code(error):
+    """
+    The status an API error carries: an int HTTP code (google.api_core's
+    `code`, `status_code`, or `response.status_code`), a gRPC status name, or None.
+    """
+    code = getattr(error, "code", None)
+    if callable(code):
+        try:
+            code = code()  # grpc.RpcError.code() returns a StatusCode
+        except Exception:
+            code = None
+    if code is None:
+        code = getattr(error, "status_code", None) or getattr(getattr(error, "response", None), "status_code", None)
+    if isinstance(code, int) and not isinstance(code, bool):
+        return code
+    return getattr(code, "name", None)
+
+
+def is_retryable(error):
+    """
+    True for quota and transient server errors, False for everything else
+    (invalid arguments, blocked prompts, authentication problems, ...).
+    Decided by the exception type or status code; the message is only
+    consulted for errors that have neither.
+    """
+    try:
+        from google.api_core import exceptions as api_exceptions
+        retryable_types = (
+            api_exceptions.ResourceExhausted,
+            api_exceptions.TooManyRequests,
+            api_exceptions.ServiceUnavailable,
+            api_exceptions.DeadlineExceeded,
+            api_exceptions.InternalServerError,
+        )
+        if isinstance(error, retryable_types):
+            return True
+        if isinstance(error, api_exceptions.GoogleAPICallError):
+            return False
+    except ImportError:
+        pass
+    if isinstance(error, (ConnectionError, TimeoutError)):
+        return True
+    code = status_code(error)
+    if code is not None:
+        return code in RETRYABLE_STATUS_CODES or code in RETRYABLE_GRPC_STATUSES
+    message = str(error).lower()
+    return any(marker in message for marker in RETRYABLE_MARKERS)
+
+
+def is_quota_error(error):
+    code = status_code(error)
+    if code is not None:
+        return code in QUOTA_STATUSES
+    message = f"{type(error).__name__} {error}".lower()
+    return "resourceexhausted" in message or "resource has been exhausted" in message or "quota" in message
+
+
+def backoff_delay(attempt):
+    """
+    Full-jitter exponential backoff: uniform in [0, min(max, base * 2**attempt)].
+    """
+    return random.uniform(0, min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * (2 ** attempt)))
+
+
+def _record(key, amount=1):
+    with _stats_lock:
+        stats[key] += amount
+
+
+def generate(model, prompt_text, generation_config=None, limiter=None, max_retries=MAX_RETRIES):
+    """
+    Calls model.generate_content under the shared rate limiter and returns the
+    stripped response text ("" when the model returned no text). Cached
+    responses are returned without touching the API.
+
+    Raises LLMCallError when the call fails permanently or runs out of retries.
+    """
+    return generate_detailed(model, prompt_text, generation_config, limiter, max_retries)[0]
+
+
+def generate_detailed(model, prompt_text, generation_config=None, limiter=None, max_retries=MAX_RETRIES, sample=0):
+    """
+    Same as generate(), but returns (response_text, call_record) where the record
+    holds the latency, token usage, finish reason, retries and estimated cost
+    logged by metrics.record_call. Different `sample` indexes of the same call
+    are cached separately, so repeated draws are not collapsed into one.
+    """
+    generation_config = generation_config or {}
+    start_time = time.perf_counter()
+    call_id = events.call_started(response_cache.model_name(model))
+    cache = response_cache.get_cache()
+    key = response_cache.cache_key(model, prompt_text, generation_config, sample) if cache else None
+    if cache:
+        if response_cache.should_read(generation_config):
+            entry = cache.lookup(key)
+            if entry is not None:
+                cached, usage = entry
+                record = _record_cache_hit(response_cache.model_name(model), time.perf_counter() - start_time,
+                                           prompt_text, cached, usage)
+                events.call_ended(call_id, record)
+                return cached, record
+        else:
+            cache.record_bypass()
+
+    response_text, record = _generate_uncached(model, prompt_text, generation_config, limiter, max_retries, call_id)
+    if cache and response_text:
+        cache.put(key, response_cache.model_name(model), response_text, _usage(record))
+    return response_text, record
+
+
+def _usage(record):
+    """
+    The part of a call record stored with a cached response.
+    """
+    return {field: record[field] for field in ("input_tokens", "output_tokens", "finish_reason")}
+
+
+def _record_cache_hit(name, latency, prompt_text, response_text, usage, ttft=None):
+    """
+    Records a cache hit with the usage of the call that produced the response
+    (estimated for entries cached without it); its cost is 0.
+    """
+    return metrics.record_call(name, latency, usage.get("input_tokens") or estimate_tokens(prompt_text),
+                               usage.get("output_tokens") or estimate_tokens(response_text),
+                               usage.get("finish_reason", ""), cached=True, ttft=ttft)
+
+
+def _generate_uncached(model, prompt_text, generation_config, limiter, max_retries, call_id):
+    limiter = limiter or get_rate_limiter()
+    tokens = estimate_tokens(prompt_text) + generation_config.get("max_output_tokens", DEFAULT_OUTPUT_TOKEN_ESTIMATE)
+    name = response_cache.model_name(model)
+
+    _record("calls")
+    waited = 0.0
+    for attempt in range(max_retries + 1):
+        waited += _acquire(limiter, tokens)
+        start_time = time.perf_counter()
+        try:
+            if generation_config:
+                response = model.generate_content(prompt_text, generation_config=generation_config)
+            else:
+                response = model.generate_content(prompt_text)
+            response_text = response.text.strip() if response.text else ""
+        except Exception as e:
+            _retry_or_raise(e, attempt, max_retries, limiter, name, call_id, waited)
+            continue
+
+        input_tokens, output_tokens, finish_reason = metrics.usage_from_response(response)
+        record = metrics.record_call(name, time.perf_counter() - start_time,
+                                     input_tokens or estimate_tokens(prompt_text),
+                                     output_tokens or estimate_tokens(response_text),
+                                     finish_reason, retries=attempt,
+                                     cached_input_tokens=metrics.cached_tokens_from_response(response))
+        events.call_ended(call_id, record, waited)
+        return response_text, record
+
+
+def _acquire(limiter, tokens):
+    """
+    Waits for the rate limiter and returns the seconds spent waiting.
+    """
+    start_time = time.perf_counter()
+    limiter.acquire(tokens)
+    return time.perf_counter() - start_time
+
+
+def _retry_or_raise(error, attempt, max_retries, limiter, model_name, call_id, waited=0.0):
+    """
+    Sleeps before the next attempt, or records the failure and raises
+    LLMCallError when the error is permanent or the retries are used up.
+    """
+    if not is_retryable(error) or attempt == max_retries:
+        _record("failures")
+        record = metrics.record_call(model_name, 0.0, finish_reason=type(error).__name__, retries=attempt, ok=False)
+        events.call_ended(call_id, record, waited)
+        raise LLMCallError(f"Gemini call failed after {attempt + 1} attempt(s): {error}") from error
+
+    delay = backoff_delay(attempt)
+    if is_quota_error(error):
+        limiter.pause(delay)
+    _record("retries")
+    events.emit("call_retry", call_id=call_id, attempt=attempt + 1, delay_seconds=round(delay, 3),
+                error=type(error).__name__)
+    print(f"⚠️ Retryable Gemini error ({type(error).__name__}); retry {attempt + 1}/{max_retries} in {delay:.1f}s")
+    time.sleep(delay)
+
+
+def generate_stream(model, prompt_text, generation_config=None, on_chunk=None, limiter=None, max_retries=MAX_RETRIES):
+    """
+    Streams a response with generate_content(stream=True), calling on_chunk(text)
+    for every chunk as it arrives. Returns (response_text, call_record); the
+    record also holds time-to-first-token and tokens/sec.
+
+    Errors before the first chunk are retried like generate(); a failure after
+    output has started raises LLMCallError. Cached responses are replayed as a
+    single chunk.
+    """
+    generation_config = generation_config or {}
+    on_chunk = on_chunk or (lambda text: None)
+    start_time = time.perf_counter()
+    name = response_cache.model_name(model)
+    call_id = events.call_started(name)
+
+    cache = response_cache.get_cache()
+    key = response_cache.cache_key(model, prompt_text, generation_config) if cache else None
+    if cache:
+        if response_cache.should_read(generation_config):
+            entry = cache.lookup(key)
+            if entry is not None:
+                cached, usage = entry
+                on_chunk(cached)
+                elapsed = time.perf_counter() - start_time
+                record = _record_cache_hit(name, elapsed, prompt_text, cached, usage, ttft=elapsed)
+                events.call_ended(call_id, record)
+                return cached, _with_throughput(record)
+        else:
+            cache.record_bypass()
+
+    limiter = limiter or get_rate_limiter()
+    tokens = estimate_tokens(prompt_text) + generation_config.get("max_output_tokens", DEFAULT_OUTPUT_TOKEN_ESTIMATE)
+
+    _record("calls")
+    waited = 0.0
+    for attempt in range(max_retries + 1):
+        waited += _acquire(limiter, tokens)
+        start_time = time.perf_counter()
+        first_token_at = None
+        chunks = []
+        try:
+            response = model.generate_content(prompt_text, generation_config=generation_config, stream=True)
+            for chunk in response:
+                text = chunk.text if chunk.parts else ""
+                if not text:
+                    continue
+                if first_token_at is None:
+                    first_token_at = time.perf_counter()
+                chunks.append(text)
+                on_chunk(text)
+        except Exception as e:
+            if first_token_at is not None:
+                _record("failures")
+                record = metrics.record_call(name, time.perf_counter() - start_time, finish_reason=type(e).__name__,
+                                             retries=attempt, ok=False, ttft=first_token_at - start_time)
+                events.call_ended(call_id, record, waited)
+                raise LLMCallError(f"Gemini stream failed after output had started: {e}") from e
+            _retry_or_raise(e, attempt, max_retries, limiter, name, call_id, waited)
+            continue
+
+        end_time = time.perf_counter()
+        response_text = "".join(chunks).strip()
+        input_tokens, output_tokens, finish_reason = metrics.usage_from_response(response)
+        record = metrics.record_call(name, end_time - start_time,
+                                     input_tokens or estimate_tokens(prompt_text),
+                                     output_tokens or estimate_tokens(response_text),
+                                     finish_reason, retries=attempt,
+                                     ttft=(first_token_at or end_time) - start_time)
+        events.call_ended(call_id, record, waited)
+        if cache and response_text:
+            cache.put(key, name, response_text, _usage(record))
+        return response_text, _with_throughput(record)
+
+
+def _with_throughput(record):
+    latency = record["latency_seconds"]
+    record["tokens_per_second"] = round(record["output_tokens"] / latency, 2) if latency > 0 else 0.0
+    return record
+
+
+def reset_stats():
+    """
+    Zeroes the per-stage counters (used when several stages share one process).
+    """
+    with _stats_lock:
+        for key in stats:
+            stats[key] = 0
+    get_rate_limiter().throttled_seconds = 0.0
+    response_cache.reset_stats()
+
+
+def print_stats(label="LLM"):
+    """
+    Prints the retry accounting (and response cache hit/miss counts) for this process.
+    """
+    limiter = get_rate_limiter()
+    print(f"📊 {label} calls: {stats['calls']} | retries: {stats['retries']} | failures: {stats['failures']} "
+          f"| throttled: {limiter.throttled_seconds:.1f}s")
+    response_cache.print_stats(label)
@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""
+metrics.py
+----------
+Per-call instrumentation shared by every stage.
+
+llm_client records one entry per Gemini call (latency, input/output tokens,
+finish reason, retries, cache hit, estimated cost) under the current stage
+name. Entries are appended to artifacts/call_metrics.jsonl so pipeline.py can
+print a per-stage summary (p50/p95 latency, total tokens, cost) whether the
+stages ran in-process or as subprocesses.
+"""
+
+import os
+import re
+import json
+import time
+import threading
+
+METRICS_LOG_PATH = os.getenv("DAPO_METRICS_PATH", os.path.join("artifacts", "call_metrics.jsonl"))
+
+# USD per 1M tokens (input, output); override with DAPO_PRICE_INPUT / DAPO_PRICE_OUTPUT
+PRICES_PER_MILLION_TOKENS = {
+    "gemini-1.5-pro": (1.25, 5.00),
+    "gemini-1.5-flash": (0.075, 0.30),
+}
+
+# Input tokens served from an explicit context cache are billed at this fraction
+CACHED_INPUT_PRICE_FACTOR = 0.25
+
+FINISH_REASON_MAX_TOKENS = "MAX_TOKENS"
+
+_state = {"stage": os.getenv("DAPO_STAGE", "unknown")}
+_lock = threading.Lock()
+
+
+def set_stage(stage):
+    """
+    Names the stage that subsequent calls are recorded under.
+    """
+    _state["stage"] = stage
+
+
+def current_stage():
+    return _state["stage"]
+
+
+def estimate_cost(model_name, input_tokens, output_tokens):
+    # Versioned names (gemini-1.5-pro-002) are priced like their base model
+    name = re.sub(r"-\d{3}$", "", model_name.split("/")[-1])
+    input_price, output_price = PRICES_PER_MILLION_TOKENS.get(name, (0.0, 0.0))
+    input_price = float(os.getenv("DAPO_PRICE_INPUT", input_price))
+    output_price = float(os.getenv("DAPO_PRICE_OUTPUT", output_price))
+    return (input_tokens * input_price + output_tokens * output_price) / 1_000_000
+
+
+def usage_from_response(response):
+    """
+    Extracts (input_tokens, output_tokens, finish_reason) from a Gemini response.
+    """
+    usage = getattr(response, "usage_metadata", None)
+    input_tokens = getattr(usage, "prompt_token_count", 0) or 0
+    output_tokens = getattr(usage, "candidates_token_count", 0) or 0
+    finish_reason = ""
+    candidates = getattr(response, "candidates", None) or []
+    if candidates:
+        reason = getattr(candidates[0], "finish_reason", "")
+        finish_reason = getattr(reason, "name", str(reason))
+    return input_tokens, output_tokens, finish_reason
+
+
+def cached_tokens_from_response(response):
+    """
+    Input tokens a Gemini response says were read from cached content.
+    """
+    usage = getattr(response, "usage_metadata", None)
+    return getattr(usage, "cached_content_token_count", 0) or 0
+
+
+def record_call(model_name, latency, input_tokens=0, output_tokens=0, finish_reason="",
+                retries=0, cached=False, ok=True, ttft=None, cost_factor=1.0, cached_input_tokens=0):
+    """
+    Appends one call record to the metrics log and returns it. `latency` is
+    None for calls without one of their own (batch predictions). `cost_factor`
+    scales the list price (e.g. for batch predictions); `cached_input_tokens`
+    of the input were read from a context cache and are billed at the cached rate.
+    """
+    billable_input = input_tokens - cached_input_tokens * (1 - CACHED_INPUT_PRICE_FACTOR)
+    record = {
+        "stage": current_stage(),
+        "model": model_name,
+        "latency_seconds": round(latency, 4) if latency is not None else None,
+        "ttft_seconds": round(ttft, 4) if ttft is not None else None,
+        "input_tokens": input_tokens,
+        "cached_input_tokens": cached_input_tokens,
+        "output_tokens": output_tokens,
+        "finish_reason": finish_reason,
+        "retries": retries,
+        "cached": cached,
+        "ok": ok,
+        "cost_usd": 0.0 if cached else round(cost_factor * estimate_cost(model_name, billable_input, output_tokens), 6),
+        "timestamp": time.time(),
+    }
+    with _lock:
+        directory = os.path.dirname(METRICS_LOG_PATH)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        with open(METRICS_LOG_PATH, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record) + "\n")
+    return record
+
+
+def result_columns(record):
+    """
+    Maps a call record onto the extra experiment_results columns.
+    """
+    return {
+        "Input Tokens": record["input_tokens"],
+        "Output Tokens": record["output_tokens"],
+        "Finish Reason": record["finish_reason"],
+        "Truncated": record["finish_reason"] == FINISH_REASON_MAX_TOKENS,
+        "Retries": record["retries"],
+        "Cached": record["cached"],
+        "Cost (USD)": record["cost_usd"],
+    }
+
+
+def reset_log(path=METRICS_LOG_PATH):
+    """
+    Starts a fresh metrics log (called by pipeline.py at the start of a run).
+    """
+    if os.path.isfile(path):
+        os.remove(path)
+
+
+def read_log(path=METRICS_LOG_PATH):
+    if not os.path.isfile(path):
+        return []
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def summarize(records):
+    """
+    Aggregates call records per stage (in first-seen order).
+    """
+    import numpy as np
+
+    stages = {}
+    for record in records:
+        stages.setdefault(record["stage"], []).append(record)
+
+    summary = {}
+    for stage, calls in stages.items():
+        latencies = np.array([call["latency_seconds"] for call in calls
+                              if not call["cached"] and call["latency_seconds"] is not None] or [0.0])
+        summary[stage] = {
+            "calls": len(calls),
+            "cached": sum(call["cached"] for call in calls),
+            "failed": sum(not call["ok"] for call in calls),
+            "retries": sum(call["retries"] for call in calls),
+            "truncated": sum(call["finish_reason"] == FINISH_REASON_MAX_TOKENS for call in calls),
+            "p50_latency": float(np.percentile(latencies, 50)),
+            "p95_latency": float(np.percentile(latencies, 95)),
+            "input_tokens": sum(call["input_tokens"] for call in calls),
+            "cached_input_tokens": sum(call.get("cached_input_tokens", 0) for call in calls),
+            "output_tokens": sum(call["output_tokens"] for call in calls),
+            "cost_usd": sum(call["cost_usd"] for call in calls),
+        }
+    return summary
+
+
+def print_summary(path=METRICS_LOG_PATH):
+    summary = summarize(read_log(path))
+    if not summary:
+        print("📊 No LLM call metrics recorded.")
+        return summary
+
+    print("📊 Per-stage LLM call metrics:")
+    for stage, s in summary.items():
+        print(f"   - {stage}: {s['calls']} calls ({s['cached']} cached, {s['failed']} failed, {s['retries']} retries, "
+              f"{s['truncated']} hit max tokens) | latency p50 {s['p50_latency']:.2f}s, p95 {s['p95_latency']:.2f}s "
+              f"| tokens in {s['input_tokens']:,} ({s['cached_input_tokens']:,} context-cached) / out {s['output_tokens']:,} | est. cost ${s['cost_usd']:.4f}")
+    total_cost = sum(s["cost_usd"] for s in summary.values())
+    total_tokens = sum(s["input_tokens"] + s["output_tokens"] for s in summary.values())
+    print(f"   = total: {total_tokens:,} tokens, est. cost ${total_cost:.4f}")
+    return summary
@@ -2,25 +2,214 @@
 """
 pipeline.py
 -----------
-Orchestrates the entire DAPO workflow in fresh processes:
+Orchestrates the entire DAPO workflow:
 
 1) generator.py       -> Creates artifacts/experiment_results.csv
 2) judge.py           -> Chooses best prompt & merges refinements, writes artifacts/best_prompt.json
 3) executioner.py     -> Uses ultimate prompt to produce a final Requirements Analysis and logs it
 4) jury.py            -> Re-checks entire dataset (including the 'ultimate' entry) for final commentary
 
+By default the stages run in-process: each script's main() is imported and
+called with one shared Gemini client and the results DataFrame is handed from
+stage to stage in memory. Use --mode subprocess to run every stage in a fresh
+Python process instead (slower, but fully isolated).
+
+Stages form a small DAG: each one declares the artifacts it reads and writes,
+and a stage depends on the earlier stages that produce its inputs. The content
+hashes of every stage's code (its script and the repository modules it
+imports), inputs and outputs are kept in artifacts/pipeline_state.json, and a
+stage whose fingerprints are unchanged since its last successful run is
+skipped (--force re-runs stages). When a stage fails, the stages that depend on
+it are not run, so nothing is built from stale artifacts. The scheduler would
+start independent stages side by side in subprocess mode, but the four stages
+form a chain (each reads what the previous one wrote), so they run one after
+another; the concurrency is inside the stages. In-process stages always run
+one at a time because they share the metrics state.
+
+Every stage appends call start/end/retry and progress events to
+artifacts/events.jsonl (see events.py). While the stages run, pipeline.py tails
+that log and prints the calls in flight, throughput, error rate and ETA of each
+active stage every --progress-interval seconds; at the end it prints where the
+wall time of every stage went.
+
+--dry-run prints which stages would run or be skipped and validates the
+generator grid (generator.py --dry-run) without configuring a model.
+
 Logs output and errors in real time for debugging.
 """
 
 import subprocess
+import importlib
+import ast
+import functools
+import argparse
+import hashlib
+import json
 import time
 import os
 import sys
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+import traceback
+import contextlib
 from datetime import datetime
+from llm_client import configure_model, reset_stats
+from experiment_history import current_run_id
+import metrics
+import events
 
 # Optionally allow overriding Python interpreter
 PYTHON_EXEC = sys.executable  # Uses the same Python as the script is running
 
+# Number of trailing output lines reported when a subprocess stage fails
+ERROR_TAIL_LINES = 40
+
+ARTIFACTS_DIR = "artifacts"
+EXPERIMENT_RESULTS = os.path.join(ARTIFACTS_DIR, "experiment_results.csv")
+BEST_PROMPT = os.path.join(ARTIFACTS_DIR, "best_prompt.json")
+BEST_PROMPT_REASONING = os.path.join(ARTIFACTS_DIR, "best_prompt_reasoning.md")
+REQUIREMENTS_ANALYSIS = os.path.join(ARTIFACTS_DIR, "requirements_analysis.md")
+FINAL_REPORT = os.path.join(ARTIFACTS_DIR, "final_analysis_report.md")
+
+# Fingerprints of the last successful run of every stage
+STATE_PATH = os.path.join(ARTIFACTS_DIR, "pipeline_state.json")
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+class Stage:
+    """
+    One pipeline step. `inputs` are the artifacts it reads, `outputs` the ones it
+    writes, and `updates` artifacts owned by an earlier stage that it appends to
+    (executioner.py adds the 'ultimate' row to experiment_results.csv).
+    """
+
+    def __init__(self, script, description, inputs=(), outputs=(), updates=()):
+        self.script = script
+        self.description = description
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.updates = list(updates)
+        self.name = os.path.splitext(script)[0]
+        self.depends_on = []
+
+STAGES = [
+    Stage("generator.py", "Generate 36 prompt variations",
+          outputs=[EXPERIMENT_RESULTS]),
+    Stage("judge.py", "Judge picks best prompt & merges refinements",
+          inputs=[EXPERIMENT_RESULTS], outputs=[BEST_PROMPT, BEST_PROMPT_REASONING]),
+    Stage("executioner.py", "Execute ultimate prompt for final Requirements Analysis",
+          inputs=[BEST_PROMPT], outputs=[REQUIREMENTS_ANALYSIS], updates=[EXPERIMENT_RESULTS]),
+    Stage("jury.py", "Perform final analysis on all results",
+          inputs=[EXPERIMENT_RESULTS, REQUIREMENTS_ANALYSIS], outputs=[FINAL_REPORT]),
+]
+
+def link_stages(stages):
+    """
+    Makes every stage depend on the earlier stages that write or update one of its inputs.
+    """
+    for index, stage in enumerate(stages):
+        stage.depends_on = [
+            earlier.name for earlier in stages[:index]
+            if set(stage.inputs) & set(earlier.outputs + earlier.updates)
+        ]
+    return stages
+
+link_stages(STAGES)
+
+def file_fingerprint(path):
+    """SHA-256 of a file's contents, or None if it does not exist."""
+    if not os.path.isfile(path):
+        return None
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+@functools.lru_cache(maxsize=None)
+def local_modules(script, root=REPO_DIR):
+    """
+    Paths of the code a stage runs: its script plus every repository module it
+    imports, directly or through other repository modules (imports inside
+    functions included). Third-party imports are ignored. The import graph is
+    read once per process; the files are hashed on every check.
+    """
+    found, pending = set(), [os.path.join(root, script)]
+    while pending:
+        path = pending.pop()
+        if path in found or not os.path.isfile(path):
+            continue
+        found.add(path)
+        with open(path, "r", encoding="utf-8") as f:
+            tree = ast.parse(f.read(), filename=path)
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Import):
+                names = [alias.name for alias in node.names]
+            elif isinstance(node, ast.ImportFrom) and node.level == 0 and node.module:
+                names = [node.module]
+            else:
+                continue
+            pending.extend(os.path.join(root, name.split(".")[0] + ".py") for name in names)
+    return tuple(sorted(found))
+
+def stage_fingerprints(stage, root=REPO_DIR):
+    return {
+        "code": {os.path.basename(path): file_fingerprint(path) for path in local_modules(stage.script, root)},
+        "inputs": {path: file_fingerprint(path) for path in stage.inputs},
+        "outputs": {path: file_fingerprint(path) for path in stage.outputs},
+    }
+
+def load_state(path=STATE_PATH):
+    if not os.path.isfile(path):
+        return {}
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        log_message(f"⚠️ WARNING: Could not read {path}; every stage will run.", error=True)
+        return {}
+
+def save_state(state, path=STATE_PATH):
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(state, f, indent=2)
+
+def is_up_to_date(stage, state):
+    """
+    True when the stage's code and inputs are unchanged since its last
+    successful run and its outputs still exist unmodified.
+    """
+    recorded = state.get(stage.name)
+    current = stage_fingerprints(stage)
+    return (recorded is not None
+            and all(current["outputs"].values())
+            and recorded == current)
+
+def record_success(stage, state, stages):
+    """
+    Stores the stage's fingerprints. Artifacts it `updates` are re-recorded for
+    the earlier stages too, so that its append does not make them look stale.
+    """
+    state[stage.name] = stage_fingerprints(stage)
+    upstream = ancestors(stage, stages)
+    for path in stage.updates:
+        fingerprint = file_fingerprint(path)
+        for name in upstream & set(state):
+            for kind in ("inputs", "outputs"):
+                if path in state[name][kind]:
+                    state[name][kind][path] = fingerprint
+
+def ancestors(stage, stages):
+    by_name = {other.name: other for other in stages}
+    found, pending = set(), list(stage.depends_on)
+    while pending:
+        name = pending.pop()
+        if name not in found:
+            found.add(name)
+            pending.extend(by_name[name].depends_on)
+    return found
+
 def log_message(msg, error=False):
     """Logs a message with a timestamp."""
     timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
@@ -28,51 +217,194 @@ def log_message(msg, error=False):
     print(f"[{timestamp}] {log_type}: {msg}")
 
 def run_step(script, description):
-    """Executes a pipeline step with improved logging and real-time streaming."""
+    """
+    Executes a pipeline step in a fresh process with real-time streaming.
+    Returns True if it succeeded.
+    """
     log_message(f"🚀 Running {script} -> {description}")
+    stage = os.path.splitext(script)[0]
+    events.emit("stage_start", stage=stage)
 
     start_time = time.time()
     try:
+        # stderr is merged into stdout so a chatty stage can never block on a full stderr pipe
         with subprocess.Popen(
             [PYTHON_EXEC, script],
             stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
             text=True
         ) as proc:
+            tail = deque(maxlen=ERROR_TAIL_LINES)
             # Stream stdout
             for line in proc.stdout:
+                tail.append(line.rstrip())
                 print(f"[{script}]: {line.strip()}")
 
             proc.wait()  # Wait for script completion
 
             elapsed_time = time.time() - start_time
+            events.emit("stage_end", stage=stage, ok=proc.returncode == 0, seconds=round(elapsed_time, 3))
             if proc.returncode == 0:
                 log_message(f"✅ {script} completed successfully in {elapsed_time:.2f} seconds.\n")
-            else:
-                log_message(f"⚠️ WARNING: {script} failed with exit code {proc.returncode}. Continuing pipeline...", error=True)
-                log_message(f"🔍 Standard Error Output:\n{proc.stderr.read()}", error=True)
+                return True
+            log_message(f"⚠️ WARNING: {script} failed with exit code {proc.returncode}.", error=True)
+            log_message(f"🔍 Last {len(tail)} output lines:\n" + "\n".join(tail), error=True)
+            return False
 
     except Exception as e:
+        events.emit("stage_end", stage=stage, ok=False, seconds=round(time.time() - start_time, 3))
         log_message(f"❌ Unexpected error while running {script}: {e}", error=True)
-        sys.exit(1)
+        return False
+
+def run_step_inprocess(script, description, model, df):
+    """
+    Executes a pipeline step by calling its main() in this process.
+    Returns (succeeded, results DataFrame produced by the stage or the previous one).
+    A stage fails by raising; one that was handed a results table and returns
+    None instead of a table counts as failed too.
+    """
+    log_message(f"🚀 Running {script} (in-process) -> {description}")
+
+    stage = os.path.splitext(script)[0]
+    events.emit("stage_start", stage=stage)
+    start_time = time.time()
+    module = importlib.import_module(stage)
+    reset_stats()
+    try:
+        result = module.main([], model=model, df=df)
+    except (Exception, SystemExit) as e:
+        events.emit("stage_end", stage=stage, ok=False, seconds=round(time.time() - start_time, 3))
+        log_message(f"⚠️ WARNING: {script} failed: {e!r}", error=True)
+        log_message(f"🔍 Traceback:\n{traceback.format_exc()}", error=True)
+        return False, df
+    if result is None and df is not None:
+        events.emit("stage_end", stage=stage, ok=False, seconds=round(time.time() - start_time, 3))
+        log_message(f"⚠️ WARNING: {script} returned no results table; treating the stage as failed.", error=True)
+        return False, df
+
+    elapsed_time = time.time() - start_time
+    events.emit("stage_end", stage=stage, ok=True, seconds=round(elapsed_time, 3))
+    log_message(f"✅ {script} completed successfully in {elapsed_time:.2f} seconds.\n")
+    return True, result if result is not None else df
 
-def main():
-    log_message("🚀 Starting the full DAPO pipeline...\n")
+def run_stages(stages, mode, model=None, force=None, state_path=STATE_PATH):
+    """
+    Runs the stage DAG. A stage starts once every stage it depends on has
+    finished or was skipped as up to date; stages downstream of a failure are
+    not run. `force` lists stages to run regardless of their fingerprints (an
+    empty list forces all of them). Returns {stage name: "ran" | "skipped" | "failed" | "blocked"}.
+    """
+    state = load_state(state_path)
+    status = {}
+    pending = list(stages)
+    running = {}
+    df = None
+    workers = len(stages) if mode == "subprocess" else 1
 
-    steps = [
-        ("generator.py",       "Generate 36 prompt variations"),
-        ("judge.py",           "Judge picks best prompt & merges refinements"),
-        ("executioner.py",     "Execute ultimate prompt for final Requirements Analysis"),
-        ("jury.py",            "Perform final analysis on all results")
-    ]
+    def start(pool, stage):
+        if mode == "inprocess":
+            return pool.submit(run_step_inprocess, stage.script, stage.description, model, df)
+        return pool.submit(run_step, stage.script, stage.description)
 
-    for i, (script, description) in enumerate(steps, start=1):
-        log_message(f"{i}/{len(steps)}: {description}")
-        run_step(script, description)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        while pending or running:
+            settled = len(status)
+            for stage in list(pending):
+                if any(status.get(name) in ("failed", "blocked") for name in stage.depends_on):
+                    pending.remove(stage)
+                    status[stage.name] = "blocked"
+                    log_message(f"⏭️ Not running {stage.script}: an upstream stage failed.", error=True)
+                    continue
+                if not all(status.get(name) in ("ran", "skipped") for name in stage.depends_on):
+                    continue
+                if len(running) >= workers:
+                    break
+                pending.remove(stage)
+                forced = force is not None and (not force or stage.name in force)
+                if not forced and is_up_to_date(stage, state):
+                    status[stage.name] = "skipped"
+                    log_message(f"⏭️ Skipping {stage.script}: inputs and outputs unchanged since its last run.")
+                    continue
+                log_message(f"{stage.name}: {stage.description}")
+                running[start(pool, stage)] = stage
 
-        # Optional sleep (adjust if API rate limits apply)
-        if i < len(steps):
-            time.sleep(1)  # Reduce wait time for efficiency
+            if not running:
+                if len(status) == settled:
+                    # Nothing started, skipped or blocked: the remaining stages wait on stages that never run
+                    raise RuntimeError("❌ ERROR: Unsatisfiable stage dependencies: " + ", ".join(
+                        f"{stage.name} -> {stage.depends_on}" for stage in pending))
+                continue
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                stage = running.pop(future)
+                ok = future.result()
+                if mode == "inprocess":
+                    ok, df = ok
+                status[stage.name] = "ran" if ok else "failed"
+                if ok:
+                    record_success(stage, state, stages)
+                else:
+                    state.pop(stage.name, None)
+                save_state(state, state_path)
+    return status
+
+def dry_run(stages, force=None, state_path=STATE_PATH):
+    """
+    Prints the plan (run or skip per stage) and checks the generator grid.
+    Stages downstream of a stage that would run are planned to run as well.
+    """
+    state = load_state(state_path)
+    planned = set()
+    for stage in stages:
+        forced = force is not None and (not force or stage.name in force)
+        stale = forced or not is_up_to_date(stage, state) or planned & set(stage.depends_on)
+        if stale:
+            planned.add(stage.name)
+        log_message(f"🧪 {stage.name}: {'would run' if stale else 'would skip (up to date)'} -> {stage.description}")
+    importlib.import_module("generator").main(["--dry-run"])
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Run the full DAPO pipeline.")
+    parser.add_argument("--mode", choices=["inprocess", "subprocess"], default="inprocess",
+                        help="Run stages in this process sharing one model client (default) "
+                             "or each in a fresh Python process.")
+    parser.add_argument("--force", nargs="*", metavar="STAGE",
+                        choices=[stage.name for stage in STAGES],
+                        help="Re-run the named stages (every stage if none are named) even if they are up to date.")
+    parser.add_argument("--progress-interval", type=float, default=events.DEFAULT_PROGRESS_INTERVAL,
+                        help="Seconds between live progress lines (default: %(default)s).")
+    parser.add_argument("--no-progress", action="store_true",
+                        help="Do not print live progress lines.")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="Show which stages would run and validate the generator grid without calling the model.")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.dry_run:
+        dry_run(STAGES, force=args.force)
+        return
+
+    log_message(f"🚀 Starting the full DAPO pipeline ({args.mode})...\n")
+    metrics.reset_log()
+    events.reset_log()
+
+    model = None
+    if args.mode == "inprocess":
+        try:
+            model = configure_model()
+        except ValueError as e:
+            log_message(str(e), error=True)
+            sys.exit(1)
+
+    monitor = (contextlib.nullcontext() if args.no_progress else
+               events.ProgressMonitor(interval=args.progress_interval, printer=log_message))
+    with monitor:
+        status = run_stages(STAGES, args.mode, model=model, force=args.force)
+    log_message("Stage status: " + ", ".join(f"{name} {result}" for name, result in status.items()))
+    run_id = current_run_id()
+    if run_id:
+        log_message(f"🗂️ Run {run_id} (lineage: python experiment_history.py lineage {run_id})")
 
     # Attempt to display a snippet of the final analysis
     final_report_path = os.path.join("artifacts", "final_analysis_report.md")
@@ -85,5 +417,12 @@ def main():
     else:
         log_message(f"\n❌ {final_report_path} not found. Check jury.py output.", error=True)
 
+    # Per-stage latency / token / cost summary from artifacts/call_metrics.jsonl
+    metrics.print_summary()
+    events.print_profile()
+
+    if any(result in ("failed", "blocked") for result in status.values()):
+        sys.exit(1)
+
 if __name__ == "__main__":
     main()
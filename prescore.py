@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+prescore.py
+-----------
+Cheap, deterministic pre-scoring of the results table (pandas/NumPy only).
+
+Every row gets:
+  - Coverage:  fraction of the expected Requirements Analysis sections mentioned
+               (functional / non-functional requirements, data sources,
+               processing components, user interactions)
+  - Words:     response length in words
+  - Truncated: cut off at max_output_tokens (finish reason when known,
+               otherwise an unfinished last sentence)
+  - Duplicate: exact duplicate (after whitespace/case normalisation) of an
+               earlier row
+  - Invalid:   "Error: ..." / "No Response" / empty rows
+  - Pre-Score: weighted combination used to rank rows (invalid rows get -inf)
+
+judge.py and jury.py drop invalid and duplicate rows and send only the top-K
+rows by Pre-Score to the LLM.
+"""
+
+# Section name -> regex matched case-insensitively against the response text
+EXPECTED_SECTIONS = {
+    "functional": r"(?<!non-)(?<!non )functional requirements?",
+    "non_functional": r"non[- ]?functional requirements?",
+    "data_sources": r"data (?:sources?|acquisition|ingestion)",
+    "processing": r"processing|components?|architecture",
+    "user_interactions": r"user (?:interactions?|interface)|\bui\b|dashboard",
+}
+
+# Response length (words) that earns the full length score
+TARGET_WORDS = 600
+
+WEIGHTS = {"coverage": 0.6, "length": 0.25, "complete": 0.15}
+
+# Columns prescore() reads besides the core results columns, when available
+PRESCORE_COLUMNS = ["Finish Reason"]
+
+INVALID_TEXTS = ("", "no response", "no response.", "nan")
+
+
+def prescore(df):
+    """
+    Returns a copy of `df` with the pre-scoring columns added (vectorized over all rows).
+    """
+    import numpy as np
+
+    scored = df.copy()
+    text = scored["Response Text"].fillna("").astype(str)
+    stripped = text.str.strip()
+
+    coverage = np.column_stack([
+        text.str.contains(pattern, case=False, regex=True).to_numpy()
+        for pattern in EXPECTED_SECTIONS.values()
+    ]).mean(axis=1)
+
+    words = text.str.split().str.len().fillna(0).to_numpy()
+    length_score = np.minimum(words / TARGET_WORDS, 1.0)
+
+    unfinished = ~stripped.str.contains(r"[.!?:)\]*`|]$", regex=True)
+    if "Finish Reason" in scored.columns and scored["Finish Reason"].notna().any():
+        finish = scored["Finish Reason"].fillna("").astype(str)
+        truncated = np.where(finish != "", finish.str.upper() == "MAX_TOKENS", unfinished)
+    else:
+        truncated = unfinished.to_numpy()
+
+    invalid = (stripped.str.lower().isin(INVALID_TEXTS) | stripped.str.startswith("Error:")).to_numpy()
+    normalized = stripped.str.lower().str.replace(r"\s+", " ", regex=True)
+    duplicate = (normalized.duplicated(keep="first") & ~invalid).to_numpy()
+
+    score = (WEIGHTS["coverage"] * coverage
+             + WEIGHTS["length"] * length_score
+             + WEIGHTS["complete"] * (~truncated.astype(bool)))
+
+    scored["Coverage"] = coverage.round(3)
+    scored["Words"] = words.astype(int)
+    scored["Truncated"] = truncated.astype(bool)
+    scored["Duplicate"] = duplicate
+    scored["Invalid"] = invalid
+    scored["Pre-Score"] = np.where(invalid, -np.inf, score).round(4)
+    return scored
+
+
+def select_top_k(df, top_k=None, keep_prompt_types=("ultimate",)):
+    """
+    Drops invalid and duplicate rows and keeps the `top_k` best rows by
+    Pre-Score (all remaining rows when top_k is None). When the table has a
+    Cluster column (dedup.assign_clusters), only the best row of each cluster is
+    a candidate. Rows whose Prompt Type is in `keep_prompt_types` are always
+    kept. Original row order is preserved.
+    """
+    scored = prescore(df)
+    keep = scored["Prompt Type"].isin(keep_prompt_types)
+    candidates = scored[~scored["Invalid"] & ~scored["Duplicate"] & ~keep]
+    if "Cluster" in candidates.columns:
+        candidates = candidates.sort_values("Pre-Score", ascending=False, kind="stable").drop_duplicates("Cluster")
+    if top_k is not None:
+        candidates = candidates.nlargest(top_k, "Pre-Score", keep="first")
+    selected = scored.loc[sorted(set(candidates.index) | set(scored.index[keep]))]
+
+    dropped = len(scored) - len(selected)
+    print(f"🧮 Pre-scoring kept {len(selected)} of {len(scored)} rows "
+          f"({int(scored['Invalid'].sum())} invalid, {int(scored['Duplicate'].sum())} duplicates, "
+          f"{int(scored['Truncated'].sum())} truncated; {dropped} dropped)")
+    return selected
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+prompt_budget.py
+----------------
+Keeps the judge and jury prompts within a token budget.
+
+  - compact_json():  serializes the dataset without indentation
+  - count_tokens():  model.count_tokens when asked for, otherwise the local
+                     ~4 characters/token estimate from llm_client
+  - fit_rows():      cuts each row's Response Text to a per-row budget, keeping
+                     the head and listing the Markdown headings that were cut
+  - pack_rows():     greedily splits rows into chunks whose prompts fit the
+                     budget, so callers can judge/analyse each chunk and merge
+
+Budgets default to DAPO_PROMPT_BUDGET / DAPO_ROW_BUDGET tokens.
+"""
+
+import os
+import re
+import json
+from llm_client import estimate_tokens
+
+# Twice Gemini's smallest cacheable prefix (context_cache.MIN_CACHE_TOKENS), so
+# a dataset block large enough to cache still fits one prompt with its instructions
+DEFAULT_PROMPT_BUDGET = int(os.getenv("DAPO_PROMPT_BUDGET", "65536"))
+DEFAULT_ROW_BUDGET = int(os.getenv("DAPO_ROW_BUDGET", "1500"))
+
+# Characters per token assumed when cutting text to a token budget
+CHARS_PER_TOKEN = 4
+
+HEADING_PATTERN = re.compile(r"^\s*(?:#{1,6}\s+|\*\*\d+\.\s*)([^*\n]+?)\**\s*$", re.MULTILINE)
+
+
+def compact_json(data):
+    return json.dumps(data, separators=(",", ":"), ensure_ascii=False)
+
+
+def count_tokens(text, model=None):
+    """
+    Counts the tokens of `text` with `model.count_tokens` when a model is given
+    (falling back to the local estimate if that fails), else estimates locally.
+    """
+    if model is not None:
+        try:
+            return model.count_tokens(text).total_tokens
+        except Exception as e:
+            print(f"⚠️ WARNING: count_tokens failed ({e}); using the local estimate.")
+    return estimate_tokens(text)
+
+
+def truncate_text(text, max_tokens):
+    """
+    Cuts `text` to roughly `max_tokens` tokens. The cut part is replaced by a
+    note listing the section headings it contained.
+    """
+    text = str(text)
+    limit = max_tokens * CHARS_PER_TOKEN
+    if len(text) <= limit:
+        return text
+    head, tail = text[:limit], text[limit:]
+    headings = [heading.strip() for heading in HEADING_PATTERN.findall(tail)]
+    note = f" […truncated {len(tail)} characters"
+    if headings:
+        note += f"; further sections: {', '.join(headings)}"
+    return head.rstrip() + note + "]"
+
+
+def fit_rows(rows, row_budget=DEFAULT_ROW_BUDGET, field="Response Text"):
+    """
+    Returns copies of `rows` with `field` cut to `row_budget` tokens.
+    """
+    fitted = [dict(row, **{field: truncate_text(row[field], row_budget)}) if field in row else dict(row)
+              for row in rows]
+    cut = sum(fitted_row.get(field) != row.get(field) for fitted_row, row in zip(fitted, rows))
+    if cut:
+        print(f"✂️ Prompt budget: cut '{field}' of {cut} of {len(rows)} rows to ~{row_budget} tokens")
+    return fitted
+
+
+def pack_rows(rows, budget=DEFAULT_PROMPT_BUDGET, overhead=0, max_rows=None):
+    """
+    Splits `rows` into consecutive chunks whose serialized size plus `overhead`
+    stays within `budget` tokens (and at most `max_rows` rows per chunk). A row
+    larger than the budget on its own gets a chunk to itself.
+    """
+    chunks, current, used = [], [], overhead
+    for row in rows:
+        size = estimate_tokens(compact_json(row))
+        full = current and (used + size > budget or (max_rows and len(current) >= max_rows))
+        if full:
+            chunks.append(current)
+            current, used = [], overhead
+        current.append(row)
+        used += size
+    if current:
+        chunks.append(current)
+    return chunks
@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+"""
+response_cache.py
+-----------------
+Persistent, content-addressed cache for Gemini responses, used by llm_client.generate.
+
+- Entries are keyed by sha256(model, prompt, generation_config) and stored in
+  SQLite (artifacts/.cache/responses.sqlite by default), together with the
+  token usage and finish reason of the call, which a hit reports again.
+- The cache is size-bounded; the least recently used entries are evicted first.
+- DAPO_RESAMPLE=1 (or generator.py --resample) skips cache reads for calls with
+  temperature > 0 so sampling runs are re-drawn; the fresh response replaces the entry.
+- DAPO_CACHE=0 (or --no-cache) disables the cache entirely.
+"""
+
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+
+DEFAULT_CACHE_PATH = os.getenv("DAPO_CACHE_PATH", os.path.join("artifacts", ".cache", "responses.sqlite"))
+DEFAULT_MAX_BYTES = int(float(os.getenv("DAPO_CACHE_MAX_MB", "256")) * 1024 * 1024)
+
+# Gemini samples at temperature 1.0 when a call sets no temperature
+DEFAULT_TEMPERATURE = 1.0
+
+settings = {
+    "enabled": os.getenv("DAPO_CACHE", "1") != "0",
+    "resample": os.getenv("DAPO_RESAMPLE", "0") == "1",
+}
+
+
+def configure(enabled=None, resample=None):
+    """
+    Overrides the environment defaults (used by the stage CLIs).
+    """
+    if enabled is not None:
+        settings["enabled"] = enabled
+    if resample is not None:
+        settings["resample"] = resample
+
+
+def model_name(model):
+    return getattr(model, "model_name", None) or type(model).__name__
+
+
+def cache_key(model, prompt_text, generation_config, sample=0):
+    """
+    `sample` distinguishes repeated draws of the same call; sample 0 keeps the
+    plain (model, prompt, generation_config) key.
+    """
+    entry = {"model": model_name(model), "prompt": prompt_text, "generation_config": generation_config or {}}
+    # Models bound to a context-cached prefix (context_cache.py) see prefix + prompt
+    prefix_digest = getattr(model, "prefix_digest", None)
+    if prefix_digest:
+        entry["context"] = prefix_digest
+    if sample:
+        entry["sample"] = sample
+    payload = json.dumps(entry, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    SQLite-backed LRU cache. Safe to share between threads of one process.
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_bytes=DEFAULT_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.stats = {"hits": 0, "misses": 0, "writes": 0, "evictions": 0, "bypassed": 0}
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS responses (
+                   key TEXT PRIMARY KEY,
+                   model TEXT,
+                   response_text TEXT,
+                   size_bytes INTEGER,
+                   created_at REAL,
+                   last_access REAL,
+                   usage TEXT
+               )"""
+        )
+        # Caches written before usage was stored lack the column
+        if "usage" not in [row[1] for row in self._conn.execute("PRAGMA table_info(responses)")]:
+            self._conn.execute("ALTER TABLE responses ADD COLUMN usage TEXT")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_last_access ON responses(last_access)")
+        self._conn.commit()
+
+    def get(self, key):
+        entry = self.lookup(key)
+        return entry[0] if entry is not None else None
+
+    def lookup(self, key):
+        """
+        Returns (response_text, usage) or None. `usage` holds the input and
+        output tokens and finish reason of the call that produced the response
+        ({} for entries cached before usage was stored).
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT response_text, usage FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.stats["misses"] += 1
+                return None
+            self._conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+            self.stats["hits"] += 1
+            return row[0], json.loads(row[1]) if row[1] else {}
+
+    def record_bypass(self):
+        with self._lock:
+            self.stats["bypassed"] += 1
+
+    def put(self, key, model, response_text, usage=None):
+        now = time.time()
+        size = len(response_text.encode("utf-8"))
+        with self._lock:
+            self._conn.execute(
+                """INSERT OR REPLACE INTO responses (key, model, response_text, size_bytes, created_at, last_access, usage)
+                   VALUES (?, ?, ?, ?, ?, ?, ?)""",
+                (key, model, response_text, size, now, now, json.dumps(usage) if usage else None),
+            )
+            self.stats["writes"] += 1
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        total = self._conn.execute("SELECT COALESCE(SUM(size_bytes), 0) FROM responses").fetchone()[0]
+        while total > self.max_bytes:
+            row = self._conn.execute(
+                "SELECT key, size_bytes FROM responses ORDER BY last_access ASC LIMIT 1"
+            ).fetchone()
+            if row is None:
+                break
+            self._conn.execute("DELETE FROM responses WHERE key = ?", (row[0],))
+            total -= row[1]
+            self.stats["evictions"] += 1
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    """
+    Returns the process-wide ResponseCache, or None when caching is disabled.
+    """
+    global _cache
+    if not settings["enabled"]:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = ResponseCache()
+        return _cache
+
+
+def should_read(generation_config):
+    """
+    False when a sampling call must be re-drawn instead of served from the cache.
+    """
+    temperature = (generation_config or {}).get("temperature", DEFAULT_TEMPERATURE)
+    return not (settings["resample"] and temperature > 0)
+
+
+def reset_stats():
+    if _cache is not None:
+        with _cache._lock:
+            for key in _cache.stats:
+                _cache.stats[key] = 0
+
+
+def print_stats(label="Cache"):
+    if _cache is None:
+        return
+    s = _cache.stats
+    total = s["hits"] + s["misses"]
+    hit_rate = (s["hits"] / total * 100) if total else 0.0
+    print(f"🗄️ {label} cache hits: {s['hits']} | misses: {s['misses']} ({hit_rate:.0f}% hit rate) "
+          f"| re-drawn: {s['bypassed']} | writes: {s['writes']} | evictions: {s['evictions']}")
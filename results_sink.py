@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+results_sink.py
+---------------
+Append-only JSON Lines sink for generator.py.
+
+Every completed grid cell is written as one line and flushed to disk right
+away, so a crash only loses the requests that were still in flight. The same
+file is read back to resume an interrupted sweep and to export the CSV.
+"""
+
+import os
+import json
+import threading
+
+
+class JsonlResultsSink:
+    """
+    Thread-safe writer that appends one JSON object per completed cell.
+    """
+
+    def __init__(self, path, resume=False):
+        self.path = path
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        if resume:
+            _drop_partial_line(path)
+        self._file = open(path, "a" if resume else "w", encoding="utf-8")
+
+    def write(self, row):
+        line = json.dumps(row, ensure_ascii=False)
+        with self._lock:
+            self._file.write(line + "\n")
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _drop_partial_line(path):
+    """
+    Truncates a crash-interrupted final line so appended rows start on a fresh line.
+    """
+    if not os.path.isfile(path):
+        return
+    with open(path, "rb+") as f:
+        data = f.read()
+        if data and not data.endswith(b"\n"):
+            f.truncate(data.rfind(b"\n") + 1)
+
+
+def read_rows(path):
+    """
+    Yields the rows stored in a JSONL results file. A partially written last
+    line (left behind by a crash) is skipped.
+    """
+    if not os.path.isfile(path):
+        return
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                print(f"⚠️ WARNING: Skipping incomplete line in {path}")
+
+
+def completed_keys(path, key_columns):
+    """
+    Returns the set of key tuples (e.g. prompt type, temperature, max tokens)
+    already present in the results file. Key columns missing from older rows
+    count as 0.
+    """
+    return {tuple(row.get(column, 0) for column in key_columns) for row in read_rows(path)}
@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+results_store.py
+----------------
+Columnar store for the experiment results shared by all stages.
+
+Rows live in artifacts/results/ as Parquet partitions (one file per append),
+so adding the 'ultimate' row is O(1) instead of rewriting the whole CSV.
+Reads are memory-mapped and can be projected to a subset of columns, so
+stages that only need metadata never load the response bodies.
+
+experiment_results.csv is kept as an export format. Without pyarrow the
+store falls back to a single append-only CSV file whose columns are fixed
+by its first write. pandas and pyarrow are
+imported on first use, so importing this module stays cheap.
+"""
+
+import os
+import glob
+
+
+def _parquet():
+    """
+    Returns (pyarrow, pyarrow.parquet), or (None, None) when pyarrow is missing.
+    """
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:  # pragma: no cover - depends on the environment
+        return None, None
+    return pa, pq
+
+DEFAULT_STORE_DIR = os.path.join("artifacts", "results")
+
+# The columns every results row has; everything else is optional metrics
+CORE_COLUMNS = ["Prompt Type", "Actual Prompt", "Temperature", "Max Tokens", "Response Text"]
+
+# Columns that identify a run without its (large) prompt and response bodies
+METADATA_COLUMNS = ["Prompt Type", "Temperature", "Max Tokens"]
+
+
+class ResultsStore:
+    """
+    Append-friendly results table backed by Parquet partitions (or CSV without pyarrow).
+    """
+
+    def __init__(self, root=DEFAULT_STORE_DIR):
+        self.root = root
+        self.backend = "parquet" if _parquet()[1] is not None else "csv"
+        if not os.path.exists(root):
+            os.makedirs(root)
+
+    @property
+    def _csv_path(self):
+        return os.path.join(self.root, "results.csv")
+
+    def _partitions(self):
+        return sorted(glob.glob(os.path.join(self.root, "part-*.parquet")))
+
+    def is_empty(self):
+        if self.backend == "parquet":
+            return not self._partitions()
+        return not os.path.isfile(self._csv_path)
+
+    def append(self, df):
+        """
+        Adds the rows of `df` as a new partition.
+        """
+        if df.empty:
+            return
+        if self.backend == "parquet":
+            partitions = self._partitions()
+            index = int(os.path.basename(partitions[-1])[5:10]) + 1 if partitions else 0
+            path = os.path.join(self.root, f"part-{index:05d}.parquet")
+            pa, pq = _parquet()
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            pq.write_table(table, path + ".tmp")
+            os.replace(path + ".tmp", path)
+        else:
+            append_csv(self._csv_path, df)
+
+    def replace(self, df):
+        """
+        Drops every stored row and writes `df` as the only partition.
+        """
+        self.clear()
+        self.append(df)
+
+    def clear(self):
+        for path in self._partitions():
+            os.remove(path)
+        if os.path.isfile(self._csv_path):
+            os.remove(self._csv_path)
+
+    def read(self, columns=None):
+        """
+        Returns the stored rows as a DataFrame, optionally projected to `columns`.
+        Columns missing from older partitions come back as NaN.
+        """
+        import pandas as pd
+
+        if self.backend == "csv":
+            if not os.path.isfile(self._csv_path):
+                return pd.DataFrame(columns=columns or CORE_COLUMNS)
+            header = pd.read_csv(self._csv_path, nrows=0).columns
+            usecols = [column for column in columns if column in header] if columns else None
+            return pd.read_csv(self._csv_path, usecols=usecols).reindex(columns=columns or header)
+
+        pq = _parquet()[1]
+        frames = []
+        for path in self._partitions():
+            available = pq.read_schema(path).names
+            wanted = [column for column in columns if column in available] if columns else None
+            frames.append(pq.read_table(path, columns=wanted, memory_map=True).to_pandas())
+        if not frames:
+            return pd.DataFrame(columns=columns or CORE_COLUMNS)
+        df = pd.concat(frames, ignore_index=True)
+        return df.reindex(columns=columns) if columns else df
+
+    def export_csv(self, csv_path):
+        self.read().to_csv(csv_path, index=False)
+
+
+def append_csv(csv_path, df):
+    """
+    Appends rows to a CSV file without rewriting it. The file keeps the header
+    it was created with: columns of `df` outside that header (e.g. the TTFT
+    metrics of the streamed 'ultimate' row) are left out, so they only live in
+    the Parquet partitions, and missing ones are left empty.
+    """
+    import pandas as pd
+
+    if not os.path.isfile(csv_path) or os.path.getsize(csv_path) == 0:
+        df.to_csv(csv_path, index=False)
+        return
+    header = list(pd.read_csv(csv_path, nrows=0).columns)
+    extra = [column for column in df.columns if column not in header]
+    if extra:
+        print(f"ℹ️ {csv_path}: columns {', '.join(extra)} are not part of its header and were not written")
+    df.reindex(columns=header).to_csv(csv_path, mode="a", header=False, index=False)
+
+
+def import_legacy_csv(store, csv_path):
+    """
+    Seeds an empty store from an existing experiment_results.csv.
+    """
+    if store.is_empty() and os.path.isfile(csv_path):
+        import pandas as pd
+
+        print(f"🔁 Importing {csv_path} into the results store at {store.root}")
+        store.append(pd.read_csv(csv_path))
+
+
+def load_results(store, csv_path, columns=None):
+    """
+    Reads results from the store, importing a legacy experiment_results.csv
+    into it the first time the store is found empty.
+    """
+    import_legacy_csv(store, csv_path)
+    return store.read(columns=columns)
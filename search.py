@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+search.py
+---------
+Adaptive search over the prompt × temperature × max_tokens grid for generator.py
+(--search halving).
+
+Successive halving:
+  1) Probe round: every distinct (prompt, temperature) is sampled once with a
+     small max_output_tokens budget (--probe-tokens). Probe rows are stored with
+     Sample = -1 and are not exported to experiment_results.csv.
+  2) Each following round draws one more full-length sample for every surviving
+     cell, scores it with a cheap quick judge, and keeps the top 1/eta cells
+     by mean score.
+  3) The search stops when one cell is left, when the same leader has won
+     `patience` full-sample rounds in a row, or after `max_rounds` rounds.
+
+Only the survivors' samples reach judge.py, so the number of generation calls
+grows with log(grid size) rounds instead of with the full grid × samples.
+"""
+
+import re
+import json
+import math
+from concurrent.futures import ThreadPoolExecutor
+from llm_client import generate, LLMCallError
+
+QUICK_JUDGE_MODEL = "gemini-1.5-flash"
+
+# Sample index marking the cheap probe responses of the first round
+PROBE_SAMPLE = -1
+
+
+class QuickJudge:
+    """
+    Scores single responses 0-10 with a cheap model at temperature 0.
+    """
+
+    def __init__(self, model, concurrency=4):
+        self.model = model
+        self.concurrency = concurrency
+
+    def build_prompt(self, row):
+        return f"""You are a strict reviewer of Requirements Analysis documents for a stock recommendation system (financial ratios + MD&A sentiment from 10-K filings). Rate the document below from 0 to 10 for structure, completeness (functional and non-functional requirements, data sources, processing components, user interactions) and clarity. A document cut off before the end is still rated on what it covers.
+
+DOCUMENT:
+{row["Response Text"]}
+
+Please return ONLY a JSON object with exactly one key: "score". Do not include any additional text or formatting."""
+
+    def score(self, row):
+        try:
+            reply = generate(self.model, self.build_prompt(row),
+                             generation_config={"temperature": 0.0, "max_output_tokens": 64})
+            match = re.search(r"{.*}", reply, re.DOTALL)
+            return float(json.loads(match.group())["score"])
+        except (LLMCallError, AttributeError, KeyError, TypeError, ValueError) as e:
+            print(f"⚠️ WARNING: Quick judge could not score {row['Prompt Type']} | Temp: {row['Temperature']}: {e}")
+            return 0.0
+
+    def score_rows(self, rows):
+        with ThreadPoolExecutor(max_workers=max(1, self.concurrency)) as pool:
+            return list(pool.map(self.score, rows))
+
+
+def _collect(run_jobs, jobs):
+    rows = []
+    failed = run_jobs(jobs, rows.append)
+    return rows, failed
+
+
+def probe_jobs(grid, probe_tokens=256):
+    """
+    Returns (probe key of every cell, {probe key: probe job}): one cheap probe per
+    distinct (prompt, temperature, probe budget).
+    """
+    probe_keys = [(cell[0], cell[2], min(cell[3], probe_tokens)) for cell in grid]
+    jobs = {}
+    for cell, key in zip(grid, probe_keys):
+        jobs.setdefault(key, (cell[0], cell[1], cell[2], key[2], PROBE_SAMPLE))
+    return probe_keys, jobs
+
+
+def planned_calls(grid, eta=3, probe_tokens=256, max_rounds=5):
+    """
+    Upper bound on the generation calls of a search, assuming it never stops
+    early: (probe jobs, number of cells sampled in each round).
+    """
+    eta = max(2, eta)
+    rounds = []
+    survivors = max(1, math.ceil(len(grid) / eta))
+    for _ in range(max_rounds):
+        rounds.append(survivors)
+        if survivors == 1:
+            break
+        survivors = max(1, math.ceil(survivors / eta))
+    return list(probe_jobs(grid, probe_tokens)[1].values()), rounds
+
+
+def _cell_label(cell):
+    prompt_type, _, temp, max_tok = cell
+    return f"{prompt_type} | Temp: {temp} | Max Tokens: {max_tok}"
+
+
+def successive_halving(grid, run_jobs, judge, eta=3, probe_tokens=256, max_rounds=5, patience=2):
+    """
+    Runs the search. `run_jobs(jobs, on_row)` executes generator jobs
+    (prompt_type, prompt_text, temp, max_tok, sample) and returns the number that
+    failed. Returns a dict with the winning cell, the per-round history and the
+    number of failed calls.
+    """
+    eta = max(2, eta)
+    history = []
+    failed = 0
+
+    # Round 0: one cheap probe per distinct (prompt, temperature, probe budget)
+    probe_keys, probes = probe_jobs(grid, probe_tokens)
+    rows, round_failed = _collect(run_jobs, list(probes.values()))
+    failed += round_failed
+    probe_scores = {}
+    for row, score in zip(rows, judge.score_rows(rows)):
+        probe_scores[(row["Prompt Type"], row["Temperature"], row["Max Tokens"])] = score
+        history.append({"Round": 0, "Prompt Type": row["Prompt Type"], "Temperature": row["Temperature"],
+                        "Max Tokens": row["Max Tokens"], "Sample": PROBE_SAMPLE, "Quick Score": score})
+
+    ranking = sorted(range(len(grid)), key=lambda index: -probe_scores.get(probe_keys[index], -1.0))
+    # Cells that differ only in max_tokens share a probe score, so the probe leader is an arbitrary
+    # tie-break; leadership (and with it `patience`) only counts full-sample rounds
+    leaders = []
+    print(f"🏁 Probe round: {len(probes)} probes for {len(grid)} cells, "
+          f"leader {_cell_label(grid[ranking[0]])}")
+
+    cell_index = {(cell[0], cell[2], cell[3]): index for index, cell in enumerate(grid)}
+    full_scores = {index: [] for index in range(len(grid))}
+    survivors = ranking[:max(1, math.ceil(len(ranking) / eta))]
+
+    for round_number in range(1, max_rounds + 1):
+        jobs = [grid[index] + (len(full_scores[index]),) for index in survivors]
+        rows, round_failed = _collect(run_jobs, jobs)
+        failed += round_failed
+        for row, score in zip(rows, judge.score_rows(rows)):
+            index = cell_index[(row["Prompt Type"], row["Temperature"], row["Max Tokens"])]
+            full_scores[index].append(score)
+            history.append({"Round": round_number, "Prompt Type": row["Prompt Type"],
+                            "Temperature": row["Temperature"], "Max Tokens": row["Max Tokens"],
+                            "Sample": row["Sample"], "Quick Score": score})
+
+        survivors = sorted(
+            survivors,
+            key=lambda index: -(sum(full_scores[index]) / len(full_scores[index])) if full_scores[index] else 1.0
+        )
+        leaders.append(survivors[0])
+        best = full_scores[survivors[0]]
+        print(f"🏁 Round {round_number}: {len(jobs)} cells sampled, leader {_cell_label(grid[survivors[0]])} "
+              f"(mean quick score {sum(best) / max(1, len(best)):.2f} over {len(best)} samples)")
+
+        stable = len(leaders) >= patience and len(set(leaders[-patience:])) == 1
+        if len(survivors) == 1 or stable:
+            break
+        survivors = survivors[:max(1, math.ceil(len(survivors) / eta))]
+
+    winner = leaders[-1] if leaders else ranking[0]
+    calls = len(history)
+    print(f"✅ Search finished after {calls} generation calls (exhaustive grid: {len(grid)} full-length calls); "
+          f"best cell: {_cell_label(grid[winner])}")
+    return {"winner": winner, "cell": grid[winner], "history": history, "failed": failed, "calls": calls}
+
+
+def save_search_history(path, search):
+    import pandas as pd
+
+    pd.DataFrame(search["history"]).to_csv(path, index=False)
+    print(f"📄 Search history saved to: {path}")
@@ -0,0 +1,38 @@
+"""
+Shared pytest setup: every test runs against the mock backend (backends.py)
+in its own scratch directory, so the relative artifacts/ paths of the stages
+never touch the repository.
+"""
+
+import os
+import sys
+
+# Set before the stage modules are imported: several read these at import time
+os.environ.update({
+    "DAPO_BACKEND": "mock",
+    "DAPO_MOCK_LATENCY": "0",
+    "DAPO_CACHE": "0",
+    "DAPO_FIRESTORE": "none",
+    "GEMINI_RPM": "100000",
+    "GEMINI_TPM": "1000000000",
+})
+os.environ.pop("DAPO_RUN_ID", None)
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def scratch_dir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    yield tmp_path
+    # generator.main exports the run id of its sweep
+    os.environ.pop("DAPO_RUN_ID", None)
+
+
+@pytest.fixture
+def mock_model():
+    from backends import MockGenerativeModel
+
+    return MockGenerativeModel("gemini-1.5-pro", latency_seconds=0.0)
@@ -0,0 +1,44 @@
+import json
+
+from backends import MockGenerativeModel, MockQuotaError
+
+
+def test_mock_is_deterministic(mock_model):
+    config = {"temperature": 0.3, "max_output_tokens": 1024}
+    first = mock_model.generate_content("Describe the system.", generation_config=config)
+    second = MockGenerativeModel("gemini-1.5-pro", latency_seconds=0.0).generate_content(
+        "Describe the system.", generation_config=config)
+    assert first.text == second.text
+    assert first.text.startswith("## Requirement Analysis")
+
+
+def test_mock_truncates_at_max_output_tokens():
+    model = MockGenerativeModel("gemini-1.5-pro", latency_seconds=0.0, output_tokens=2000)
+    response = model.generate_content("Describe the system.", generation_config={"max_output_tokens": 100})
+    assert response.candidates[0].finish_reason.name == "MAX_TOKENS"
+    assert response.usage_metadata.candidates_token_count == 100
+
+
+def test_mock_answers_json_prompts(mock_model):
+    prompt = 'Please return ONLY a JSON object with exactly three keys: "best_row", "score", and "reasoning".'
+    reply = json.loads(mock_model.generate_content(prompt).text)
+    assert reply["best_row"] == 0
+    assert 5 <= reply["score"] <= 9
+    assert isinstance(reply["reasoning"], str)
+
+
+def test_mock_streams_the_same_text(mock_model):
+    config = {"temperature": 0.3, "max_output_tokens": 1024}
+    chunks = "".join(chunk.text for chunk in mock_model.generate_content("Stream it.", generation_config=config,
+                                                                         stream=True))
+    assert chunks == mock_model.generate_content("Stream it.", generation_config=config).text
+
+
+def test_mock_error_rate_raises_quota_errors():
+    model = MockGenerativeModel("gemini-1.5-pro", latency_seconds=0.0, error_rate=1.0)
+    try:
+        model.generate_content("Anything")
+    except MockQuotaError as e:
+        assert "429" in str(e)
+    else:
+        raise AssertionError("expected a quota error")
@@ -0,0 +1,58 @@
+import time
+
+import pytest
+
+import generator
+import metrics
+from batch_prediction import (DEFAULT_TIMEOUT_SECONDS, STATE_RUNNING, BatchJobError, LocalBatchClient, parse_prediction,
+                              run_batch_job)
+
+
+def test_local_job_is_polled_without_the_vertex_interval(mock_model, tmp_path):
+    jobs = [("cot", "Describe the system.", 0.3, 512, sample) for sample in range(2)]
+    jobs.append(("zero_shot", "Another prompt.", 0.5, 768, 0))
+    start = time.monotonic()
+    results = run_batch_job(LocalBatchClient(mock_model, root=str(tmp_path / "jobs")), jobs, str(tmp_path))
+    assert time.monotonic() - start < 5
+    assert [job for job, _ in results] == jobs
+    assert all(prediction is not None and not prediction[5] for _, prediction in results)
+    # Identical requests (samples of one cell) are matched in order
+    assert results[0][1][1] == results[1][1][1]
+
+
+def test_failed_prediction_keeps_its_status():
+    line = {"request": {"contents": []}, "response": None, "status": "INVALID_ARGUMENT"}
+    assert parse_prediction(line) == ({"contents": []}, "", 0, 0, "", "INVALID_ARGUMENT")
+
+
+def test_batch_rows_stay_out_of_the_latency_stats():
+    metrics.record_call("gemini-1.5-pro", 2.0, 10, 10)
+    metrics.record_call("gemini-1.5-pro", None, 10, 10, cost_factor=0.5)
+    summary = metrics.summarize(metrics.read_log())
+    stage = summary[metrics.current_stage()]
+    assert stage["calls"] == 2
+    assert stage["p50_latency"] == 2.0
+
+
+def test_generator_batch_sweep_on_the_local_stand_in():
+    df = generator.main(["--batch-prediction", "local", "--temperatures", "0.3", "--max-tokens", "512"])
+    assert len(df) == len(generator.prompt_types)
+    assert df["Latency (s)"].isna().all()
+    assert (df["Cost (USD)"] > 0).all()
+
+
+class StuckClient:
+    poll_seconds = 0.01
+
+    def submit(self, input_path):
+        return "stuck-job"
+
+    def state(self, job_id):
+        return STATE_RUNNING
+
+
+def test_stuck_job_times_out(tmp_path):
+    with pytest.raises(BatchJobError, match="did not finish within"):
+        run_batch_job(StuckClient(), [("cot", "Describe the system.", 0.3, 512, 0)], str(tmp_path), timeout_seconds=0.05)
+    assert generator.parse_args([]).batch_timeout == DEFAULT_TIMEOUT_SECONDS
+    assert generator.parse_args(["--batch-timeout", "600"]).batch_timeout == 600
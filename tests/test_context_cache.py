@@ -0,0 +1,31 @@
+import json
+
+import context_cache
+
+
+def test_local_cache_is_created_once_and_sends_the_prefix(mock_model, monkeypatch):
+    monkeypatch.setattr(context_cache, "_models", {})
+    first = context_cache.prefix_model(mock_model, "DATASET: rows", kind="local", ttl_seconds=60)
+    assert first is not None
+    assert context_cache.prefix_model(mock_model, "DATASET: rows", kind="local") is first
+
+    with open(context_cache.LOCAL_REGISTRY_PATH) as f:
+        assert list(json.load(f)) == [first.prefix_digest]
+    response = first.generate_content("Pick the best row.")
+    assert response.usage_metadata.cached_content_token_count == context_cache.estimate_tokens("DATASET: rows")
+
+
+def test_expired_local_entry_is_recreated(mock_model, monkeypatch):
+    monkeypatch.setattr(context_cache, "_models", {})
+    expired = context_cache.prefix_model(mock_model, "DATASET: rows", kind="local", ttl_seconds=-5)
+    created = context_cache.stats["created"]
+    renewed = context_cache.prefix_model(mock_model, "DATASET: rows", kind="local", ttl_seconds=60)
+    assert renewed is not expired
+    assert context_cache.stats["created"] == created + 1
+
+
+def test_gemini_cache_needs_a_budget_above_its_minimum(mock_model):
+    assert context_cache.prefix_model(mock_model, "x", kind="off") is None
+    assert context_cache.prefix_model(mock_model, "x" * 10 ** 6, kind="gemini",
+                                      prompt_budget=context_cache.MIN_CACHE_TOKENS - 1) is None
+    assert context_cache.prefix_model(mock_model, "x", kind="gemini") is None
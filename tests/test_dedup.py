@@ -0,0 +1,37 @@
+import pandas as pd
+
+from dedup import assign_clusters, cluster_labels, representatives
+
+BASE = ("The system shall ingest SEC 10-K filings, compute profitability, liquidity and solvency ratios, "
+        "score the sentiment of the MD&A section and recommend Buy, Hold or Sell with an explanation. ") * 4
+OTHER = ("A dashboard lets analysts browse recommendations, filter companies by sector and export "
+         "reports, while an audit log records every data refresh and model version. ") * 4
+
+
+def test_near_duplicates_share_a_cluster():
+    near = BASE.replace("explanation.", "explanation!", 1)
+    assert cluster_labels([BASE, near, OTHER]) == [0, 0, 1]
+
+
+def test_threshold_controls_merging():
+    half = " ".join(BASE.split()[:60] + OTHER.split()[:60])
+    assert cluster_labels([BASE, half], threshold=0.9) == [0, 1]
+    assert cluster_labels([BASE, half], threshold=0.1) == [0, 0]
+
+
+def test_empty_texts_are_never_merged():
+    assert cluster_labels(["", "", BASE]) == [0, 1, 2]
+
+
+def test_labels_are_deterministic():
+    texts = [BASE, OTHER, BASE + " Extra sentence here.", OTHER]
+    assert cluster_labels(texts) == cluster_labels(texts)
+
+
+def test_representatives_keep_one_row_per_cluster():
+    df = pd.DataFrame({"Prompt Type": ["cot", "cot", "few_shots", "ultimate"],
+                       "Response Text": [BASE, BASE, OTHER, BASE]})
+    clustered = assign_clusters(df)
+    assert clustered["Cluster Size"].tolist() == [3, 3, 1, 3]
+    assert representatives(clustered).index.tolist() == [0, 2]
+    assert representatives(clustered, keep_prompt_types=("ultimate",)).index.tolist() == [0, 2, 3]
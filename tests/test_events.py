@@ -0,0 +1,43 @@
+import events
+
+
+def event(kind, ts, stage="generator", **fields):
+    return dict(fields, event=kind, ts=ts, stage=stage, pid=1)
+
+
+def test_stage_progress_counts_calls_and_estimates_eta():
+    state = events.StageProgress()
+    for item in [event("stage_start", 0.0), event("progress", 0.0, done=0, total=10),
+                 event("call_start", 0.5, call_id="a"), event("call_start", 0.5, call_id="b"),
+                 event("call_end", 1.0, call_id="a", ok=True, cached=False),
+                 event("call_retry", 1.5), event("call_end", 2.0, call_id="b", ok=False),
+                 event("progress", 2.0, done=4, total=10)]:
+        state.update(item)
+    assert (state.calls, state.errors, state.retries, state.in_flight) == (2, 1, 1, set())
+    assert state.eta(now=2.0) == 3.0
+    line = state.render("generator", now=2.0)
+    assert "4/10 items" in line and "errors 50.0%" in line and "ETA 3s" in line
+
+
+def test_profile_splits_wall_time_by_stage():
+    log = [event("stage_start", 0.0), event("call_end", 1.0, latency_seconds=2.0, wait_seconds=0.5, ok=True),
+           event("call_end", 1.5, latency_seconds=2.0, ok=True, cached=True),
+           event("call_retry", 1.6, delay_seconds=0.25), event("stage_end", 2.0, seconds=2.0),
+           event("call_end", 3.0, stage="judge", latency_seconds=1.0, ok=False)]
+    summary = events.profile(log)
+    generator = summary["generator"]
+    assert generator["wall_seconds"] == 2.0 and generator["calls"] == 2 and generator["cached"] == 1
+    assert generator["mean_in_flight"] == 2.0
+    assert (generator["wait_seconds"], generator["retry_seconds"]) == (0.5, 0.25)
+    assert summary["judge"]["error_rate"] == 1.0
+
+
+def test_monitor_reads_only_complete_lines(tmp_path):
+    path = str(tmp_path / "events.jsonl")
+    events.emit("call_start", path=path, stage="jury", call_id="a")
+    with open(path, "a") as f:
+        f.write('{"event": "call_end"')
+    monitor = events.ProgressMonitor(path=path)
+    assert monitor.poll() == {"jury"}
+    assert monitor.stages["jury"].in_flight == {"a"}
+    assert monitor.poll() == set()
@@ -0,0 +1,62 @@
+import json
+
+import pandas as pd
+
+from executioner import project_filename, read_projects, render_prompt, run_batch
+
+PROJECT = {"project_id": "p-1", "title": "ProfitScout", "description": "Stock picks from 10-K filings."}
+
+
+def test_placeholders_are_filled_and_other_braces_kept():
+    prompt = 'Analyse {title}: {description} Return JSON like {"score": 1} or {} or {0}; keep {unknown}.'
+    assert render_prompt(prompt, PROJECT) == ('Analyse ProfitScout: Stock picks from 10-K filings. Return JSON like '
+                                              '{"score": 1} or {} or {0}; keep {unknown}.')
+
+
+def test_unbalanced_braces_do_not_break_rendering():
+    assert render_prompt("Write about {title} {", PROJECT) == "Write about ProfitScout {"
+
+
+def test_prompt_without_placeholders_gets_the_project_appended():
+    assert render_prompt("Write a Requirements Analysis.", PROJECT) == (
+        "Write a Requirements Analysis.\n\nPROJECT: ProfitScout\nStock picks from 10-K filings.")
+
+
+def test_project_filenames_do_not_collide():
+    names = {project_filename(project_id) for project_id in ("a/b", "a_b", "a b", "a?b")}
+    assert len(names) == 4
+    assert all(name.startswith("a_b-") for name in names)
+    assert project_filename("a/b") == project_filename("a/b")
+
+
+def test_batch_runs_every_project_and_resumes(tmp_path, mock_model):
+    batch = tmp_path / "projects.jsonl"
+    batch.write_text("\n".join(json.dumps(row) for row in [
+        PROJECT, {"id": "a/b", "body": "Second"}, {"request_id": "a_b", "title": "Third"}]) + "\n")
+    assert [project["project_id"] for project in read_projects(str(batch))] == ["p-1", "a/b", "a_b"]
+
+    results = run_batch(mock_model, "Write about {title}.", str(batch), str(tmp_path / "out"), stream=False)
+    assert results["Project ID"].tolist() == ["p-1", "a/b", "a_b"]
+    assert results["Markdown Path"].nunique() == 3
+    calls = mock_model.calls
+    results = run_batch(mock_model, "Write about {title}.", str(batch), str(tmp_path / "out"), resume=True)
+    assert mock_model.calls == calls
+    assert len(pd.read_csv(tmp_path / "out" / "batch_results.csv")) == 3
+
+
+def test_prompt_selected_in_another_run_is_rejected(monkeypatch, mock_model):
+    import os
+
+    import pytest
+
+    import executioner
+
+    os.makedirs("artifacts")
+    with open(os.path.join("artifacts", "best_prompt.json"), "w") as f:
+        json.dump({"ultimate_prompt": "Write a Requirements Analysis.", "run_id": "old-run"}, f)
+    monkeypatch.setenv("DAPO_RUN_ID", "new-run")
+    with pytest.raises(ValueError, match="selected in run old-run"):
+        executioner.main(["--no-stream"], model=mock_model)
+    monkeypatch.setenv("DAPO_RUN_ID", "old-run")
+    df = executioner.main(["--no-stream"], model=mock_model, df=pd.DataFrame(columns=["Prompt Type"]))
+    assert df["Run ID"].tolist() == ["old-run"]
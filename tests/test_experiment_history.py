@@ -0,0 +1,63 @@
+import os
+
+import pandas as pd
+import pytest
+
+import experiment_history
+from experiment_history import RUN_ID_COLUMN, ExperimentHistory, current_run_id, rows_of_run, start_run
+
+
+def results(run_ids):
+    return pd.DataFrame({"Prompt Type": [f"type-{index}" for index in range(len(run_ids))], RUN_ID_COLUMN: run_ids})
+
+
+def test_rows_of_run_keeps_only_the_run():
+    df = results(["a", "b", "b"])
+    assert list(rows_of_run(df, "b")["Prompt Type"]) == ["type-1", "type-2"]
+    assert rows_of_run(df, None) is df
+
+
+def test_rows_of_run_rejects_an_unknown_run():
+    with pytest.raises(ValueError, match="No rows of run c"):
+        rows_of_run(results(["a", "b"]), "c")
+
+
+def test_tables_without_run_ids_are_returned_unchanged():
+    legacy = pd.DataFrame({"Prompt Type": ["zero-shot"]})
+    assert rows_of_run(legacy, "a") is legacy
+    unlabelled = results([None, None])
+    assert rows_of_run(unlabelled, "a") is unlabelled
+
+
+def test_start_run_exports_the_id_and_later_stages_find_it():
+    run_id = start_run()
+    assert current_run_id() == run_id
+    # A stage in another process only finds the run in the history
+    os.environ.pop(experiment_history.RUN_ID_ENV)
+    assert current_run_id() == run_id
+    assert start_run(resume=True) == run_id
+
+
+def test_each_sweep_gets_a_new_run_unless_pinned_or_resuming(monkeypatch):
+    first = start_run()
+    second = start_run()
+    assert second != first
+    assert start_run(resume=True) == second
+    monkeypatch.setenv(experiment_history.RUN_ID_ENV, "pinned")
+    assert start_run() == start_run() == "pinned"
+
+
+def test_lineage_links_selection_execution_and_verdict():
+    with ExperimentHistory() as history:
+        history.add_run("r1")
+        history.record_cells("r1", pd.DataFrame([{"Prompt Type": "cot", "Temperature": 0.3, "Max Tokens": 512,
+                                                  "Actual Prompt": "p", "Response Text": "r"}]))
+        cell_id = history.find_cell("r1", "cot", 0.3, 512)
+        selection = history.record_event("r1", "selection", input_text="p", output_text="ultimate", cell_id=cell_id)
+        execution = history.record_event("r1", "execution", output_text="analysis")
+        history.record_event("r1", "verdict", output_text="report")
+        events = history.lineage("r1")
+        assert [event["kind"] for event in events] == ["selection", "execution", "verdict"]
+        assert [event["parent_id"] for event in events] == [None, selection, execution]
+        assert {event["prompt_type"] for event in events} == {"cot"}
+        assert history.best_prompt_per_run()[0]["ultimate_prompt"] == "ultimate"
@@ -0,0 +1,88 @@
+import threading
+import time
+
+from firestore_sink import MAX_BATCH_SIZE, FirestoreBatchWriter
+
+
+class FakeBatch:
+    def __init__(self, client):
+        self.client = client
+        self.documents = []
+
+    def set(self, reference, document):
+        self.documents.append(document)
+
+    def commit(self):
+        with self.client.lock:
+            self.client.commits.append(self.documents)
+
+
+class FakeCollection:
+    def document(self):
+        return object()
+
+
+class FakeClient:
+    """Records the documents of every committed batch."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.commits = []
+
+    def collection(self, name):
+        return FakeCollection()
+
+    def batch(self):
+        return FakeBatch(self)
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out waiting for the writer thread"
+        time.sleep(0.01)
+
+
+def test_full_batch_is_committed_without_waiting_for_the_interval():
+    client = FakeClient()
+    writer = FirestoreBatchWriter(client_factory=lambda: client, flush_interval=60)
+    for index in range(MAX_BATCH_SIZE + 1):
+        writer.add({"index": index})
+    wait_for(lambda: client.commits)
+    assert [len(batch) for batch in client.commits] == [MAX_BATCH_SIZE]
+    writer.close()
+    assert [len(batch) for batch in client.commits] == [MAX_BATCH_SIZE, 1]
+    assert writer.written == MAX_BATCH_SIZE + 1
+
+
+def test_partial_batch_is_committed_after_the_flush_interval():
+    client = FakeClient()
+    writer = FirestoreBatchWriter(client_factory=lambda: client, flush_interval=0.05)
+    writer.add({"index": 0})
+    writer.add({"index": 1})
+    wait_for(lambda: client.commits)
+    assert client.commits == [[{"index": 0}, {"index": 1}]]
+    writer.close()
+    assert writer.written == 2
+
+
+def test_close_flushes_the_queued_documents():
+    client = FakeClient()
+    writer = FirestoreBatchWriter(client_factory=lambda: client, flush_interval=60)
+    for index in range(3):
+        writer.add({"index": index})
+    assert client.commits == []
+    writer.close()
+    assert client.commits == [[{"index": 0}, {"index": 1}, {"index": 2}]]
+    assert (writer.written, writer.failed) == (3, 0)
+
+
+def test_documents_are_counted_as_failed_when_the_client_cannot_be_created():
+    def no_client():
+        raise RuntimeError("no credentials")
+
+    writer = FirestoreBatchWriter(client_factory=no_client, flush_interval=60)
+    for index in range(3):
+        writer.add({"index": index})
+    writer.close()
+    assert (writer.written, writer.failed) == (0, 3)
@@ -0,0 +1,113 @@
+import json
+
+import pandas as pd
+import pytest
+
+import generator
+import llm_client
+from backends import MockGenerativeModel, MockQuotaError
+from prescore import prescore
+
+
+class ListTracker:
+    def __init__(self):
+        self.docs = []
+
+    def add(self, doc):
+        self.docs.append(doc)
+
+
+class QuotaOnceModel:
+    """Answers like the mock after one 429."""
+
+    def __init__(self):
+        self.model_name = "models/gemini-1.5-pro"
+        self.failed = False
+        self._model = MockGenerativeModel("gemini-1.5-pro", latency_seconds=0.0)
+
+    def generate_content(self, contents, **kwargs):
+        if not self.failed:
+            self.failed = True
+            raise MockQuotaError()
+        return self._model.generate_content(contents, **kwargs)
+
+
+def test_retry_backoff_is_queue_wait_not_latency(monkeypatch):
+    monkeypatch.setattr(llm_client, "backoff_delay", lambda attempt: 0.2)
+    tracker = ListTracker()
+    row = generator.run_experiment(QuotaOnceModel(), tracker, "cot", "Describe the system.", 0.3, 512)
+    assert row["Retries"] == 1
+    assert row["Latency (s)"] < 0.1
+    assert row["Queue Wait (s)"] >= 0.2
+    assert tracker.docs[0]["queue_wait_seconds"] >= 0.2
+
+
+class CountingModel:
+    def __init__(self, model):
+        self.model_name = model.model_name
+        self.calls = 0
+        self._model = model
+
+    def generate_content(self, contents, **kwargs):
+        self.calls += 1
+        return self._model.generate_content(contents, **kwargs)
+
+
+def test_resume_runs_only_the_missing_draws_and_drops_a_partial_last_line(mock_model):
+    argv = ["--temperatures", "0.3", "--max-tokens", "512", "--samples", "2"]
+    full = generator.main(argv, model=mock_model)
+    total = len(generator.prompt_types) * 2
+    assert len(full) == total
+
+    # Simulate a crash: three draws made it to disk, the fourth was cut off mid-line
+    with open(generator.jsonl_file_path, encoding="utf-8") as f:
+        lines = f.readlines()
+    with open(generator.jsonl_file_path, "w", encoding="utf-8") as f:
+        f.writelines(lines[:3])
+        f.write(lines[3][:len(lines[3]) // 2])
+
+    model = CountingModel(mock_model)
+    resumed = generator.main(argv + ["--resume"], model=model)
+    assert model.calls == total - 3
+    with open(generator.jsonl_file_path, encoding="utf-8") as f:
+        rows = [json.loads(line) for line in f]
+    assert len(rows) == total
+    assert resumed[generator.CELL_KEY_COLUMNS].equals(full[generator.CELL_KEY_COLUMNS])
+
+
+class VaryingModel:
+    """The mock answers identical requests identically; a per-call seed makes every draw differ."""
+
+    def __init__(self, model):
+        self.model_name = model.model_name
+        self.calls = 0
+        self._model = model
+
+    def generate_content(self, contents, generation_config=None, **kwargs):
+        self.calls += 1
+        return self._model.generate_content(contents, generation_config=dict(generation_config, seed=self.calls),
+                                            **kwargs)
+
+
+def test_cell_stats_aggregate_the_samples_of_every_cell(mock_model):
+    df = generator.main(["--temperatures", "0.9", "--max-tokens", "64", "2048", "--samples", "3", "--concurrency", "1"],
+                        model=VaryingModel(mock_model))
+    stats = pd.read_csv(generator.cell_stats_path)
+    assert len(stats) == len(generator.prompt_types) * 2
+    assert (stats["Samples"] == 3).all()
+
+    scored = prescore(df)
+    scored["Pre-Score"] = scored["Pre-Score"].clip(lower=0.0)
+    for _, cell in stats.iterrows():
+        draws = scored[(scored["Prompt Type"] == cell["Prompt Type"]) & (scored["Max Tokens"] == cell["Max Tokens"])]
+        assert cell["Pre-Score Mean"] == pytest.approx(draws["Pre-Score"].mean(), abs=1e-4)
+        assert cell["Pre-Score Std"] == pytest.approx(draws["Pre-Score"].std(), abs=1e-4)
+        assert cell["Truncated Rate"] == pytest.approx(draws["Truncated"].mean(), abs=1e-4)
+        assert cell["Distinct Clusters"] == draws["Cluster"].nunique()
+
+    # Every 64-token draw is cut off; the roomy cells vary from sample to sample
+    assert (stats.loc[stats["Max Tokens"] == 64, "Truncated Rate"] == 1.0).all()
+    roomy = stats[stats["Max Tokens"] == 2048]
+    assert (roomy["Truncated Rate"] == 0.0).all()
+    assert (roomy["Pre-Score Std"] > 0).any()
+    assert (roomy["Distinct Clusters"] > 1).any()
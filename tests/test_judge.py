@@ -0,0 +1,152 @@
+import json
+import os
+import threading
+
+import pandas as pd
+import pytest
+
+import judge
+from backends import MockResponse
+from llm_client import estimate_tokens
+
+
+class RecordingModel:
+    def __init__(self, model):
+        self.model_name = model.model_name
+        self.prompts = []
+        self._model = model
+
+    def generate_content(self, contents, **kwargs):
+        self.prompts.append(contents)
+        return self._model.generate_content(contents, **kwargs)
+
+
+def rows(count, words=300):
+    return [{"Prompt Type": f"type-{index}", "Actual Prompt": f"prompt {index}", "Temperature": 0.5,
+             "Max Tokens": 1024, "Response Text": " ".join([f"word{index}"] * words)} for index in range(count)]
+
+
+def test_reduce_candidates_keeps_every_prompt_within_the_budget(mock_model):
+    model = RecordingModel(mock_model)
+    survivors = judge.reduce_candidates(model, rows(40), batch_size=8, concurrency=2, prompt_budget=2000)
+    assert model.prompts
+    assert all(estimate_tokens(prompt) <= 2000 for prompt in model.prompts)
+    assert estimate_tokens(judge.build_judge_prompt(survivors)) <= 2000
+    assert 1 <= len(survivors) <= 8
+
+
+def test_reduce_candidates_skips_the_map_step_when_everything_fits(mock_model):
+    model = RecordingModel(mock_model)
+    data = rows(3, words=20)
+    assert judge.reduce_candidates(model, data, batch_size=8) == data
+    assert model.prompts == []
+
+
+def test_judge_and_jury_dry_runs_make_no_calls(monkeypatch, capsys):
+    import generator
+    import jury
+    import llm_client
+
+    df = generator.main(["--temperatures", "0.3", "0.7", "--max-tokens", "512"])
+    calls = llm_client.stats["calls"]
+    monkeypatch.setattr(judge, "configure_model", None)
+    monkeypatch.setattr(jury, "configure_model", None)
+
+    for mode in ("hierarchical", "single", "tournament"):
+        assert judge.main(["--dry-run", "--judge-mode", mode, "--batch-size", "3"], df=df) is df
+    assert jury.main(["--dry-run", "--tournament"], df=df) is df
+    assert jury.main(["--dry-run", "--prompt-budget", "3000"], df=df) is df
+
+    output = capsys.readouterr().out
+    assert "🧪 Dry run (hierarchical)" in output and "🧪 Dry run (tournament)" in output
+    assert "plus a merge call" in output
+    assert llm_client.stats["calls"] == calls
+    assert not os.path.exists(os.path.join("artifacts", "best_prompt.json"))
+    assert not os.path.exists(os.path.join("artifacts", ".cache", "comparisons.sqlite"))
+
+
+def test_cached_candidates_are_shared_by_every_map_batch(mock_model, monkeypatch):
+    import argparse
+
+    import context_cache
+
+    model = RecordingModel(mock_model)
+    monkeypatch.setattr(context_cache, "_models", {})
+    monkeypatch.setattr(context_cache, "_gemini_model", lambda name, prefix, digest, ttl_seconds:
+                        context_cache._local_model(model, prefix, digest, ttl_seconds))
+    data = [dict(row, Row=index) for index, row in enumerate(rows(40, words=800))]
+    args = argparse.Namespace(prompt_budget=65536, context_cache="gemini", context_cache_ttl=60)
+    cached = judge.cache_candidates(mock_model, data, args)
+    assert cached is not None
+
+    survivors = judge.reduce_candidates(model, data, batch_size=8, context_model=cached)
+    block = judge.build_dataset_block(data)
+    assert len(model.prompts) == 5 and len(survivors) == 5
+    assert all(prompt.startswith(block) and estimate_tokens(prompt) <= 65536 for prompt in model.prompts)
+    assert all(estimate_tokens(prompt) - estimate_tokens(block) < 200 for prompt in model.prompts)
+
+    args.prompt_budget = 20000
+    assert judge.cache_candidates(mock_model, data, args) is None
+
+
+class ScriptedRefinementModel:
+    """Numbers every drafted prompt and answers the round judge with the next scripted verdict."""
+
+    def __init__(self, model, verdicts):
+        self.model_name = model.model_name
+        self.verdicts = list(verdicts)
+        self.drafts = 0
+        self.judged = 0
+        self._lock = threading.Lock()
+        self._model = model
+
+    def generate_content(self, contents, **kwargs):
+        if contents.startswith("You are an AI judge comparing prompts"):
+            self.judged += 1
+            verdict = self.verdicts.pop(0)
+            return MockResponse(json.dumps(dict(verdict, reasoning="scripted")), 100, 20)
+        if contents.startswith("You are tasked with refining"):
+            with self._lock:
+                self.drafts += 1
+                number = self.drafts
+            return MockResponse(f"Draft {number}: list every stakeholder, constraint and acceptance test.", 100, 20)
+        return self._model.generate_content(contents, **kwargs)
+
+
+def refinement_args(*argv):
+    return judge.parse_args(["--candidates", "2", "--concurrency", "1", *argv])
+
+
+def test_refinement_stops_when_no_candidate_beats_the_incumbent(mock_model):
+    model = ScriptedRefinementModel(mock_model, [
+        {"best_row": 2, "best_score": 8, "incumbent_score": 6},
+        {"best_row": 0, "best_score": 8, "incumbent_score": 8},
+    ])
+    final = judge.refinement_loop(model, {"best_prompt": "Describe the system."}, refinement_args("--rounds", "5"),
+                                  history_path="history.csv")
+    assert final == "Draft 2: list every stakeholder, constraint and acceptance test."
+    assert model.judged == 2
+
+    history = pd.read_csv("history.csv")
+    assert history["Round"].tolist() == [0, 1, 1, 2, 2]
+    assert history["Candidate"].tolist() == [0, 1, 2, 1, 2]
+    assert history["Selected"].tolist() == [True, False, True, False, False]
+    assert history.loc[2, "Score"] == 8
+    assert history.loc[1:, "Edit Distance"].gt(0).all()
+
+
+def test_refinement_stops_after_the_maximum_rounds(mock_model):
+    model = ScriptedRefinementModel(mock_model, [{"best_row": 1, "best_score": 7 + round_number, "incumbent_score": 6}
+                                                 for round_number in range(3)])
+    final = judge.refinement_loop(model, {"best_prompt": "Describe the system."}, refinement_args("--rounds", "2"),
+                                  history_path="history.csv")
+    assert model.judged == 2
+    # Round 2 refines the round 1 winner (draft 1) into drafts 3 and 4
+    assert final == "Draft 3: list every stakeholder, constraint and acceptance test."
+    history = pd.read_csv("history.csv")
+    assert history[history["Selected"]][["Round", "Candidate"]].values.tolist() == [[0, 0], [1, 1], [2, 1]]
+
+
+def test_tournament_without_candidates_raises_a_clear_error(mock_model):
+    with pytest.raises(ValueError, match="No candidates"):
+        judge.run_tournament(mock_model, [], ranking_path="ranking.csv")
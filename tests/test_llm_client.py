@@ -0,0 +1,133 @@
+import pytest
+
+import llm_client
+import metrics
+from backends import MockGenerativeModel, MockQuotaError
+from llm_client import LLMCallError, RateLimiter
+
+
+class FakeClock:
+    """Stands in for the time module: sleep() advances monotonic() instead of waiting."""
+
+    def __init__(self):
+        self.now = 0.0
+        self.slept = 0.0
+
+    def monotonic(self):
+        return self.now
+
+    perf_counter = monotonic
+
+    def sleep(self, seconds):
+        self.now += seconds
+        self.slept += seconds
+
+
+class StatusError(Exception):
+    def __init__(self, message, code):
+        super().__init__(message)
+        self.code = code
+
+
+class FlakyModel:
+    """Raises `errors` one after another before answering like the mock."""
+
+    def __init__(self, *errors):
+        self.model_name = "models/gemini-1.5-pro"
+        self.errors = list(errors)
+        self.calls = 0
+        self._model = MockGenerativeModel("gemini-1.5-pro", latency_seconds=0.0)
+
+    def generate_content(self, contents, **kwargs):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return self._model.generate_content(contents, **kwargs)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(llm_client, "time", clock)
+    return clock
+
+
+def test_bucket_allows_a_burst_of_one_minute_then_throttles(clock):
+    limiter = RateLimiter(requests_per_minute=60, tokens_per_minute=10**9)
+    for _ in range(60):
+        limiter.acquire(1)
+    assert clock.slept == 0.0
+    limiter.acquire(1)
+    assert clock.slept == pytest.approx(1.0)
+
+
+def test_bucket_waits_for_the_token_budget(clock):
+    limiter = RateLimiter(requests_per_minute=1000, tokens_per_minute=1000)
+    limiter.acquire(600)
+    limiter.acquire(600)
+    # 200 tokens short at 1000 tokens/minute
+    assert clock.slept == pytest.approx(12.0)
+    assert limiter.throttled_seconds == pytest.approx(12.0)
+
+
+def test_pause_stops_every_caller(clock):
+    limiter = RateLimiter(requests_per_minute=1000, tokens_per_minute=10**9)
+    limiter.pause(5.0)
+    limiter.acquire(1)
+    assert clock.slept == pytest.approx(5.0)
+
+
+def test_backoff_is_capped_full_jitter(monkeypatch):
+    monkeypatch.setattr(llm_client.random, "uniform", lambda low, high: high)
+    delays = [llm_client.backoff_delay(attempt) for attempt in range(12)]
+    assert delays[:3] == [llm_client.BACKOFF_BASE_SECONDS * 2 ** attempt for attempt in range(3)]
+    assert max(delays) == llm_client.BACKOFF_MAX_SECONDS
+    monkeypatch.setattr(llm_client.random, "uniform", lambda low, high: low)
+    assert llm_client.backoff_delay(5) == 0
+
+
+@pytest.mark.parametrize("error, retryable, quota", [
+    (MockQuotaError(), True, True),
+    (StatusError("backend error", 503), True, False),
+    (StatusError("Service Unavailable", 400), False, False),
+    (ValueError("max_output_tokens 5000 is out of range"), False, False),
+    (ValueError("504 Deadline Exceeded"), True, False),
+    (ConnectionError("reset by peer"), True, False),
+])
+def test_errors_are_classified_by_type_and_status(error, retryable, quota):
+    assert llm_client.is_retryable(error) is retryable
+    assert llm_client.is_quota_error(error) is quota
+
+
+def test_generate_retries_transient_errors(clock):
+    model = FlakyModel(MockQuotaError(), StatusError("unavailable", 503))
+    retries = llm_client.stats["retries"]
+    text = llm_client.generate(model, "Describe the system.", limiter=RateLimiter(10**6, 10**9))
+    assert text.startswith("## Requirement Analysis")
+    assert model.calls == 3
+    assert llm_client.stats["retries"] == retries + 2
+
+
+def test_generate_does_not_retry_permanent_errors(clock):
+    model = FlakyModel(StatusError("invalid argument", 400))
+    with pytest.raises(LLMCallError):
+        llm_client.generate(model, "Describe the system.", limiter=RateLimiter(10**6, 10**9))
+    assert model.calls == 1
+
+
+def test_generate_gives_up_after_max_retries(clock):
+    model = FlakyModel(*[MockQuotaError() for _ in range(3)])
+    with pytest.raises(LLMCallError):
+        llm_client.generate(model, "Describe the system.", limiter=RateLimiter(10**6, 10**9), max_retries=2)
+    assert model.calls == 3
+
+
+def test_stream_records_time_to_first_token():
+    model = MockGenerativeModel("gemini-1.5-pro", latency_seconds=0.02, seconds_per_token=0.0005)
+    chunks = []
+    text, record = llm_client.generate_stream(model, "Describe the system.", on_chunk=chunks.append,
+                                              limiter=RateLimiter(10**6, 10**9))
+    assert len(chunks) > 1 and "".join(chunks).strip() == text
+    assert 0 < record["ttft_seconds"] < record["latency_seconds"]
+    assert record["tokens_per_second"] > 0
+    assert metrics.read_log()[-1]["ttft_seconds"] == record["ttft_seconds"]
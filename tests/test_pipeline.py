@@ -0,0 +1,128 @@
+import os
+
+import pytest
+
+import pipeline
+from pipeline import Stage, link_stages, local_modules, run_stages
+
+
+def make_stages():
+    return link_stages([
+        Stage("generator.py", "generate", outputs=["results.csv"]),
+        Stage("judge.py", "judge", inputs=["results.csv"], outputs=["best.json"]),
+        Stage("executioner.py", "execute", inputs=["best.json"], outputs=["ra.md"], updates=["results.csv"]),
+        Stage("jury.py", "review", inputs=["results.csv", "ra.md"], outputs=["report.md"]),
+    ])
+
+
+@pytest.fixture
+def runs(monkeypatch):
+    """Replaces the stage runner: records the stages run and writes their outputs."""
+    runs = {"ran": [], "fail": set(), "content": {}}
+    stages = {stage.name: stage for stage in make_stages()}
+
+    def fake_run(script, description, model, df):
+        stage = stages[os.path.splitext(script)[0]]
+        runs["ran"].append(stage.name)
+        if stage.name in runs["fail"]:
+            return False, df
+        for path in stage.outputs:
+            with open(path, "w") as f:
+                f.write(runs["content"].get(path, stage.name))
+        for path in stage.updates:
+            with open(path, "a") as f:
+                f.write("\nultimate")
+        return True, df
+
+    monkeypatch.setattr(pipeline, "run_step_inprocess", fake_run)
+    return runs
+
+
+def run(force=None):
+    return run_stages(make_stages(), "inprocess", force=force, state_path="state.json")
+
+
+def test_up_to_date_stages_are_skipped(runs):
+    assert set(run().values()) == {"ran"}
+    runs["ran"].clear()
+    assert set(run().values()) == {"skipped"}
+    assert runs["ran"] == []
+
+
+def test_changed_output_reruns_the_stage_and_what_depends_on_it(runs):
+    run()
+    runs["ran"].clear()
+    with open("best.json", "w") as f:
+        f.write("edited by hand")
+    run()
+    # The judge restores the same best.json, so nothing downstream is stale
+    assert runs["ran"] == ["judge"]
+
+    runs["ran"].clear()
+    runs["content"]["best.json"] = "a new verdict"
+    status = run(force=["judge"])
+    assert runs["ran"] == ["judge", "executioner", "jury"]
+    assert status["generator"] == "skipped"
+
+
+def test_failure_blocks_downstream_and_is_retried(runs):
+    runs["fail"].add("judge")
+    status = run()
+    assert status == {"generator": "ran", "judge": "failed", "executioner": "blocked", "jury": "blocked"}
+    runs["fail"].clear()
+    runs["ran"].clear()
+    status = run()
+    assert runs["ran"] == ["judge", "executioner", "jury"]
+    assert status["generator"] == "skipped"
+
+
+def test_force_reruns_named_stages(runs):
+    run()
+    runs["ran"].clear()
+    run(force=["jury"])
+    assert runs["ran"] == ["jury"]
+    runs["ran"].clear()
+    run(force=[])
+    assert runs["ran"] == ["generator", "judge", "executioner", "jury"]
+
+
+def test_unsatisfiable_dependencies_fail_instead_of_spinning(runs):
+    stage = Stage("judge.py", "judge")
+    stage.depends_on = ["missing"]
+    with pytest.raises(RuntimeError, match="Unsatisfiable"):
+        run_stages([stage], "inprocess", state_path="state.json")
+
+
+def test_fingerprint_covers_imported_repo_modules(tmp_path):
+    (tmp_path / "stage.py").write_text("import os\nimport helper\n")
+    (tmp_path / "helper.py").write_text("def load():\n    from deep import value\n    return value\n")
+    (tmp_path / "deep.py").write_text("value = 1\n")
+    (tmp_path / "unused.py").write_text("")
+    assert [os.path.basename(path) for path in local_modules("stage.py", str(tmp_path))] == \
+        ["deep.py", "helper.py", "stage.py"]
+
+    stage = Stage("stage.py", "test")
+    before = pipeline.stage_fingerprints(stage, str(tmp_path))
+    (tmp_path / "deep.py").write_text("value = 2\n")
+    assert pipeline.stage_fingerprints(stage, str(tmp_path)) != before
+
+
+def test_inprocess_stage_returning_no_table_fails(monkeypatch):
+    import sys
+    import types
+
+    monkeypatch.setitem(sys.modules, "dropper", types.SimpleNamespace(main=lambda argv, model, df: None))
+    monkeypatch.setitem(sys.modules, "raiser", types.SimpleNamespace(main=lambda argv, model, df: 1 / 0))
+    table = object()
+    assert pipeline.run_step_inprocess("dropper.py", "drop", None, table) == (False, table)
+    assert pipeline.run_step_inprocess("raiser.py", "raise", None, table) == (False, table)
+    assert pipeline.run_step_inprocess("dropper.py", "drop", None, None) == (True, None)
+
+
+def test_judge_of_an_unknown_run_blocks_the_stages_after_it(monkeypatch):
+    assert set(run_stages(pipeline.STAGES, "inprocess", state_path="state.json").values()) == {"ran"}
+    monkeypatch.setenv("DAPO_RUN_ID", "bogus")
+    status = run_stages(pipeline.STAGES, "inprocess", force=["judge", "executioner", "jury"],
+                        state_path="state.json")
+    assert status["judge"] == "failed"
+    assert status["executioner"] == status["jury"] == "blocked"
@@ -0,0 +1,32 @@
+import pandas as pd
+
+from prescore import prescore, select_top_k
+
+COMPLETE = ("Functional requirements, non-functional requirements, data sources, processing components "
+            "and user interactions are covered.")
+
+
+def table(texts, prompt_types=None):
+    return pd.DataFrame({"Prompt Type": prompt_types or ["cot"] * len(texts), "Response Text": texts})
+
+
+def test_coverage_and_invalid_rows():
+    scored = prescore(table([COMPLETE, "Only data sources.", "No Response", "Error: quota"]))
+    assert scored["Coverage"].tolist()[:2] == [1.0, 0.2]
+    assert scored["Invalid"].tolist() == [False, False, True, True]
+    assert scored["Pre-Score"].iloc[0] > scored["Pre-Score"].iloc[1]
+    assert scored["Pre-Score"].iloc[2] == float("-inf")
+
+
+def test_truncation_uses_the_finish_reason_when_known():
+    df = table([COMPLETE, COMPLETE + " And then"])
+    assert prescore(df)["Truncated"].tolist() == [False, True]
+    df["Finish Reason"] = ["MAX_TOKENS", "STOP"]
+    assert prescore(df)["Truncated"].tolist() == [True, False]
+
+
+def test_select_top_k_drops_duplicates_and_keeps_ultimate_rows():
+    df = table([COMPLETE, "  " + COMPLETE.upper(), "Only data sources.", "Short.", "Ultimate answer."],
+               ["cot", "cot", "few_shots", "zero_shot", "ultimate"])
+    selected = select_top_k(df, top_k=1)
+    assert selected.index.tolist() == [0, 4]
@@ -0,0 +1,44 @@
+from llm_client import estimate_tokens
+from prompt_budget import compact_json, count_tokens, fit_rows, pack_rows, truncate_text
+
+
+def row(index, words=100):
+    return {"Row": index, "Response Text": " ".join(["word"] * words)}
+
+
+def test_pack_rows_respects_budget_overhead_and_row_limit():
+    rows = [row(index) for index in range(10)]
+    size = estimate_tokens(compact_json(rows[0]))
+    chunks = pack_rows(rows, budget=3 * size + 50, overhead=50)
+    assert [len(chunk) for chunk in chunks] == [3, 3, 3, 1]
+    assert [r["Row"] for chunk in chunks for r in chunk] == list(range(10))
+    for chunk in chunks:
+        assert 50 + sum(estimate_tokens(compact_json(r)) for r in chunk) <= 3 * size + 50
+    assert [len(chunk) for chunk in pack_rows(rows, budget=10 ** 6, max_rows=4)] == [4, 4, 2]
+
+
+def test_oversized_row_gets_its_own_chunk():
+    rows = [row(0), row(1, words=5000), row(2)]
+    assert [[r["Row"] for r in chunk] for chunk in pack_rows(rows, budget=500)] == [[0], [1], [2]]
+
+
+def test_truncate_text_lists_the_cut_sections():
+    text = "Intro " * 50 + "\n## Data Sources\nfeeds\n**2. User Interactions**\nscreens"
+    cut = truncate_text(text, max_tokens=20)
+    assert cut.startswith("Intro")
+    assert len(cut) < len(text)
+    assert "further sections: Data Sources, User Interactions" in cut
+    assert truncate_text("short", max_tokens=20) == "short"
+
+
+def test_fit_rows_only_touches_long_responses():
+    rows = [row(0, words=10), row(1, words=2000)]
+    fitted = fit_rows(rows, row_budget=100)
+    assert fitted[0] == rows[0]
+    assert estimate_tokens(fitted[1]["Response Text"]) < 150
+    assert rows[1]["Response Text"].count("word") == 2000
+
+
+def test_count_tokens_prefers_the_model(mock_model):
+    assert count_tokens("abcd" * 10) == 10
+    assert count_tokens("abcd" * 10, mock_model) == mock_model.count_tokens("abcd" * 10).total_tokens
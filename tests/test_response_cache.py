@@ -0,0 +1,79 @@
+import types
+
+import response_cache
+from response_cache import ResponseCache, cache_key
+
+
+def test_key_depends_on_model_prompt_config_and_sample(mock_model):
+    key = cache_key(mock_model, "prompt", {"temperature": 0.3})
+    assert key == cache_key(mock_model, "prompt", {"temperature": 0.3})
+    assert key != cache_key(mock_model, "prompt", {"temperature": 0.5})
+    assert key != cache_key(mock_model, "other prompt", {"temperature": 0.3})
+    assert key != cache_key(mock_model, "prompt", {"temperature": 0.3}, sample=1)
+    assert key == cache_key(mock_model, "prompt", {"temperature": 0.3}, sample=0)
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path, monkeypatch):
+    ticks = iter(range(1, 100))
+    monkeypatch.setattr(response_cache, "time", types.SimpleNamespace(time=lambda: float(next(ticks))))
+    cache = ResponseCache(str(tmp_path / "responses.sqlite"), max_bytes=30)
+    cache.put("a", "model", "x" * 10)
+    cache.put("b", "model", "y" * 10)
+    cache.put("c", "model", "z" * 10)
+    # Reading "a" makes "b" the least recently used entry
+    assert cache.get("a") == "x" * 10
+    cache.put("d", "model", "w" * 10)
+    assert cache.get("b") is None
+    assert [cache.get(key) for key in "acd"] == ["x" * 10, "z" * 10, "w" * 10]
+    assert cache.stats["evictions"] == 1
+    cache.close()
+
+
+def test_entries_survive_reopening(tmp_path):
+    path = str(tmp_path / "responses.sqlite")
+    cache = ResponseCache(path)
+    cache.put("key", "model", "cached response")
+    cache.close()
+    cache = ResponseCache(path)
+    assert cache.get("key") == "cached response"
+    cache.close()
+
+
+def test_resample_only_skips_sampling_calls(monkeypatch):
+    monkeypatch.setitem(response_cache.settings, "resample", True)
+    assert not response_cache.should_read({"temperature": 0.7})
+    assert response_cache.should_read({"temperature": 0.0})
+    monkeypatch.setitem(response_cache.settings, "resample", False)
+    assert response_cache.should_read({"temperature": 0.7})
+
+
+def test_cache_hits_report_the_usage_of_the_original_call(mock_model, monkeypatch):
+    import llm_client
+
+    monkeypatch.setitem(response_cache.settings, "enabled", True)
+    monkeypatch.setattr(response_cache, "_cache", None)
+    config = {"temperature": 0.3, "max_output_tokens": 64}
+    text, first = llm_client.generate_detailed(mock_model, "Write a long requirements analysis.", config)
+    again, hit = llm_client.generate_detailed(mock_model, "Write a long requirements analysis.", config)
+    assert again == text and hit["cached"] and not first["cached"]
+    for field in ("input_tokens", "output_tokens", "finish_reason"):
+        assert hit[field] == first[field]
+    assert hit["cost_usd"] == 0.0
+    response_cache.get_cache().close()
+
+
+def test_older_caches_gain_the_usage_column(tmp_path):
+    import sqlite3
+
+    path = str(tmp_path / "responses.sqlite")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE responses (key TEXT PRIMARY KEY, model TEXT, response_text TEXT, "
+                 "size_bytes INTEGER, created_at REAL, last_access REAL)")
+    conn.execute("INSERT INTO responses VALUES ('old', 'model', 'text', 4, 0, 0)")
+    conn.commit()
+    conn.close()
+    cache = ResponseCache(path)
+    assert cache.lookup("old") == ("text", {})
+    cache.put("new", "model", "text", {"output_tokens": 5})
+    assert cache.lookup("new") == ("text", {"output_tokens": 5})
+    cache.close()
@@ -0,0 +1,44 @@
+import pandas as pd
+
+from results_store import ResultsStore, append_csv
+
+
+def rows(count, start=0, **extra):
+    return pd.DataFrame([{"Prompt Type": "cot", "Actual Prompt": "p", "Temperature": 0.3, "Max Tokens": 512,
+                          "Response Text": f"response {index}", **extra} for index in range(start, start + count)])
+
+
+def test_append_never_rewrites_the_csv(tmp_path):
+    path = tmp_path / "results.csv"
+    append_csv(path, rows(2))
+    before = path.read_bytes()
+    append_csv(path, rows(1, start=2, **{"TTFT (s)": 0.5}))
+    after = path.read_bytes()
+    assert after.startswith(before)
+    table = pd.read_csv(path)
+    assert list(table.columns) == list(rows(1).columns)
+    assert list(table["Response Text"]) == ["response 0", "response 1", "response 2"]
+
+
+def test_parquet_partitions_keep_new_columns(tmp_path):
+    store = ResultsStore(str(tmp_path / "results"))
+    store.append(rows(2))
+    store.append(rows(1, start=2, **{"TTFT (s)": 0.5}))
+    table = store.read()
+    assert len(table) == 3
+    assert table["TTFT (s)"].isna().tolist() == [True, True, False]
+
+
+def test_read_projects_columns(tmp_path):
+    store = ResultsStore(str(tmp_path / "results"))
+    store.append(rows(3))
+    table = store.read(columns=["Prompt Type", "Temperature", "Missing"])
+    assert list(table.columns) == ["Prompt Type", "Temperature", "Missing"]
+    assert table["Missing"].isna().all()
+
+
+def test_replace_drops_earlier_partitions(tmp_path):
+    store = ResultsStore(str(tmp_path / "results"))
+    store.append(rows(3))
+    store.replace(rows(1))
+    assert len(store.read()) == 1
@@ -0,0 +1,65 @@
+import pytest
+
+import generator
+from search import PROBE_SAMPLE, planned_calls, successive_halving
+
+GRID = [(prompt_type, f"{prompt_type} prompt", 0.3, max_tok)
+        for prompt_type in ("a", "b") for max_tok in (512, 768, 1024)]
+
+
+class FakeJudge:
+    def __init__(self, scores):
+        self.scores = scores
+
+    def score_rows(self, rows):
+        return [self.scores.get((row["Prompt Type"], row["Max Tokens"]), 0.0) for row in rows]
+
+
+class Recorder:
+    def __init__(self):
+        self.jobs = []
+
+    def __call__(self, jobs, on_row):
+        self.jobs.extend(jobs)
+        for prompt_type, _, temp, max_tok, sample in jobs:
+            on_row({"Prompt Type": prompt_type, "Temperature": temp, "Max Tokens": max_tok, "Sample": sample})
+        return 0
+
+
+def test_probe_round_shares_one_probe_per_prompt_and_temperature():
+    run_jobs = Recorder()
+    successive_halving(GRID, run_jobs, FakeJudge({}), eta=2, probe_tokens=256, max_rounds=1)
+    probes = [job for job in run_jobs.jobs if job[4] == PROBE_SAMPLE]
+    assert [(job[0], job[3]) for job in probes] == [("a", 256), ("b", 256)]
+
+
+def test_probe_leader_does_not_count_towards_patience():
+    # "a" wins the probe; its first cell (an arbitrary tie-break) also leads round 1
+    judge = FakeJudge({("a", 256): 9, ("b", 256): 1, ("a", 512): 8, ("a", 768): 5, ("a", 1024): 4})
+    search = successive_halving(GRID, Recorder(), judge, eta=2, probe_tokens=256, max_rounds=5, patience=2)
+    assert max(row["Round"] for row in search["history"]) == 2
+    assert search["cell"] == GRID[0]
+
+
+def test_survivors_shrink_by_eta_and_match_the_plan():
+    run_jobs = Recorder()
+    # A patience above the number of rounds never stops the search early
+    scores = {("a", 256): 9, ("b", 256): 1}
+    search = successive_halving(GRID, run_jobs, FakeJudge(scores), eta=2, probe_tokens=256, max_rounds=5, patience=9)
+    per_round = [sum(1 for row in search["history"] if row["Round"] == number) for number in range(1, 5)]
+    probes, rounds = planned_calls(GRID, eta=2, probe_tokens=256, max_rounds=5)
+    assert per_round[:len(rounds)] == rounds == [3, 2, 1]
+    assert len(run_jobs.jobs) == len(probes) + sum(rounds) == search["calls"]
+
+
+@pytest.mark.parametrize("flags", [["--samples", "3"], ["--resume"], ["--batch-prediction", "local"]])
+def test_halving_rejects_flags_it_cannot_honour(flags):
+    with pytest.raises(SystemExit):
+        generator.parse_args(["--search", "halving", *flags])
+
+
+def test_halving_dry_run_reports_the_search_bound(capsys):
+    generator.main(["--search", "halving", "--dry-run"])
+    out = capsys.readouterr().out
+    probes, rounds = planned_calls(generator.build_grid())
+    assert f"{len(probes)} probes + at most {sum(rounds)} full-length draws" in out
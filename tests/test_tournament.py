@@ -0,0 +1,61 @@
+import itertools
+
+from tournament import (BASE_RATING, ComparisonCache, PairwiseJudge, bradley_terry, plan_comparisons,
+                        response_sha, schedule)
+
+
+def rows(count):
+    return [{"Prompt Type": f"type-{index}", "Response Text": f"Requirements analysis number {index}. " * 20}
+            for index in range(count)]
+
+
+def test_bradley_terry_orders_by_results_and_keeps_unbeaten_finite():
+    players = ["a", "b", "c", "d"]
+    # a beats everyone, b beats c and d, c ties d
+    verdicts = {("a", "b"): 1, ("a", "c"): 1, ("a", "d"): 1, ("b", "c"): 1, ("b", "d"): 1, ("c", "d"): 0}
+    ratings = bradley_terry(players, verdicts)
+    assert ratings["a"] > ratings["b"] > ratings["c"]
+    assert abs(ratings["c"] - ratings["d"]) < 1e-6
+    assert ratings["a"] < float("inf")
+    assert bradley_terry(["x", "y"], {}) == {"x": BASE_RATING, "y": BASE_RATING}
+
+
+def test_schedule_gives_every_player_enough_distinct_opponents():
+    players = [f"p{index}" for index in range(9)]
+    pairs = schedule(players, {}, opponents=4)
+    assert len(pairs) == len(set(pairs))
+    assert all(first < second for first, second in pairs)
+    for player in players:
+        assert len({other for pair in pairs if player in pair for other in pair if other != player}) >= 4
+    assert len(pairs) <= len(players) * 4 // 2 + len(players)
+
+    complete = {pair: 1 for pair in itertools.combinations(sorted(players), 2)}
+    assert schedule(players, complete, opponents=4) == []
+
+
+def test_rerun_reuses_cached_verdicts_and_a_new_row_costs_k(mock_model):
+    judge = PairwiseJudge(mock_model, concurrency=2)
+    table = rows(8)
+    ranked = judge.rank(table, opponents=3)
+    assert len(ranked) == 8
+    assert [row["Rating"] for row in ranked] == sorted((row["Rating"] for row in ranked), reverse=True)
+    assert all(row["Comparisons"] >= 3 for row in ranked)
+
+    _, cached, pairs = plan_comparisons(table, judge.model_name, 3, judge.cache)
+    assert cached and pairs == []
+
+    extra = table + [{"Prompt Type": "ultimate", "Response Text": "The ultimate analysis. " * 20}]
+    _, _, pairs = plan_comparisons(extra, judge.model_name, 3, judge.cache)
+    newcomer = response_sha(extra[-1]["Response Text"])
+    assert len(pairs) == 3 and all(newcomer in pair for pair in pairs)
+
+
+def test_identical_responses_share_a_player(mock_model):
+    table = rows(3) + [dict(rows(1)[0], **{"Prompt Type": "copy"})]
+    texts, _, _ = plan_comparisons(table, "m", 2)
+    assert len(texts) == 3
+    cache = ComparisonCache()
+    ranked = PairwiseJudge(mock_model, cache=cache).rank(table, opponents=2)
+    by_type = {row["Prompt Type"]: row["Rating"] for row in ranked}
+    assert by_type["copy"] == by_type["type-0"]
+    cache.close()
@@ -0,0 +1,280 @@
+#!/usr/bin/env python3
+"""
+tournament.py
+-------------
+Pairwise tournament judging (judge.py --judge-mode tournament, jury.py
+--tournament).
+
+Instead of asking one call to pick the best of many rows, the judge compares
+two responses at a time:
+
+  - Verdicts are cached in SQLite (artifacts/.cache/comparisons.sqlite) by the
+    content hashes of the two responses, so a rerun, or a table that only
+    gained rows, pays only for comparisons it has not seen before. The pair is
+    always shown in hash order, so a cached verdict never depends on the row
+    order.
+  - Every row needs `opponents` (k) verdicts against the other rows. Rows that
+    have fewer are scheduled against opponents spread over the current
+    ranking, and the matchups run concurrently. A table of n fresh rows costs
+    about n*k/2 comparisons; one new row (e.g. 'ultimate') costs k.
+  - The ranking is a Bradley-Terry fit over every cached verdict among the
+    rows (ties count half), reported on the Elo scale (1500 = an average row).
+"""
+
+import os
+import re
+import json
+import math
+import time
+import sqlite3
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from llm_client import generate, estimate_tokens, LLMCallError
+
+DEFAULT_OPPONENTS = 4
+DEFAULT_TOURNAMENT_CONCURRENCY = 4
+DEFAULT_COMPARISON_CACHE_PATH = os.getenv("DAPO_COMPARISON_CACHE_PATH",
+                                          os.path.join("artifacts", ".cache", "comparisons.sqlite"))
+
+COMPARISON_CONFIG = {"temperature": 0.0, "max_output_tokens": 256}
+
+# Bradley-Terry strength 1.0 is shown as BASE_RATING; a factor of 10 in strength is 400 points
+BASE_RATING = 1500
+BT_ITERATIONS = 200
+# Virtual games (half won) against an average row, so unbeaten rows get a finite rating
+BT_PRIOR_GAMES = 1.0
+
+RANKING_COLUMNS = ["Rating", "Wins", "Losses", "Ties", "Comparisons"]
+
+
+def response_sha(text):
+    return hashlib.sha256(str(text).encode("utf-8")).hexdigest()
+
+
+def build_comparison_prompt(first, second):
+    return f"""You are an AI judge comparing two Requirements Analysis documents for a stock recommendation system (financial ratios + MD&A sentiment from 10-K filings). Decide which one has the better structure, completeness (functional and non-functional requirements, data sources, processing components, user interactions) and clarity. Ignore which one is shown first.
+
+RESPONSE 1:
+{first}
+
+RESPONSE 2:
+{second}
+
+Please return ONLY a JSON object with exactly two keys: "winner" (1 or 2, or 0 for a tie) and "reasoning". Do not include any additional text or formatting."""
+
+
+class ComparisonCache:
+    """
+    SQLite-backed verdicts keyed by (model, first response hash, second response
+    hash), first < second. Safe to share between threads of one process.
+    """
+
+    def __init__(self, path=DEFAULT_COMPARISON_CACHE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS comparisons (
+                   model TEXT,
+                   first_sha TEXT,
+                   second_sha TEXT,
+                   winner INTEGER,
+                   reasoning TEXT,
+                   created_at REAL,
+                   PRIMARY KEY (model, first_sha, second_sha)
+               )"""
+        )
+        self._conn.commit()
+
+    def put(self, model_name, first_sha, second_sha, winner, reasoning):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO comparisons VALUES (?, ?, ?, ?, ?, ?)",
+                (model_name, first_sha, second_sha, winner, reasoning, time.time()),
+            )
+            self._conn.commit()
+
+    def verdicts(self, model_name, shas):
+        """
+        Returns {(first_sha, second_sha): winner} for every cached pair among `shas`.
+        """
+        shas = list(shas)
+        found = {}
+        with self._lock:
+            # Look up per row, so the query stays within SQLite's parameter limit
+            for sha in shas:
+                for first, second, winner in self._conn.execute(
+                        "SELECT first_sha, second_sha, winner FROM comparisons WHERE model = ? AND first_sha = ?",
+                        (model_name, sha)):
+                    found[(first, second)] = winner
+        members = set(shas)
+        return {pair: winner for pair, winner in found.items() if pair[1] in members}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def bradley_terry(players, verdicts, iterations=BT_ITERATIONS, prior_games=BT_PRIOR_GAMES):
+    """
+    Fits Bradley-Terry strengths (minorization-maximization) to verdicts
+    {(a, b): 1 | 2 | 0} and returns {player: Elo-scale rating}.
+    """
+    wins = {player: prior_games / 2 for player in players}
+    games = {player: {} for player in players}
+    for (a, b), winner in verdicts.items():
+        wins[a] += 1.0 if winner == 1 else 0.5 if winner == 0 else 0.0
+        wins[b] += 1.0 if winner == 2 else 0.5 if winner == 0 else 0.0
+        games[a][b] = games[a].get(b, 0) + 1
+        games[b][a] = games[b].get(a, 0) + 1
+
+    strength = {player: 1.0 for player in players}
+    for _ in range(iterations):
+        updated = {
+            player: wins[player] / (prior_games / (strength[player] + 1.0)
+                                    + sum(count / (strength[player] + strength[other])
+                                          for other, count in games[player].items()))
+            for player in players
+        }
+        converged = max((abs(updated[p] - strength[p]) for p in players), default=0.0) < 1e-9
+        strength = updated
+        if converged:
+            break
+    return {player: BASE_RATING + 400 * math.log10(strength[player]) for player in players}
+
+
+def schedule(players, verdicts, opponents=DEFAULT_OPPONENTS):
+    """
+    Returns the new pairs (first_sha, second_sha) needed so every player has at
+    least `opponents` verdicts among `players`. A player short of verdicts meets
+    opponents spread evenly over the current ranking, preferring opponents that
+    are short of verdicts too.
+    """
+    opponents = min(opponents, len(players) - 1)
+    met = {player: set() for player in players}
+    for a, b in verdicts:
+        met[a].add(b)
+        met[b].add(a)
+    ratings = bradley_terry(players, verdicts)
+    ranked = sorted(players, key=lambda player: -ratings[player])
+    pairs = []
+    for player in players:
+        missing = opponents - len(met[player])
+        if missing <= 0:
+            continue
+        candidates = [other for other in ranked if other != player and other not in met[player]]
+        needy = [other for other in candidates if len(met[other]) < opponents]
+        chosen = _spread(needy, missing)
+        chosen += _spread([other for other in candidates if other not in chosen], missing - len(chosen))
+        for other in chosen:
+            met[player].add(other)
+            met[other].add(player)
+            pairs.append(tuple(sorted((player, other))))
+    return pairs
+
+
+def _spread(items, count):
+    """
+    Up to `count` items picked at even intervals.
+    """
+    count = min(count, len(items))
+    return [items[int(index * len(items) / count)] for index in range(count)] if count > 0 else []
+
+
+def plan_comparisons(rows, model_name, opponents=DEFAULT_OPPONENTS, cache=None, field="Response Text"):
+    """
+    Returns ({response hash: text}, cached verdicts, new pairs) for a tournament
+    over `rows`. Without a `cache` no verdict counts as known.
+    """
+    texts = {}
+    for row in rows:
+        texts.setdefault(response_sha(row[field]), str(row[field]))
+    verdicts = cache.verdicts(model_name, list(texts)) if cache is not None else {}
+    pairs = schedule(list(texts), verdicts, opponents) if len(texts) > 1 else []
+    return texts, verdicts, pairs
+
+
+def preview(rows, model_name, opponents=DEFAULT_OPPONENTS, path=DEFAULT_COMPARISON_CACHE_PATH):
+    """
+    Dry-run counterpart of PairwiseJudge.rank: prints the comparisons a
+    tournament over `rows` still needs, reading but never creating the verdict
+    cache. Returns (new comparisons, their estimated input tokens).
+    """
+    cache = ComparisonCache(path) if os.path.isfile(path) else None
+    try:
+        texts, verdicts, pairs = plan_comparisons(rows, model_name, opponents, cache)
+    finally:
+        if cache is not None:
+            cache.close()
+    tokens = sum(estimate_tokens(build_comparison_prompt(texts[first], texts[second])) for first, second in pairs)
+    print(f"🧪 Tournament: {len(rows)} rows ({len(texts)} distinct responses), {len(verdicts)} cached verdicts, "
+          f"{len(pairs)} new comparisons (~{tokens:,} input tokens)")
+    return len(pairs), tokens
+
+
+class PairwiseJudge:
+    """
+    Compares two responses at a time with `model` and caches every verdict.
+    """
+
+    def __init__(self, model, cache=None, concurrency=DEFAULT_TOURNAMENT_CONCURRENCY):
+        self.model = model
+        self.model_name = getattr(model, "model_name", type(model).__name__)
+        self.cache = cache or ComparisonCache()
+        self.concurrency = concurrency
+
+    def compare(self, pair, texts):
+        first, second = pair
+        try:
+            reply = generate(self.model, build_comparison_prompt(texts[first], texts[second]),
+                             generation_config=COMPARISON_CONFIG)
+            match = re.search(r"{.*}", reply, re.DOTALL)
+            verdict = json.loads(match.group())
+            winner = int(verdict["winner"])
+            if winner not in (0, 1, 2):
+                raise ValueError(f"winner {winner}")
+        except (LLMCallError, AttributeError, KeyError, TypeError, ValueError) as e:
+            print(f"⚠️ WARNING: Pairwise comparison failed ({e}); it will be retried on the next run.")
+            return None
+        self.cache.put(self.model_name, first, second, winner, str(verdict.get("reasoning", "")))
+        return winner
+
+    def rank(self, rows, opponents=DEFAULT_OPPONENTS, field="Response Text"):
+        """
+        Returns copies of `rows` with the RANKING_COLUMNS added, best first.
+        Rows with identical responses share one player.
+        """
+        texts, verdicts, pairs = plan_comparisons(rows, self.model_name, opponents, self.cache, field)
+        players = list(texts)
+        cached = len(verdicts)
+
+        with ThreadPoolExecutor(max_workers=max(1, self.concurrency)) as pool:
+            results = list(pool.map(lambda pair: self.compare(pair, texts), pairs))
+        verdicts.update({pair: winner for pair, winner in zip(pairs, results) if winner is not None})
+        failed = sum(winner is None for winner in results)
+        print(f"🏆 Tournament: {len(rows)} rows ({len(players)} distinct responses), "
+              f"{cached} cached verdicts, {len(pairs) - failed} new comparisons"
+              + (f", {failed} failed" if failed else ""))
+
+        ratings = bradley_terry(players, verdicts)
+        record = {player: {"Wins": 0, "Losses": 0, "Ties": 0} for player in players}
+        for (a, b), winner in verdicts.items():
+            if winner == 0:
+                record[a]["Ties"] += 1
+                record[b]["Ties"] += 1
+            else:
+                record[a if winner == 1 else b]["Wins"] += 1
+                record[b if winner == 1 else a]["Losses"] += 1
+
+        ranked = []
+        for row in rows:
+            player = response_sha(row[field])
+            stats = record[player]
+            ranked.append(dict(row, Rating=round(ratings[player], 1), **stats,
+                               Comparisons=stats["Wins"] + stats["Losses"] + stats["Ties"]))
+        return sorted(ranked, key=lambda row: -row["Rating"])